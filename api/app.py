@@ -1,11 +1,73 @@
+import asyncio
+import json
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+import time
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from .database import initialize_database, get_db, UserTrajectory
-from .schemas import PredictRequest, PredictResponse
+from .database import (
+    initialize_database,
+    load_initial_data,
+    get_db,
+    AsyncSessionLocal,
+    UserTrajectory,
+    trajectory_window_bounds,
+    prefetch_user_trajectory_windows,
+    trajectory_cache,
+    engine,
+)
+from .schemas import (
+    PredictRequest,
+    PredictResponse,
+    BatchPredictItem,
+    BatchPredictResponse,
+    IngestResponse,
+    ReadinessResponse,
+)
+from .ingest import TrajectoryWriteBuffer, IngestBufferFull, parse_json_rows, parse_ndjson_rows
 from .services import NetworkAgentManager
-from .config import get_gemini_api_key
+from .precompute import PrecomputeScheduler, PrecomputedPredictions
+from .compaction import TrajectoryCompactor
+from .user_model import UserModelStore
+from .cache import PredictionCache
+from .metrics import METRIC_PREFIX, render_prometheus
+from .config import (
+    get_gemini_api_key,
+    get_periodicity_confidence_threshold,
+    get_max_agents,
+    get_prediction_cache_max_entries,
+    get_prediction_cache_ttl,
+    get_prediction_cache_timestamp_bucket,
+    get_prediction_cache_load_bins,
+    get_batch_predict_concurrency,
+    get_trajectory_encoding,
+    get_llm_backend,
+    get_predict_deadline,
+    get_llm_hedge_delay,
+    get_fallback_load_margin,
+    get_precompute_enabled,
+    get_precompute_horizon,
+    get_precompute_workers,
+    get_precompute_load_tolerance,
+    get_precompute_max_entries,
+    get_precompute_ttl,
+    get_precompute_idle_after,
+    get_ingest_buffer_max_rows,
+    get_ingest_flush_rows,
+    get_ingest_flush_interval,
+    get_ingest_backpressure_timeout,
+    get_compaction_enabled,
+    get_compaction_interval,
+    get_compaction_after,
+    get_trajectory_retention,
+    get_segment_retention,
+    get_user_models_enabled,
+    get_user_model_max_entries,
+    get_user_model_flush_interval,
+    get_background_data_load,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,14 +77,164 @@ logging.basicConfig(
 )
 
 app = FastAPI()
-network_agent_manager = NetworkAgentManager(api_key=get_gemini_api_key())
 
-# Initialize database on startup
+# Learned per-user models, loaded from and written back to user_contexts
+user_model_store = UserModelStore(
+    AsyncSessionLocal,
+    max_users=get_user_model_max_entries(),
+    flush_interval=get_user_model_flush_interval(),
+) if get_user_models_enabled() else None
+
+network_agent_manager = NetworkAgentManager(
+    api_key=get_gemini_api_key(),
+    confidence_threshold=get_periodicity_confidence_threshold(),
+    max_agents=get_max_agents(),
+    prediction_cache=PredictionCache(
+        max_entries=get_prediction_cache_max_entries(),
+        ttl=get_prediction_cache_ttl(),
+        timestamp_bucket=get_prediction_cache_timestamp_bucket(),
+        load_bins=get_prediction_cache_load_bins(),
+    ),
+    trajectory_encoding=get_trajectory_encoding(),
+    llm_backend=get_llm_backend(),
+    predict_deadline=get_predict_deadline(),
+    llm_hedge_delay=get_llm_hedge_delay(),
+    fallback_load_margin=get_fallback_load_margin(),
+    user_models=user_model_store,
+)
+
+precompute_scheduler = PrecomputeScheduler(
+    network_agent_manager,
+    AsyncSessionLocal,
+    PrecomputedPredictions(
+        max_entries=get_precompute_max_entries(),
+        ttl=get_precompute_ttl(),
+        timestamp_bucket=get_prediction_cache_timestamp_bucket(),
+        load_tolerance=get_precompute_load_tolerance(),
+    ),
+    horizon=get_precompute_horizon(),
+    workers=get_precompute_workers(),
+    idle_after=get_precompute_idle_after(),
+)
+if get_precompute_enabled():
+    network_agent_manager.precompute = precompute_scheduler
+
+trajectory_write_buffer = TrajectoryWriteBuffer(
+    AsyncSessionLocal,
+    max_rows=get_ingest_buffer_max_rows(),
+    flush_rows=get_ingest_flush_rows(),
+    flush_interval=get_ingest_flush_interval(),
+)
+
+trajectory_compactor = TrajectoryCompactor(
+    engine.url.database,
+    interval=get_compaction_interval(),
+    compact_after=get_compaction_after(),
+    retention=get_trajectory_retention(),
+    segment_retention=get_segment_retention(),
+)
+
+
+class DataLoadStatus:
+    """Progress of the trajectory data load, reported by GET /ready."""
+
+    def __init__(self):
+        self.status = "loading"
+        self.rows_loaded = 0
+        self.progress: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def report(self, rows: int, bytes_read: int, bytes_total: int) -> None:
+        # Called from the loader thread
+        self.rows_loaded = rows
+        self.progress = bytes_read / max(1, bytes_total)
+
+    def response(self) -> ReadinessResponse:
+        return ReadinessResponse(
+            status=self.status,
+            rows_loaded=self.rows_loaded,
+            progress=self.progress if self.status == "loading" else None,
+            seconds=self.seconds,
+            error=self.error,
+        )
+
+data_load = DataLoadStatus()
+data_load_task: Optional[asyncio.Task] = None
+llm_warm_up_task: Optional[asyncio.Task] = None
+
+async def load_data(serving: bool = False):
+    """Load the trajectory data, then start the jobs that work on the whole table."""
+    started = time.perf_counter()
+    try:
+        await load_initial_data(progress=data_load.report, serving=serving)
+    except Exception as e:
+        data_load.status = "failed"
+        data_load.error = str(e)
+        raise
+    finally:
+        data_load.seconds = round(time.perf_counter() - started, 3)
+    data_load.status = "ready"
+    logger.info(f"Data load complete in {data_load.seconds}s")
+    if network_agent_manager.precompute is not None:
+        await precompute_scheduler.start()
+    if get_compaction_enabled():
+        await trajectory_compactor.start()
+
+async def warm_up_llm():
+    """Import the LLM stack in a thread after startup instead of on the first prediction."""
+    try:
+        await asyncio.to_thread(network_agent_manager.warm_up)
+    except Exception:
+        logger.warning("Could not build the LLM client ahead of the first prediction", exc_info=True)
+
+async def _load_data_in_background():
+    try:
+        await load_data(serving=True)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.error("Data load failed, GET /ready reports it", exc_info=True)
+
+# Initialize database on startup; the data is loaded in the background unless
+# BACKGROUND_DATA_LOAD=false, so the server accepts requests right away
 @app.on_event("startup")
 async def startup():
+    global data_load_task, llm_warm_up_task
     logger.info("Initializing database...")
-    await initialize_database()
+    await initialize_database(load_data=False)
     logger.info("Database initialization complete")
+    await trajectory_write_buffer.start()
+    if user_model_store is not None:
+        await user_model_store.start()
+    llm_warm_up_task = asyncio.create_task(warm_up_llm())
+    if get_background_data_load():
+        data_load_task = asyncio.create_task(_load_data_in_background())
+    else:
+        await load_data()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if data_load_task is not None and not data_load_task.done():
+        # An interrupted CSV load resumes from its checkpoint on the next start
+        data_load_task.cancel()
+    await precompute_scheduler.stop()
+    await trajectory_compactor.stop()
+    logger.info("Flushing buffered trajectory rows...")
+    await trajectory_write_buffer.stop()
+    if user_model_store is not None:
+        await user_model_store.stop()
+
+@app.get("/ready", response_model=ReadinessResponse)
+async def ready(response: Response):
+    """
+    Readiness endpoint: 200 once the trajectory data is loaded, 503 while it loads
+    (with its progress) or when the load failed.
+    """
+    status = data_load.response()
+    if status.status != "ready":
+        response.status_code = 503
+    return status
 
 @app.post("/predict", response_model=PredictResponse)
 async def predict(request: PredictRequest, db: AsyncSession = Depends(get_db)):
@@ -44,9 +256,111 @@ async def predict(request: PredictRequest, db: AsyncSession = Depends(get_db)):
             db=db
         )
         
-        logger.info(f"Prediction complete for user_id: {request.user_id}. Optimal tower: {result['optimal_handover_tower']}")
+        logger.info(f"Prediction complete for user_id: {request.user_id}. Optimal tower: {result['optimal_handover_tower']} (source: {result['source']})")
         return PredictResponse(**result)
         
     except Exception as e:
         logger.error(f"Error processing prediction request for user_id: {request.user_id}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/predict/batch", response_model=BatchPredictResponse)
+async def predict_batch(requests: List[PredictRequest], db: AsyncSession = Depends(get_db)):
+    """
+    Endpoint to predict the best cell towers for many users in one call.
+    Results come back in request order; a failing item carries an error instead of
+    failing the whole batch.
+    """
+    logger.info(f"Received batch prediction request for {len(requests)} users")
+
+    # Warm the trajectory cache for every user with grouped queries
+    try:
+        await prefetch_user_trajectory_windows(
+            [(request.user_id, *trajectory_window_bounds(request.timestamp)) for request in requests],
+            db,
+        )
+    except Exception:
+        logger.error("Error prefetching trajectories for batch prediction", exc_info=True)
+    # And their learned models, in one query
+    if user_model_store is not None:
+        try:
+            await user_model_store.load_many([request.user_id for request in requests], db)
+        except Exception:
+            logger.error("Error loading user models for batch prediction", exc_info=True)
+    # Every item queries through its own session, release this one's connection meanwhile
+    await db.close()
+
+    semaphore = asyncio.Semaphore(get_batch_predict_concurrency())
+
+    async def predict_item(request: PredictRequest) -> BatchPredictItem:
+        async with semaphore:
+            try:
+                user_agent = network_agent_manager.get_agent(request.user_id)
+                # Concurrent items cannot share a session
+                async with AsyncSessionLocal() as item_db:
+                    result = await user_agent.predict_best_cell_towers(
+                        user_id=request.user_id,
+                        cell_tower_loads=request.cell_tower_loads,
+                        timestamp=request.timestamp,
+                        current_cell_tower=request.current_cell_tower,
+                        db=item_db
+                    )
+                return BatchPredictItem(user_id=request.user_id, result=PredictResponse(**result))
+            except Exception as e:
+                logger.error(f"Error processing batch prediction item for user_id: {request.user_id}", exc_info=True)
+                return BatchPredictItem(user_id=request.user_id, error=str(e))
+
+    results = await asyncio.gather(*(predict_item(request) for request in requests))
+    logger.info(f"Batch prediction complete: {sum(item.error is None for item in results)}/{len(results)} succeeded")
+    return BatchPredictResponse(results=results)
+
+@app.post("/trajectory", response_model=IngestResponse, status_code=202)
+async def ingest_trajectory(request: Request):
+    """
+    Endpoint to ingest trajectory rows (time, cell1, distance1 ... cell5, distance5).
+
+    Accepts JSON, either {"user_id": ..., "rows": [...]} or a list of such objects, or
+    newline-delimited JSON (Content-Type: application/x-ndjson) with one row object per
+    line carrying its own user_id. Rows are buffered and written in batches; when the
+    buffer stays full the request is rejected with 503 and should be retried.
+    """
+    body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            rows = parse_ndjson_rows(body.splitlines())
+        else:
+            rows = parse_json_rows(json.loads(body))
+    except (ValueError, TypeError, OverflowError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        await trajectory_write_buffer.add(rows, timeout=get_ingest_backpressure_timeout())
+    except IngestBufferFull as e:
+        logger.warning(f"Rejected {len(rows)} trajectory rows: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return IngestResponse(accepted=len(rows))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Endpoint exposing prediction stage latencies, prediction and LLM token counters,
+    and cache, agent pool and ingestion gauges in the Prometheus text format.
+    """
+    sections = {
+        "trajectory_cache": trajectory_cache.stats(),
+        "prediction_cache": network_agent_manager.prediction_cache.stats(),
+        "prediction_coalescing": network_agent_manager.in_flight_predictions.stats(),
+        "agent_pool": network_agent_manager.stats(),
+        "ingest": trajectory_write_buffer.stats(),
+        "precompute": precompute_scheduler.stats(),
+        "compaction": trajectory_compactor.stats(),
+        **({"user_models": user_model_store.stats()} if user_model_store is not None else {}),
+    }
+    gauges = [
+        (f"{METRIC_PREFIX}{section}_{name}", f"{name.replace('_', ' ').capitalize()} ({section.replace('_', ' ')}).", value)
+        for section, stats in sections.items()
+        for name, value in stats.items()
+    ]
+    return PlainTextResponse(render_prometheus(gauges), media_type="text/plain; version=0.0.4")
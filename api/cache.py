@@ -0,0 +1,286 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache with optional time-to-live.
+
+    Every entry has a size given by `sizeof` (1 per entry by default), and the least
+    recently used entries are evicted once the total size goes above `max_size`.
+    Entries older than `ttl` seconds are dropped when they are next looked up.
+    `on_evict(key, value)` is called for every entry evicted or expired.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 1)
+        self.on_evict = on_evict
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (value, stored_at, size)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for `key`, counting a hit or a miss.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        """
+        Store `value` under `key` and evict least recently used entries to stay in budget.
+        `age` is how many seconds old the value already is, it expires that much sooner.
+        """
+        self._remove(key)
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        self._entries[key] = (value, time.monotonic() - age, size)
+        self.size += size
+        while self.size > self.max_size:
+            evicted_key, (evicted, _, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drop the entry for `key`, if any.
+        """
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def expire(self) -> int:
+        """
+        Drop every entry older than the TTL, rather than waiting for it to be looked up.
+        Returns the number of entries dropped.
+        """
+        if self.ttl is None:
+            return 0
+        now = time.monotonic()
+        expired = [key for key, (_, stored_at, _) in self._entries.items() if now - stored_at > self.ttl]
+        for key in expired:
+            self._lookup(key)
+        return len(expired)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def _lookup(self, key: Hashable) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+            self._remove(key)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(key, entry[0])
+            return None
+        return entry
+
+
+class TrajectoryWindowCache(LRUCache):
+    """
+    Per-user cache of trajectory arrays, bounded in bytes.
+
+    Each user has one entry holding the rows of an inclusive time range
+    [start, end], sorted by time. Any window inside that range is answered by
+    slicing the cached array, so consecutive requests for an active user do not
+    touch the database.
+
+    Every invalidation of a user bumps its generation. Readers take the generation
+    before reading the database and pass it to `put_window`, which drops the rows
+    if the user was invalidated meanwhile, so a read racing an ingest cannot cache
+    rows older than the ingest.
+    """
+
+    # Rough per-entry bookkeeping overhead on top of the array itself
+    ENTRY_OVERHEAD_BYTES = 256
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None):
+        super().__init__(
+            max_size=max_bytes,
+            ttl=ttl,
+            sizeof=lambda entry: entry[2].nbytes + self.ENTRY_OVERHEAD_BYTES,
+        )
+        self.stale_puts = 0
+        # Bumped by clear(), resets the per-user generations
+        self._epoch = 0
+        self._generations: Dict[str, int] = {}
+
+    def generation(self, user_id: str) -> tuple:
+        """Token of the user's invalidations so far, to pass to `put_window`."""
+        return self._epoch, self._generations.get(user_id, 0)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._generations[key] = self._generations.get(key, 0) + 1
+        super().invalidate(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._generations.clear()
+        super().clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {**super().stats(), "stale_puts": self.stale_puts}
+
+    def get_window(self, user_id: str, start: int, end: int) -> Optional[np.ndarray]:
+        """
+        Return the user's rows with start <= time <= end, or None if the cached
+        range does not cover the window.
+        """
+        entry = self._lookup(user_id)
+        if entry is None or not (entry[0][0] <= start and end <= entry[0][1]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        _, _, data = entry[0]
+        times = data[:, 0]
+        return data[np.searchsorted(times, start, side="left"):np.searchsorted(times, end, side="right")]
+
+    def covers(self, user_id: str, start: int, end: int) -> bool:
+        """
+        Whether the cached range of the user covers [start, end], without counting a lookup.
+        """
+        entry = self._lookup(user_id)
+        return entry is not None and entry[0][0] <= start and end <= entry[0][1]
+
+    def put_window(self, user_id: str, start: int, end: int, data: np.ndarray, generation: tuple) -> None:
+        """
+        Cache all of the user's rows in the inclusive range [start, end], read from
+        the database after `generation(user_id)` returned `generation`. Nothing is
+        cached if the user was invalidated since.
+        """
+        if generation != self.generation(user_id):
+            self.stale_puts += 1
+            return
+        self.put(user_id, (start, end, data))
+
+
+class PredictionCache(LRUCache):
+    """
+    Cache of prediction results keyed on a quantized view of the request.
+
+    Requests of the same user on the same serving cell, with timestamps in the same
+    bucket and tower loads falling into the same bins, share one cached result.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: Optional[float] = None,
+        timestamp_bucket: int = 10,
+        load_bins: int = 10,
+    ):
+        super().__init__(max_size=max_entries, ttl=ttl)
+        self.timestamp_bucket = max(1, timestamp_bucket)
+        self.load_bins = max(1, load_bins)
+
+    def make_key(self, user_id: str, current_cell_tower, timestamp: int, loads: Dict[str, float]) -> tuple:
+        """
+        Build the cache key of a request.
+
+        Args:
+            user_id: User identifier
+            current_cell_tower: Serving cell of the user
+            timestamp: Request timestamp in seconds
+            loads: Tower loads normalized to 0..1
+        """
+        quantized = tuple(sorted(
+            (str(tower), min(self.load_bins - 1, int(load * self.load_bins)))
+            for tower, load in loads.items()
+        ))
+        return (user_id, str(current_cell_tower), timestamp // self.timestamp_bucket, quantized)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key into one in-flight call.
+
+    The first caller of a key starts the call in its own task; callers arriving
+    while it is still running await the same task and get its result (or
+    exception) instead of starting their own. Any caller may give up (e.g. a client
+    disconnecting) without cancelling the call for the others.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `call()` unless a call for `key` is already in flight, in which case
+        wait for that one.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so a caller giving up does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Retrieved here so an exception nobody waited on is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / total if total else 0.0,
+        }
@@ -0,0 +1,521 @@
+"""
+Retention and compaction of trajectory history.
+
+`user_trajectory` grows by one row per second per user. A compaction pass walks the
+users and, for each one:
+
+    - collapses the rows more than `compact_after` seconds behind the user's latest
+      row into serving-cell segments (enter time, exit time, cell1, minimum distance,
+      number of rows), cut at every change of cell1, gap of more than
+      SEGMENT_MAX_GAP seconds and hour boundary
+    - adds them to hourly rollups (rows and minimum distance per serving cell and
+      hour), which serve the reads of times past the segment retention
+    - drops the raw rows more than `retention` seconds behind the latest one, once
+      compacted, and the segments more than `segment_retention` seconds behind it
+
+Trajectory reads of times before a user's retention horizon are rebuilt from the
+segments by api/database.py, and from the hourly rollups before the segment
+retention horizon, so callers do not see the difference beyond cell2..cell5 being
+missing there (and, from the rollups, the order of the cells within an hour).
+Progress is recorded per user in `trajectory_compaction` and every chunk of
+compacted rows is committed with it, so an interrupted pass resumes where it
+stopped. Rows arriving late, behind a range already compacted, are merged into the
+segments of their hour at the start of the next pass, before any retention delete;
+rows of times already compacted are dropped rather than counted twice.
+
+A running app only loads the compaction horizons at startup: after a pass of the
+CLI below, restart it, or it keeps reading the dropped times from the raw rows and
+segments. Set COMPACTION_ENABLED=true to have the app run the passes itself instead.
+
+Sample usage (from the repository root), one pass:
+    python -m api.compaction --db user_trajectory.db --compact-after 86400 --retention 604800
+
+Arguments:
+    --db: SQLite database file (default: the one of DATABASE_URL).
+    --compact-after: Seconds behind a user's latest row after which rows are compacted
+                     (default: COMPACTION_AFTER_SECONDS).
+    --retention: Seconds behind a user's latest row after which raw rows are dropped
+                 (default: TRAJECTORY_RETENTION_SECONDS).
+    --segment-retention: Seconds behind a user's latest row after which segments are
+                         dropped (default: SEGMENT_RETENTION_SECONDS).
+"""
+
+import argparse
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .config import get_compaction_after, get_segment_retention, get_trajectory_retention
+from .database import (
+    CELL_COLUMNS,
+    DISTANCE_COLUMNS,
+    SEGMENT_MAX_SECONDS,
+    Base,
+    engine,
+    segments_to_trajectory,
+    set_raw_horizon,
+    set_segment_horizon,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds without rows that end a segment
+SEGMENT_MAX_GAP = 60
+# Bucket length of the rollups: hourly, the span of a segment
+ROLLUP_RESOLUTION = SEGMENT_MAX_SECONDS
+# Trajectory seconds of one user compacted per transaction
+COMPACTION_CHUNK_SECONDS = 86400
+# Raw rows (or segments) deleted per transaction
+DELETE_BATCH_ROWS = 100_000
+
+_SEGMENT_INSERT_SQL = (
+    "INSERT INTO trajectory_segment (user_id, enter_time, exit_time, cell, min_distance, samples)"
+    " VALUES (?, ?, ?, ?, ?, ?)"
+)
+_ROLLUP_UPSERT_SQL = (
+    "INSERT INTO trajectory_rollup (user_id, resolution, bucket, cell, samples, min_distance)"
+    " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id, resolution, bucket, cell) DO UPDATE SET"
+    " samples = samples + excluded.samples, min_distance = MIN(min_distance, excluded.min_distance)"
+)
+_WATERMARK_UPSERT_SQL = (
+    "INSERT INTO trajectory_compaction (user_id, {column}) VALUES (?, ?)"
+    " ON CONFLICT (user_id) DO UPDATE SET {column} = excluded.{column}"
+)
+_COMPACTED_UNTIL_UPSERT_SQL = (
+    "INSERT INTO trajectory_compaction (user_id, compacted_until, compacted_id) VALUES (?, ?, ?)"
+    " ON CONFLICT (user_id) DO UPDATE SET compacted_until = excluded.compacted_until,"
+    " compacted_id = COALESCE(compacted_id, excluded.compacted_id)"
+)
+# Rows inserted since the last pass behind the compacted range of their user, walked
+# by id from the oldest compacted_id
+_LATE_ROWS_SQL = (
+    "SELECT t.user_id, t.time, t.cell1, t.distance1 FROM user_trajectory t"
+    " JOIN trajectory_compaction c ON c.user_id = t.user_id"
+    " WHERE t.id > ? AND t.id <= ? AND t.id > c.compacted_id AND t.time < c.compacted_until"
+    " ORDER BY t.user_id, t.time"
+)
+_HOUR_SEGMENTS_SQL = (
+    "SELECT id, enter_time, exit_time, cell, min_distance, samples FROM trajectory_segment"
+    " WHERE user_id = ? AND enter_time >= ? AND enter_time < ?"
+)
+
+
+def open_connection(db_path: str) -> sqlite3.Connection:
+    """Connection for a compaction pass, handed between worker threads one at a time."""
+    connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+
+def iter_user_latest_times(connection: sqlite3.Connection) -> Iterator[Tuple[str, int]]:
+    """
+    Every user with trajectory rows and their latest time, skipping from user to
+    user on the (user_id, time) index rather than scanning the table.
+    """
+    user_id = connection.execute("SELECT MIN(user_id) FROM user_trajectory").fetchone()[0]
+    while user_id is not None:
+        latest = connection.execute("SELECT MAX(time) FROM user_trajectory WHERE user_id = ?", (user_id,)).fetchone()[0]
+        yield user_id, latest
+        user_id = connection.execute(
+            "SELECT MIN(user_id) FROM user_trajectory WHERE user_id > ?", (user_id,)
+        ).fetchone()[0]
+
+
+def read_watermarks(connection: sqlite3.Connection) -> Dict[str, Tuple[Optional[int], Optional[int], Optional[int]]]:
+    """(compacted_until, retained_from, segments_from) of every user compacted so far."""
+    rows = connection.execute(
+        "SELECT user_id, compacted_until, retained_from, segments_from FROM trajectory_compaction"
+    )
+    return {user_id: tuple(watermarks) for user_id, *watermarks in rows}
+
+
+def max_row_id(connection: sqlite3.Connection) -> int:
+    """Id of the latest trajectory row; rows inserted afterwards get larger ids."""
+    return connection.execute("SELECT COALESCE(MAX(id), 0) FROM user_trajectory").fetchone()[0]
+
+
+def build_segments(rows: np.ndarray) -> np.ndarray:
+    """
+    Serving-cell segments of (time, cell1, distance1) rows sorted by time.
+
+    Returns:
+        np.ndarray: int64 (enter_time, exit_time, cell, min_distance, samples) rows.
+    """
+    if len(rows) == 0:
+        return np.empty((0, 5), dtype=np.int64)
+    times, cells, distances = rows.T
+    breaks = np.flatnonzero(
+        (cells[1:] != cells[:-1])
+        | (np.diff(times) > SEGMENT_MAX_GAP)
+        | (times[1:] // SEGMENT_MAX_SECONDS != times[:-1] // SEGMENT_MAX_SECONDS)
+    ) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(rows)]])
+    return np.stack([
+        times[starts], times[ends - 1], cells[starts], np.minimum.reduceat(distances, starts), ends - starts,
+    ], axis=1)
+
+
+def build_rollups(rows: np.ndarray, resolution: int) -> np.ndarray:
+    """
+    Rows per (bucket, cell1) of (time, cell1, distance1) rows.
+
+    Returns:
+        np.ndarray: int64 (bucket, cell, samples, min_distance) rows.
+    """
+    if len(rows) == 0:
+        return np.empty((0, 4), dtype=np.int64)
+    keys = np.stack([rows[:, 0] // resolution * resolution, rows[:, 1]], axis=1)
+    unique, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    min_distances = np.full(len(unique), np.iinfo(np.int64).max)
+    np.minimum.at(min_distances, inverse.ravel(), rows[:, 2])
+    return np.column_stack([unique, counts, min_distances])
+
+
+def compact_user(
+    connection: sqlite3.Connection, user_id: str, start: Optional[int], until: int, max_id: int
+) -> Tuple[int, int]:
+    """
+    Compact the user's rows with start <= time < until and id <= max_id into segments
+    and rollups, one committed chunk of COMPACTION_CHUNK_SECONDS at a time. `start`
+    None starts from the user's first row. Rows with larger ids are left to
+    compact_late_rows.
+
+    Returns:
+        (int, int): Rows compacted and segments written.
+    """
+    if start is None:
+        first = connection.execute("SELECT MIN(time) FROM user_trajectory WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if first is None:
+            return 0, 0
+        start = _hour_floor(first)
+        if start >= until:
+            # Nothing old enough yet, remember where the next pass starts
+            connection.execute(_COMPACTED_UNTIL_UPSERT_SQL, (user_id, until, max_id))
+            connection.commit()
+            return 0, 0
+
+    compacted = segments_written = 0
+    while start < until:
+        end = min(until, start + COMPACTION_CHUNK_SECONDS)
+        fetched = connection.execute(
+            "SELECT time, cell1, distance1 FROM user_trajectory"
+            " WHERE user_id = ? AND time >= ? AND time < ? AND id <= ? ORDER BY time",
+            (user_id, start, end, max_id),
+        ).fetchall()
+        rows = np.array(fetched, dtype=np.int64).reshape(-1, 3)
+        segments_written += _write_compacted(connection, user_id, rows)
+        connection.execute(_COMPACTED_UNTIL_UPSERT_SQL, (user_id, end, max_id))
+        connection.commit()
+        compacted += len(rows)
+        start = end
+    return compacted, segments_written
+
+
+def compact_late_rows(connection: sqlite3.Connection, max_id: int) -> Tuple[int, int]:
+    """
+    Merge the rows with id <= max_id that arrived behind the compacted range of their
+    user since the last pass into the compacted history (see merge_late_rows), and
+    move every user's compacted_id to max_id, in one transaction.
+
+    Returns:
+        (int, int): Rows compacted and segments written.
+    """
+    # Users compacted before compacted_id existed start from here
+    connection.execute("UPDATE trajectory_compaction SET compacted_id = ? WHERE compacted_id IS NULL", (max_id,))
+    oldest = connection.execute("SELECT MIN(compacted_id) FROM trajectory_compaction").fetchone()[0]
+    compacted = segments_written = 0
+    fetched = []
+    if oldest is not None and oldest < max_id:
+        fetched = connection.execute(_LATE_ROWS_SQL, (oldest, max_id)).fetchall()
+    if fetched:
+        watermarks = read_watermarks(connection)
+        user_ids = [row[0] for row in fetched]
+        rows = np.array([row[1:] for row in fetched], dtype=np.int64).reshape(-1, 3)
+        # Rows are ordered by user, split them back per user
+        bounds = [i for i in range(1, len(user_ids)) if user_ids[i] != user_ids[i - 1]]
+        for start, end in zip([0] + bounds, bounds + [len(user_ids)]):
+            user_id = user_ids[start]
+            merged, segments = merge_late_rows(connection, user_id, rows[start:end], watermarks[user_id][2])
+            compacted += merged
+            segments_written += segments
+    connection.execute("UPDATE trajectory_compaction SET compacted_id = ? WHERE compacted_id < ?", (max_id, max_id))
+    connection.commit()
+    return compacted, segments_written
+
+
+def merge_late_rows(
+    connection: sqlite3.Connection, user_id: str, rows: np.ndarray, segments_from: Optional[int]
+) -> Tuple[int, int]:
+    """
+    Merge late (time, cell1, distance1) rows of a user, sorted by time, into the
+    compacted history, without committing.
+
+    Rows of a time the compacted history already has are dropped. The segments of
+    every hour with new rows are rebuilt from their rows and the new ones, so reads
+    never see two segments covering the same time, and the new rows are added to the
+    rollups. Hours before segments_from have no segments left, only their rollups.
+
+    Returns:
+        (int, int): Rows merged and segments written.
+    """
+    # One row per time, like the compacted history
+    rows = rows[np.concatenate([[True], rows[1:, 0] != rows[:-1, 0]])]
+    hours = rows[:, 0] // SEGMENT_MAX_SECONDS * SEGMENT_MAX_SECONDS
+    merged = []
+    segments_written = 0
+    for hour in np.unique(hours).tolist():
+        late = rows[hours == hour]
+        fetched = connection.execute(_HOUR_SEGMENTS_SQL, (user_id, hour, hour + SEGMENT_MAX_SECONDS)).fetchall()
+        segments = np.array([row[1:] for row in fetched], dtype=np.int64).reshape(-1, 5)
+        compacted = segments_to_trajectory(segments)[:, [0, CELL_COLUMNS[0], DISTANCE_COLUMNS[0]]]
+        late = late[~np.isin(late[:, 0], compacted[:, 0])]
+        if len(late) == 0:
+            continue
+        merged.append(late)
+        if segments_from is not None and hour < segments_from:
+            continue
+        hour_rows = np.concatenate([compacted, late])
+        hour_rows = hour_rows[np.argsort(hour_rows[:, 0], kind="stable")]
+        connection.executemany("DELETE FROM trajectory_segment WHERE id = ?", ((row[0],) for row in fetched))
+        segments_written += _write_segments(connection, user_id, hour_rows)
+    if merged:
+        _write_rollups(connection, user_id, np.concatenate(merged))
+    return sum(len(late) for late in merged), segments_written
+
+
+def _write_compacted(connection: sqlite3.Connection, user_id: str, rows: np.ndarray) -> int:
+    """Add segments and rollups of the user's (time, cell1, distance1) rows; return the segments written."""
+    _write_rollups(connection, user_id, rows)
+    return _write_segments(connection, user_id, rows)
+
+
+def _write_segments(connection: sqlite3.Connection, user_id: str, rows: np.ndarray) -> int:
+    segments = build_segments(rows)
+    connection.executemany(_SEGMENT_INSERT_SQL, ((user_id, *segment) for segment in segments.tolist()))
+    return len(segments)
+
+
+def _write_rollups(connection: sqlite3.Connection, user_id: str, rows: np.ndarray) -> None:
+    connection.executemany(
+        _ROLLUP_UPSERT_SQL,
+        ((user_id, ROLLUP_RESOLUTION, *rollup) for rollup in build_rollups(rows, ROLLUP_RESOLUTION).tolist()),
+    )
+
+
+def drop_raw_rows(connection: sqlite3.Connection, user_id: str, retained_from: int) -> int:
+    """
+    Delete the user's raw rows with time < retained_from and record it, in batches of
+    DELETE_BATCH_ROWS so ingestion is never blocked for long; return the rows deleted.
+    """
+    deleted = 0
+    while True:
+        count = connection.execute(
+            "DELETE FROM user_trajectory WHERE id IN"
+            " (SELECT id FROM user_trajectory WHERE user_id = ? AND time < ? LIMIT ?)",
+            (user_id, retained_from, DELETE_BATCH_ROWS),
+        ).rowcount
+        connection.commit()
+        deleted += count
+        if count < DELETE_BATCH_ROWS:
+            break
+    connection.execute(_WATERMARK_UPSERT_SQL.format(column="retained_from"), (user_id, retained_from))
+    connection.commit()
+    return deleted
+
+
+def drop_segments(connection: sqlite3.Connection, user_id: str, segments_from: int) -> int:
+    """
+    Delete the user's segments with enter_time < segments_from (segments never cross
+    an hour, so they end before it too) and record it, in batches; return the
+    segments deleted.
+    """
+    deleted = 0
+    while True:
+        count = connection.execute(
+            "DELETE FROM trajectory_segment WHERE id IN"
+            " (SELECT id FROM trajectory_segment WHERE user_id = ? AND enter_time < ? LIMIT ?)",
+            (user_id, segments_from, DELETE_BATCH_ROWS),
+        ).rowcount
+        connection.commit()
+        deleted += count
+        if count < DELETE_BATCH_ROWS:
+            break
+    connection.execute(_WATERMARK_UPSERT_SQL.format(column="segments_from"), (user_id, segments_from))
+    connection.commit()
+    return deleted
+
+
+class TrajectoryCompactor:
+    """
+    Background job running a compaction pass every `interval` seconds.
+
+    Raw rows are only dropped once compacted, and only after reads of their times
+    have been switched to the segments (set_raw_horizon), so concurrent predictions
+    never see a gap; likewise for segments and the rollups (set_segment_horizon).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        interval: float = 300.0,
+        compact_after: int = 86400,
+        retention: int = 604800,
+        segment_retention: int = 2592000,
+    ):
+        self.db_path = db_path
+        self.interval = interval
+        self.compact_after = compact_after
+        # Raw rows are kept at least until they are compacted, and segments as long as raw rows
+        self.retention = max(retention, compact_after)
+        self.segment_retention = max(segment_retention, self.retention)
+        self.passes = 0
+        self.rows_compacted = 0
+        self.late_rows_compacted = 0
+        self.segments_written = 0
+        self.rows_dropped = 0
+        self.segments_dropped = 0
+        self.last_pass_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        """Start the background pass loop."""
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the loop once the user being compacted is done."""
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+
+    async def compact_once(self) -> Dict[str, int]:
+        """
+        Run one compaction pass over every user.
+
+        Returns:
+            dict: Users, rows compacted (of which late rows), segments written, and raw
+            rows and segments dropped by the pass.
+        """
+        started = time.perf_counter()
+        totals = {"users": 0, "rows_compacted": 0, "late_rows_compacted": 0, "segments_written": 0,
+                  "rows_dropped": 0, "segments_dropped": 0}
+        connection = await asyncio.to_thread(open_connection, self.db_path)
+        try:
+            # Rows inserted from here on are left to the next pass
+            max_id = await asyncio.to_thread(max_row_id, connection)
+            # Late rows are compacted before any retention delete could drop them
+            rows, segments = await asyncio.to_thread(compact_late_rows, connection, max_id)
+            totals["late_rows_compacted"] += rows
+            totals["rows_compacted"] += rows
+            totals["segments_written"] += segments
+
+            watermarks = await asyncio.to_thread(read_watermarks, connection)
+            users = await asyncio.to_thread(lambda: list(iter_user_latest_times(connection)))
+            for user_id, latest in users:
+                if self._stopping:
+                    break
+                compacted_until, retained_from, segments_from = watermarks.get(user_id, (None, None, None))
+                until = _hour_floor(latest - self.compact_after)
+                if compacted_until is None or until > compacted_until:
+                    rows, segments = await asyncio.to_thread(
+                        compact_user, connection, user_id, compacted_until, until, max_id
+                    )
+                    compacted_until = until
+                    totals["users"] += 1
+                    totals["rows_compacted"] += rows
+                    totals["segments_written"] += segments
+
+                horizon = min(_hour_floor(latest - self.retention), compacted_until)
+                if retained_from is None or horizon > retained_from:
+                    # Reads switch to the segments before the rows they replace go away
+                    set_raw_horizon(user_id, horizon)
+                    totals["rows_dropped"] += await asyncio.to_thread(drop_raw_rows, connection, user_id, horizon)
+                    retained_from = horizon
+
+                horizon = min(_hour_floor(latest - self.segment_retention), retained_from)
+                if segments_from is None or horizon > segments_from:
+                    # And to the rollups before the segments go away
+                    set_segment_horizon(user_id, horizon)
+                    totals["segments_dropped"] += await asyncio.to_thread(drop_segments, connection, user_id, horizon)
+        finally:
+            await asyncio.to_thread(connection.close)
+
+        self.passes += 1
+        self.rows_compacted += totals["rows_compacted"]
+        self.late_rows_compacted += totals["late_rows_compacted"]
+        self.segments_written += totals["segments_written"]
+        self.rows_dropped += totals["rows_dropped"]
+        self.segments_dropped += totals["segments_dropped"]
+        self.last_pass_seconds = time.perf_counter() - started
+        return totals
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "passes": self.passes,
+            "rows_compacted": self.rows_compacted,
+            "late_rows_compacted": self.late_rows_compacted,
+            "segments_written": self.segments_written,
+            "rows_dropped": self.rows_dropped,
+            "segments_dropped": self.segments_dropped,
+            "last_pass_seconds": round(self.last_pass_seconds, 3),
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                totals = await self.compact_once()
+                if totals["users"] or totals["rows_compacted"] or totals["rows_dropped"] or totals["segments_dropped"]:
+                    logger.info(f"Trajectory compaction: {totals}")
+            except Exception:
+                logger.error("Error compacting trajectory history", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def _hour_floor(t: int) -> int:
+    return t // SEGMENT_MAX_SECONDS * SEGMENT_MAX_SECONDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one trajectory compaction and retention pass.")
+    parser.add_argument("--db", default=engine.url.database,
+                        help="SQLite database file (default: the one of DATABASE_URL)")
+    parser.add_argument("--compact-after", type=int, default=get_compaction_after(),
+                        help="Seconds behind a user's latest row after which rows are compacted")
+    parser.add_argument("--retention", type=int, default=get_trajectory_retention(),
+                        help="Seconds behind a user's latest row after which raw rows are dropped")
+    parser.add_argument("--segment-retention", type=int, default=get_segment_retention(),
+                        help="Seconds behind a user's latest row after which segments are dropped")
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+
+    sync_engine = create_engine(f"sqlite:///{args.db}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    compactor = TrajectoryCompactor(
+        args.db, compact_after=args.compact_after, retention=args.retention, segment_retention=args.segment_retention
+    )
+    totals = asyncio.run(compactor.compact_once())
+    print(f"Compacted {totals['rows_compacted']:,} rows ({totals['late_rows_compacted']:,} late) of "
+          f"{totals['users']} users into {totals['segments_written']:,} segments, dropped "
+          f"{totals['rows_dropped']:,} raw rows and {totals['segments_dropped']:,} segments "
+          f"in {compactor.last_pass_seconds:.1f}s")
+    print("Restart a running app to have it read the compacted history.")
+
+
+if __name__ == "__main__":
+    main()
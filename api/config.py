@@ -4,10 +4,173 @@ import os
 # Load the .env file into environment variables
 load_dotenv()
 
+def get_database_url():
+    return os.getenv("DATABASE_URL", "sqlite+aiosqlite:///user_trajectory.db")
+
+def get_sql_echo():
+    """Log every SQL statement (off by default, it is a hot-path cost)."""
+    return os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
+
 def get_openai_api_key():
     return os.getenv("OPENAI_API_KEY")
 
 def get_gemini_api_key():
     return os.getenv("GEMINI_API_KEY")
 
+def get_periodicity_confidence_threshold():
+    """Minimum confidence for the periodicity predictor to answer without the LLM."""
+    return float(os.getenv("PERIODICITY_CONFIDENCE_THRESHOLD", "0.8"))
+
+def get_trajectory_cache_max_bytes():
+    """Memory budget of the per-user trajectory window cache."""
+    return int(os.getenv("TRAJECTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+def get_trajectory_cache_ttl():
+    """Seconds a cached trajectory window stays valid."""
+    return float(os.getenv("TRAJECTORY_CACHE_TTL_SECONDS", "300"))
+
+def get_trajectory_cache_prefetch():
+    """Extra seconds of trajectory fetched past the requested window on a cache miss."""
+    return int(os.getenv("TRAJECTORY_CACHE_PREFETCH_SECONDS", "300"))
+
+def get_max_agents():
+    """Maximum number of per-user agents kept by the NetworkAgentManager."""
+    return int(os.getenv("MAX_AGENTS", "100000"))
+
+def get_prediction_cache_max_entries():
+    """Maximum number of cached prediction results."""
+    return int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", "100000"))
+
+def get_prediction_cache_ttl():
+    """Seconds a cached prediction result stays valid."""
+    return float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "60"))
+
+def get_prediction_cache_timestamp_bucket():
+    """Width in seconds of the timestamp buckets sharing a cached prediction."""
+    return int(os.getenv("PREDICTION_CACHE_TIMESTAMP_BUCKET_SECONDS", "10"))
+
+def get_prediction_cache_load_bins():
+    """Number of bins tower loads (0..1) are quantized into for the prediction cache key."""
+    return int(os.getenv("PREDICTION_CACHE_LOAD_BINS", "10"))
+
+def get_batch_predict_concurrency():
+    """Maximum number of predictions of a /predict/batch call running at once."""
+    return int(os.getenv("BATCH_PREDICT_CONCURRENCY", "16"))
+
+def get_ingest_buffer_max_rows():
+    """Trajectory rows the ingestion buffer holds before pushing back on writers."""
+    return int(os.getenv("INGEST_BUFFER_MAX_ROWS", "200000"))
+
+def get_ingest_flush_rows():
+    """Buffered trajectory rows that trigger a flush to the database."""
+    return int(os.getenv("INGEST_FLUSH_ROWS", "5000"))
+
+def get_ingest_flush_interval():
+    """Maximum seconds ingested trajectory rows wait in the buffer."""
+    return float(os.getenv("INGEST_FLUSH_INTERVAL_SECONDS", "0.5"))
+
+def get_ingest_backpressure_timeout():
+    """Seconds a writer waits for buffer space before being rejected."""
+    return float(os.getenv("INGEST_BACKPRESSURE_TIMEOUT_SECONDS", "1.0"))
+
+def get_trajectory_encoding():
+    """How trajectories are written into the LLM prompt: csv, rle, dictionary, delta or adaptive."""
+    return os.getenv("TRAJECTORY_ENCODING", "csv")
+
+def get_llm_backend():
+    """Chat model answering the recommendation prompt: gemini, or fake for offline load tests."""
+    return os.getenv("LLM_BACKEND", "gemini")
+
+def get_fake_llm_latency_ms():
+    """Median simulated latency in milliseconds of the fake LLM backend."""
+    return float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+
+def get_fake_llm_latency_sigma():
+    """Log-normal sigma of the fake LLM latency, 0 for a constant latency."""
+    return float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5"))
+
+def get_predict_deadline():
+    """Seconds a prediction may take before the local fallback answers, 0 for no limit."""
+    deadline = float(os.getenv("PREDICT_DEADLINE_SECONDS", "10"))
+    return deadline if deadline > 0 else None
+
+def get_llm_hedge_delay():
+    """Seconds after which a second, hedged LLM request is sent, 0 to never hedge."""
+    delay = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "0"))
+    return delay if delay > 0 else None
+
+def get_fallback_load_margin():
+    """Load advantage (0..1) a nearby cell needs for the fallback to leave the current cell."""
+    return float(os.getenv("FALLBACK_LOAD_MARGIN", "0.1"))
+
+def get_precompute_enabled():
+    """Precompute the upcoming predictions of active users in the background."""
+    return os.getenv("PRECOMPUTE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+def get_precompute_horizon():
+    """Seconds of trajectory time ahead of a user's latest request that are precomputed."""
+    return int(os.getenv("PRECOMPUTE_HORIZON_SECONDS", "60"))
+
+def get_precompute_workers():
+    """Number of concurrent precomputation workers."""
+    return int(os.getenv("PRECOMPUTE_WORKERS", "4"))
+
+def get_precompute_load_tolerance():
+    """Maximum drift of any tower load (0..1) for a precomputed prediction to still be served."""
+    return float(os.getenv("PRECOMPUTE_LOAD_TOLERANCE", "0.1"))
+
+def get_precompute_max_entries():
+    """Maximum number of precomputed predictions kept."""
+    return int(os.getenv("PRECOMPUTE_MAX_ENTRIES", "100000"))
+
+def get_precompute_ttl():
+    """Seconds a precomputed prediction stays valid."""
+    return float(os.getenv("PRECOMPUTE_TTL_SECONDS", "300"))
+
+def get_precompute_idle_after():
+    """Seconds without a request after which a user is no longer precomputed."""
+    return float(os.getenv("PRECOMPUTE_IDLE_SECONDS", "300"))
+
+def get_trajectory_backend():
+    """Where trajectory windows are read from: sqlite, or columnar for the memory-mapped store."""
+    return os.getenv("TRAJECTORY_BACKEND", "sqlite").lower()
+
+def get_trajectory_store_path():
+    """Directory of the memory-mapped columnar trajectory store."""
+    return os.getenv("TRAJECTORY_STORE_PATH", os.path.join("data", "trajectory_store"))
+
+def get_compaction_enabled():
+    """Compact old trajectory history into segments and rollups in the background."""
+    return os.getenv("COMPACTION_ENABLED", "false").lower() in ("1", "true", "yes")
+
+def get_compaction_interval():
+    """Seconds between two compaction passes."""
+    return float(os.getenv("COMPACTION_INTERVAL_SECONDS", "300"))
+
+def get_compaction_after():
+    """Trajectory seconds behind a user's latest row after which rows are compacted."""
+    return int(os.getenv("COMPACTION_AFTER_SECONDS", "86400"))
+
+def get_trajectory_retention():
+    """Trajectory seconds behind a user's latest row after which compacted raw rows are dropped."""
+    return int(os.getenv("TRAJECTORY_RETENTION_SECONDS", "604800"))
+
+def get_segment_retention():
+    """Trajectory seconds behind a user's latest row after which segments are dropped, leaving the rollups."""
+    return int(os.getenv("SEGMENT_RETENTION_SECONDS", "2592000"))
+
+def get_user_models_enabled():
+    """Learn per-user mobility models and persist them in user_contexts for warm starts."""
+    return os.getenv("USER_MODELS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+def get_user_model_max_entries():
+    """Maximum number of user models kept in memory."""
+    return int(os.getenv("USER_MODEL_MAX_ENTRIES", "100000"))
+
+def get_user_model_flush_interval():
+    """Seconds between two batched writes of the changed user models."""
+    return float(os.getenv("USER_MODEL_FLUSH_INTERVAL_SECONDS", "1.0"))
 
+def get_background_data_load():
+    """Load the trajectory data after startup (reported by GET /ready) instead of before serving."""
+    return os.getenv("BACKGROUND_DATA_LOAD", "true").lower() in ("1", "true", "yes")
@@ -1,17 +1,39 @@
-from sqlalchemy import create_engine, Column, String, Integer, MetaData, DateTime
+from sqlalchemy import event, inspect, Column, String, Integer, LargeBinary, MetaData, DateTime, Index, PrimaryKeyConstraint
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.future import select
-import pandas as pd
+import asyncio
+import numpy as np
 import os
-from typing import List, Dict
+import time
+from itertools import chain
+from typing import Callable, List, Dict, Optional, Tuple
 from datetime import datetime
 
+from .cache import TrajectoryWindowCache
+from .config import (
+    get_database_url,
+    get_sql_echo,
+    get_trajectory_cache_max_bytes,
+    get_trajectory_cache_ttl,
+    get_trajectory_cache_prefetch,
+    get_trajectory_backend,
+    get_trajectory_store_path,
+)
+
 # Database URL (SQLite for simplicity)
-DATABASE_URL = "sqlite+aiosqlite:///user_trajectory.db"
+DATABASE_URL = get_database_url()
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Create async engine, statements are only logged when SQL_ECHO is set
+engine = create_async_engine(DATABASE_URL, echo=get_sql_echo())
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so trajectory writes do not block the prediction reads."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
@@ -20,6 +42,23 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+# Per-user trajectory windows kept in memory for active users
+trajectory_cache = TrajectoryWindowCache(
+    max_bytes=get_trajectory_cache_max_bytes(),
+    ttl=get_trajectory_cache_ttl(),
+)
+
+# Columnar snapshot serving trajectory reads when TRAJECTORY_BACKEND=columnar, opened by
+# initialize_database; reads go to the user_trajectory table while it is None
+trajectory_store = None
+
+# Per-user time before which raw trajectory rows may have been dropped by compaction,
+# reads of older times are served from the segments instead
+raw_horizons: Dict[str, int] = {}
+# Per-user time before which segments may have been dropped too, reads of older times
+# are served from the hourly rollups
+segment_horizons: Dict[str, int] = {}
+
 # Base class for models
 Base = declarative_base()
 
@@ -40,12 +79,109 @@ class UserTrajectory(Base):
     cell5 = Column(Integer, nullable=True)
     distance5 = Column(Integer, nullable=True)
 
+    # Every trajectory read is a time window of a single user
+    __table_args__ = (
+        Index("ix_user_trajectory_user_id_time", "user_id", "time"),
+    )
+
+# Serving-cell segments of compacted trajectory history: `samples` rows between enter_time
+# and exit_time (inclusive) all had `cell` as cell1. Segments never span an hour boundary.
+class TrajectorySegment(Base):
+    __tablename__ = "trajectory_segment"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    enter_time = Column(Integer, nullable=False)
+    exit_time = Column(Integer, nullable=False)
+    cell = Column(Integer, nullable=False)
+    min_distance = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_trajectory_segment_user_id_enter_time", "user_id", "enter_time"),
+    )
+
+# Rows per serving cell and hour of compacted history (resolution 3600; earlier
+# versions also wrote daily rollups, which nothing reads)
+class TrajectoryRollup(Base):
+    __tablename__ = "trajectory_rollup"
+    user_id = Column(String, nullable=False)
+    resolution = Column(Integer, nullable=False)  # Bucket length in seconds
+    bucket = Column(Integer, nullable=False)  # Start time of the bucket
+    cell = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+    min_distance = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "resolution", "bucket", "cell"),
+    )
+
+# Compaction progress of a user: segments and rollups cover the rows with time <
+# compacted_until and id <= compacted_id, the raw rows with time < retained_from
+# have been dropped, and the segments with enter_time < segments_from too
+class TrajectoryCompaction(Base):
+    __tablename__ = "trajectory_compaction"
+    user_id = Column(String, primary_key=True)
+    compacted_until = Column(Integer, nullable=True)
+    compacted_id = Column(Integer, nullable=True)
+    retained_from = Column(Integer, nullable=True)
+    segments_from = Column(Integer, nullable=True)
+
+# Progress of an unfinished CSV load of api/loader.py, written in the transaction of the
+# rows it covers: the CSV offset reached and the id ranges of the rows inserted so far
+class TrajectoryLoadCheckpoint(Base):
+    __tablename__ = "trajectory_load_checkpoint"
+    id = Column(Integer, primary_key=True)
+    csv_path = Column(String, nullable=False)
+    csv_size = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False)
+    rows = Column(Integer, nullable=False)
+    id_ranges = Column(String, nullable=False)  # JSON list of [first_id, last_id]
+
+# Trajectory columns handed to the predictors, in CSV order: time, cell1, distance1, ..., cell5, distance5
+TRAJECTORY_COLUMNS = ["time"] + [f"{kind}{i}" for i in range(1, 6) for kind in ("cell", "distance")]
+# Positions of cell1..cell5 and distance1..distance5 in trajectory arrays
+CELL_COLUMNS = [1, 3, 5, 7, 9]
+DISTANCE_COLUMNS = [2, 4, 6, 8, 10]
+# Placeholder for the nullable cell/distance columns in trajectory arrays
+MISSING_VALUE = -1
+
+# Raw window query used by the columnar read path, NULLs are mapped to MISSING_VALUE in SQL
+# so rows can go straight into an int64 array
+_TRAJECTORY_WINDOW_SQL = (
+    "SELECT time, "
+    + ", ".join(f"IFNULL({name}, {MISSING_VALUE})" for name in TRAJECTORY_COLUMNS[1:])
+    + " FROM user_trajectory WHERE user_id = ? AND time BETWEEN ? AND ?"
+)
+
+# Grouped window query of many users: the windows are joined to the table as a VALUES
+# list, each one read through the (user_id, time) index, rows tagged with the window index
+_GROUPED_WINDOW_SQL = (
+    "WITH windows(idx, user_id, start_time, end_time) AS (VALUES {values}) "
+    "SELECT windows.idx, t.time, "
+    + ", ".join(f"IFNULL(t.{name}, {MISSING_VALUE})" for name in TRAJECTORY_COLUMNS[1:])
+    + " FROM windows CROSS JOIN user_trajectory AS t"
+    " ON t.user_id = windows.user_id AND t.time BETWEEN windows.start_time AND windows.end_time"
+    " ORDER BY windows.idx, t.time"
+)
+# Users per grouped query, keeps the bound parameters under SQLite's limit
+PREFETCH_CHUNK_SIZE = 200
+
+# Longest segment, one hour as segments never span an hour boundary
+SEGMENT_MAX_SECONDS = 3600
+
+# Segments overlapping a time range, through the (user_id, enter_time) index
+_SEGMENT_SQL = (
+    "SELECT enter_time, exit_time, cell, min_distance, samples FROM trajectory_segment"
+    " WHERE user_id = ? AND enter_time BETWEEN ? AND ? AND exit_time >= ?"
+)
+
 # Add this to your existing models
 class UserContext(Base):
     __tablename__ = "user_contexts"
     
     user_id = Column(String, primary_key=True)
     chat_history = Column(String)  # Stores JSON serialized chat history
+    model = Column(LargeBinary, nullable=True)  # Learned mobility model, see api/user_model.py
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -54,35 +190,118 @@ class UserContext(Base):
 #     async with engine.begin() as conn:
 #         await conn.run_sync(Base.metadata.create_all)
 
-async def initialize_database():
-    """Initialize the database and create tables. Load CSV data if the table is empty."""
+async def initialize_database(load_data: bool = True):
+    """
+    Initialize the database and create tables, then load the data (load_initial_data)
+    unless `load_data` is False, for callers that run it in the background.
+    """
+    backend = get_trajectory_backend()
+    if backend not in ("sqlite", "columnar"):
+        raise ValueError(f"Unknown trajectory backend: {backend}")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips columns and indexes of tables that already exist, add them to older databases
+        await conn.run_sync(migrate_columns)
+        await conn.run_sync(migrate_indexes)
+        result = await conn.execute(
+            select(TrajectoryCompaction.user_id, TrajectoryCompaction.retained_from, TrajectoryCompaction.segments_from)
+            .where(TrajectoryCompaction.retained_from.is_not(None))
+        )
+        raw_horizons.clear()
+        segment_horizons.clear()
+        for user_id, retained_from, segments_from in result.all():
+            raw_horizons[user_id] = retained_from
+            if segments_from is not None:
+                segment_horizons[user_id] = segments_from
+
+    if load_data:
+        await load_initial_data()
 
+async def load_initial_data(
+    progress: Optional[Callable[[int, int, int], None]] = None, serving: bool = False
+) -> int:
+    """
+    Load the CSV data if the trajectory table is empty, and open the columnar store
+    when TRAJECTORY_BACKEND is columnar. Returns the number of rows loaded.
+    Args:
+        progress: Called as progress(rows, bytes_read, bytes_total) while the CSV loads
+        serving: Requests are served during the load, keep the trajectory indexes
+    """
     # Check if the table is empty
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(UserTrajectory).limit(1))
-        if not result.scalars().first():
-            # Load data from CSV if the table is empty
-            csv_file_path = os.path.join("data", "user_trajectory.csv")
-            print("csv_file_path", csv_file_path)
-            if os.path.exists(csv_file_path):
-                # Use Pandas to load the CSV file
-                with open(csv_file_path, 'r') as file:
-                    data_df = pd.read_csv(file)
-                    print("read data_df", len(data_df))
-
-                # Use a synchronous engine for Pandas to_sql
-                sync_engine = create_engine("sqlite:///user_trajectory.db")
-                data_df.to_sql(
-                    name="user_trajectory",
-                    con=sync_engine,
-                    index=False,
-                    if_exists="append",
-                )
-                print("CSV data loaded into the database.")
-            else:
-                print(f"CSV file not found at {csv_file_path}.")
+        result = await session.execute(select(UserTrajectory.id).limit(1))
+        is_empty = result.first() is None
+
+    # Imported here, the loader itself depends on the models above
+    from .loader import load_trajectory_csv, has_unfinished_load
+
+    db_path = engine.url.database
+    loaded = 0
+    # Load data from CSV if the table is empty, or finish a load that was interrupted
+    if is_empty or has_unfinished_load(db_path):
+        csv_file_path = os.path.join("data", "user_trajectory.csv")
+        print("csv_file_path", csv_file_path)
+        if os.path.exists(csv_file_path):
+            reported = [0]
+
+            def report(rows, bytes_read, bytes_total):
+                if progress is not None:
+                    progress(rows, bytes_read, bytes_total)
+                # One line per 10% of the file
+                decile = int(10 * bytes_read / max(1, bytes_total))
+                if decile > reported[0]:
+                    reported[0] = decile
+                    print(f"Loaded {rows} rows ({bytes_read / max(1, bytes_total):.0%} of {csv_file_path})")
+
+            # The loader is synchronous, keep the event loop free while it runs
+            loaded = await asyncio.to_thread(
+                load_trajectory_csv, csv_file_path, db_path, drop_indexes=not serving, progress=report
+            )
+            trajectory_cache.clear()
+            print(f"CSV data loaded into the database ({loaded} rows).")
+        else:
+            print(f"CSV file not found at {csv_file_path}.")
+
+    if get_trajectory_backend() == "columnar":
+        # A fresh CSV load makes any existing snapshot stale
+        await open_trajectory_store(rebuild=loaded > 0)
+    return loaded
+
+async def open_trajectory_store(rebuild: bool = False) -> None:
+    """
+    Serve trajectory reads from the columnar store at TRAJECTORY_STORE_PATH, migrating
+    the user_trajectory table into it first when there is none yet, or when `rebuild`.
+    """
+    global trajectory_store
+    # Imported here, the store itself depends on the definitions of this module
+    from .storage import ColumnarTrajectoryStore, migrate_trajectory_table, store_exists
+
+    path = get_trajectory_store_path()
+    if rebuild or not store_exists(path):
+        started = time.perf_counter()
+        rows = await asyncio.to_thread(migrate_trajectory_table, engine.url.database, path)
+        print(f"Trajectory table migrated to {path} ({rows} rows, {time.perf_counter() - started:.1f}s).")
+    store = ColumnarTrajectoryStore(path)
+    async with AsyncSessionLocal() as session:
+        await session.run_sync(lambda sync_session: store.load_delta_users(sync_session.connection()))
+    trajectory_store = store
+    trajectory_cache.clear()
+
+def migrate_columns(sync_conn):
+    """Add the nullable columns of all tables that are missing in an existing database."""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                sync_conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def migrate_indexes(sync_conn):
+    """Create the indexes of all tables that are missing in an existing database."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
 
 async def get_db():
     """Get an async database session."""
@@ -97,32 +316,295 @@ async def get_user_trajectory_data(user_id: str, timestamp: int, db: AsyncSessio
         timestamp: Current timestamp to fetch relevant trajectory window
         db: Database session
     """
+    time_window_start, time_window_end = trajectory_window_bounds(timestamp)
+    window = await get_user_trajectory_window(user_id, time_window_start, time_window_end, db)
+    return trajectory_to_csv(window)
+
+def trajectory_window_bounds(timestamp: int) -> Tuple[int, int]:
+    """Inclusive time window of trajectory rows used for a prediction at `timestamp`."""
     # Calculate time window based on input timestamp
     time_window_start = max(0, timestamp - 100)  # Ensure we don't go below 0
     time_window_end = timestamp + 200  # Add buffer for future predictions
-    
-    result = await db.execute(
-        select(UserTrajectory)
-        .where(UserTrajectory.user_id == user_id)
-        .where(UserTrajectory.time >= time_window_start)
-        .where(UserTrajectory.time <= time_window_end)
+    return time_window_start, time_window_end
+
+async def get_user_trajectory_window(user_id: str, start: int, end: int, db: AsyncSession) -> np.ndarray:
+    """
+    Return the user's trajectory rows with start <= time <= end, served from the
+    trajectory cache when possible.
+    Args:
+        user_id: User identifier
+        start: First second of the window
+        end: Last second of the window
+        db: Database session, only used on a cache miss
+    """
+    window = trajectory_cache.get_window(user_id, start, end)
+    if window is not None:
+        return window
+
+    # Fetch ahead of the window so the following requests of this user are hits
+    cached_end = end + get_trajectory_cache_prefetch()
+    generation = trajectory_cache.generation(user_id)
+    data = await get_user_trajectory_ranges(user_id, [(start, cached_end)], db)
+    trajectory_cache.put_window(user_id, start, cached_end, data, generation)
+    times = data[:, 0]
+    return data[:np.searchsorted(times, end, side="right")]
+
+async def prefetch_user_trajectory_windows(windows: List[Tuple[str, int, int]], db: AsyncSession) -> None:
+    """
+    Load the trajectory windows of many users into the trajectory cache with grouped
+    queries, one per chunk of PREFETCH_CHUNK_SIZE users instead of one per user.
+    Args:
+        windows: (user_id, start, end) inclusive windows, several per user allowed
+        db: Database session
+    """
+    prefetch = get_trajectory_cache_prefetch()
+    # One contiguous range per user, users already cached for their windows are skipped
+    ranges = {}
+    for user_id, start, end in windows:
+        ranges.setdefault(user_id, []).append((start, end))
+    pending = []
+    for user_id, user_ranges in ranges.items():
+        merged = merge_time_ranges(user_ranges)
+        start, end = merged[0][0], merged[-1][1]
+        if not trajectory_cache.covers(user_id, start, end):
+            pending.append((user_id, start, end + prefetch))
+    # Taken before any read, rows of users invalidated meanwhile are not cached
+    generations = {user_id: trajectory_cache.generation(user_id) for user_id, _, _ in pending}
+
+    grouped = []
+    for user_id, start, end in pending:
+        # Snapshot slices need no grouping, and compacted history is not in the table
+        if trajectory_store is not None or start < raw_horizons.get(user_id, start):
+            data = await get_user_trajectory_ranges(user_id, [(start, end)], db)
+            trajectory_cache.put_window(user_id, start, end, data, generations[user_id])
+        else:
+            grouped.append((user_id, start, end))
+    pending = grouped
+
+    for offset in range(0, len(pending), PREFETCH_CHUNK_SIZE):
+        chunk = pending[offset:offset + PREFETCH_CHUNK_SIZE]
+        values = ", ".join(["(?, ?, ?, ?)"] * len(chunk))
+        sql = _GROUPED_WINDOW_SQL.format(values=values)
+        params = [value for idx, (user_id, start, end) in enumerate(chunk) for value in (idx, user_id, start, end)]
+        data = await db.run_sync(
+            lambda session: _fetch_trajectory_array(session.connection(), sql, params, len(TRAJECTORY_COLUMNS) + 1)
+        )
+        # Rows are ordered by window index, split them back per user
+        bounds = np.searchsorted(data[:, 0], np.arange(len(chunk) + 1))
+        for idx, (user_id, start, end) in enumerate(chunk):
+            trajectory_cache.put_window(user_id, start, end, data[bounds[idx]:bounds[idx + 1], 1:], generations[user_id])
+
+def invalidate_user_trajectory(user_id: str) -> None:
+    """Drop cached trajectory windows of a user after new rows were written."""
+    trajectory_cache.invalidate(user_id)
+    if trajectory_store is not None:
+        trajectory_store.rows_written(user_id)
+
+def trajectory_to_csv(data: np.ndarray) -> str:
+    """
+    Serialize a trajectory array to CSV with a TRAJECTORY_COLUMNS header.
+    Missing cells/distances are written as empty fields.
+    """
+    if len(data) == 0:
+        return ""
+    text = data.astype(str)
+    text[data == MISSING_VALUE] = ""
+    lines = [",".join(TRAJECTORY_COLUMNS)]
+    lines.extend(",".join(row) for row in text)
+    return "\n".join(lines) + "\n"
+
+async def get_user_trajectory_ranges(user_id: str, ranges: List[Tuple[int, int]], db: AsyncSession) -> np.ndarray:
+    """
+    Fetch the user trajectory rows falling inside any of the given time ranges.
+
+    Overlapping ranges are merged and every range is read through the (user_id, time)
+    index. Rows are fetched as plain DBAPI tuples straight into a NumPy array, without
+    ORM objects or DataFrames. With the columnar backend, rows are sliced from the
+    memory-mapped store instead. Times before the user's compaction horizon are
+    rebuilt from the serving-cell segments (see get_user_trajectory_segments), and
+    times before their retention from the hourly rollups (see
+    get_user_trajectory_rollup_rows).
+    Args:
+        user_id: User identifier
+        ranges: Inclusive (start, end) time ranges, all fetched in a single query
+        db: Database session
+
+    Returns:
+        np.ndarray: int64 array of shape (N, len(TRAJECTORY_COLUMNS)) sorted by time,
+        with MISSING_VALUE in place of empty cells/distances.
+    """
+    merged = merge_time_ranges(ranges)
+    if not merged:
+        return np.empty((0, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+    horizon = raw_horizons.get(user_id)
+    if horizon is None or merged[0][0] >= horizon:
+        return await _read_raw_ranges(user_id, merged, db)
+
+    # Compacted history comes from the segments, or the rollups past their retention,
+    # the rest from the raw rows
+    old, recent = split_time_ranges(merged, horizon)
+    oldest, old = split_time_ranges(old, segment_horizons.get(user_id, old[0][0]))
+    parts = []
+    if oldest:
+        parts.append(await get_user_trajectory_rollup_rows(user_id, oldest, db))
+    if old:
+        parts.append(await get_user_trajectory_segments(user_id, old, db))
+    if recent:
+        parts.append(await _read_raw_ranges(user_id, recent, db))
+    return np.concatenate(parts)
+
+async def _read_raw_ranges(user_id: str, merged: List[Tuple[int, int]], db: AsyncSession) -> np.ndarray:
+    if trajectory_store is not None:
+        return await trajectory_store.read_ranges(user_id, merged, db)
+
+    sql = " UNION ALL ".join([_TRAJECTORY_WINDOW_SQL] * len(merged)) + " ORDER BY time"
+    params = [value for start, end in merged for value in (user_id, start, end)]
+    return await db.run_sync(lambda session: _fetch_trajectory_array(session.connection(), sql, params))
+
+async def get_user_trajectory_segments(user_id: str, merged: List[Tuple[int, int]], db: AsyncSession) -> np.ndarray:
+    """
+    Trajectory rows of compacted history rebuilt from the serving-cell segments.
+
+    Each segment gives back its `samples` rows spread evenly from its enter to its exit
+    time, which is exact for regularly sampled rows, with the segment cell as cell1,
+    its minimum distance as distance1 and MISSING_VALUE in the other columns.
+    Args:
+        user_id: User identifier
+        merged: Merged, sorted inclusive (start, end) time ranges
+        db: Database session
+
+    Returns:
+        np.ndarray: int64 array of shape (N, len(TRAJECTORY_COLUMNS)) sorted by time.
+    """
+    if not merged:
+        return np.empty((0, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+    # UNION drops the segments overlapping two ranges from the second one
+    sql = " UNION ".join([_SEGMENT_SQL] * len(merged)) + " ORDER BY enter_time"
+    params = [value for start, end in merged for value in (user_id, start - SEGMENT_MAX_SECONDS + 1, end, start)]
+    segments = await db.run_sync(lambda session: _fetch_trajectory_array(session.connection(), sql, params, 5))
+    return _rows_in_ranges(segments_to_trajectory(segments), merged)
+
+async def get_user_trajectory_rollup_rows(user_id: str, merged: List[Tuple[int, int]], db: AsyncSession) -> np.ndarray:
+    """
+    Trajectory rows of compacted history past the segment retention, rebuilt from the
+    hourly rollups.
+
+    A rollup only keeps how many rows each cell served in an hour, not when: the cells
+    of an hour are laid out one after the other over the whole hour, the most used
+    first, each over its share of the hour's rows. cell1 and distance1 come from the
+    rollup, the other columns are MISSING_VALUE.
+    Args:
+        user_id: User identifier
+        merged: Merged, sorted inclusive (start, end) time ranges
+        db: Database session
+
+    Returns:
+        np.ndarray: int64 array of shape (N, len(TRAJECTORY_COLUMNS)) sorted by time.
+    """
+    if not merged:
+        return np.empty((0, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+    resolution = SEGMENT_MAX_SECONDS
+    start = merged[0][0] // resolution * resolution
+    rollups = await get_user_trajectory_rollups(user_id, resolution, start, merged[-1][1], db)
+    if len(rollups) == 0:
+        return np.empty((0, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+    buckets, cells, samples, distances = rollups.T
+    # Rows of the rollups before each one within its bucket, and rows of the whole bucket
+    first = np.concatenate([[True], buckets[1:] != buckets[:-1]])
+    bucket_index = np.cumsum(first) - 1
+    preceding = np.cumsum(samples) - samples
+    before = preceding - preceding[first][bucket_index]
+    totals = np.add.reduceat(samples, np.flatnonzero(first))[bucket_index]
+    enter = buckets + before * resolution // totals
+    exit_ = buckets + (before + samples) * resolution // totals - 1
+    segments = np.stack([enter, np.maximum(exit_, enter), cells, distances, samples], axis=1)
+    return _rows_in_ranges(segments_to_trajectory(segments), merged)
+
+def _rows_in_ranges(rows: np.ndarray, merged: List[Tuple[int, int]]) -> np.ndarray:
+    """Rows within the merged ranges, sorted by time, one per time."""
+    # Segments written for late rows by earlier versions may overlap the others
+    rows = rows[np.argsort(rows[:, 0], kind="stable")]
+    times = rows[:, 0]
+    keep = np.zeros(len(rows), dtype=bool)
+    for start, end in merged:
+        keep[np.searchsorted(times, start, side="left"):np.searchsorted(times, end, side="right")] = True
+    keep[1:] &= times[1:] != times[:-1]
+    return rows[keep]
+
+def segments_to_trajectory(segments: np.ndarray) -> np.ndarray:
+    """Expand (enter_time, exit_time, cell, min_distance, samples) segments into trajectory rows."""
+    enter, exit_, cells, distances, samples = segments.T
+    segment = np.repeat(np.arange(len(segments)), samples)
+    # Position of every row within its segment, and its time spread over the segment
+    position = np.arange(len(segment)) - np.repeat(np.cumsum(samples) - samples, samples)
+    steps = np.maximum(samples - 1, 1)[segment]
+    span = (exit_ - enter)[segment]
+
+    rows = np.full((len(segment), len(TRAJECTORY_COLUMNS)), MISSING_VALUE, dtype=np.int64)
+    rows[:, 0] = enter[segment] + (position * span + steps // 2) // steps
+    rows[:, CELL_COLUMNS[0]] = cells[segment]
+    rows[:, DISTANCE_COLUMNS[0]] = distances[segment]
+    return rows
+
+async def get_user_trajectory_rollups(
+    user_id: str, resolution: int, start: int, end: int, db: AsyncSession
+) -> np.ndarray:
+    """
+    Rollups of a user's compacted history with start <= bucket <= end.
+    Args:
+        user_id: User identifier
+        resolution: Bucket length in seconds, 3600 (hourly)
+        start: First bucket start time
+        end: Last bucket start time
+        db: Database session
+
+    Returns:
+        np.ndarray: int64 array of (bucket, cell, samples, min_distance) rows, sorted by
+        bucket then by descending samples.
+    """
+    sql = (
+        "SELECT bucket, cell, samples, min_distance FROM trajectory_rollup"
+        " WHERE user_id = ? AND resolution = ? AND bucket BETWEEN ? AND ? ORDER BY bucket, samples DESC, cell"
     )
-    trajectories = result.scalars().all()
-    
-    if trajectories:
-        # Convert SQLAlchemy objects to DataFrame
-        df = pd.DataFrame([
-            {c.name: getattr(trajectory, c.name) 
-             for c in UserTrajectory.__table__.columns}
-            for trajectory in trajectories
-        ])
-        
-        # Drop id and user_id columns
-        df = df.drop(['id', 'user_id'], axis=1)
-        
-        # Convert all remaining columns to integer
-        for col in df.columns:
-            df[col] = df[col].astype(int)
-            
-        return df.to_csv(index=False)
-    return ""
+    params = [user_id, resolution, start, end]
+    return await db.run_sync(lambda session: _fetch_trajectory_array(session.connection(), sql, params, 4))
+
+def set_raw_horizon(user_id: str, horizon: int) -> None:
+    """Serve the user's times before `horizon` from the segments, before dropping raw rows."""
+    raw_horizons[user_id] = horizon
+    trajectory_cache.invalidate(user_id)
+
+def set_segment_horizon(user_id: str, horizon: int) -> None:
+    """Serve the user's times before `horizon` from the rollups, before dropping segments."""
+    segment_horizons[user_id] = horizon
+    trajectory_cache.invalidate(user_id)
+
+def split_time_ranges(
+    merged: List[Tuple[int, int]], boundary: int
+) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """The parts of merged inclusive time ranges before `boundary`, and from it on."""
+    before = [(start, min(end, boundary - 1)) for start, end in merged if start < boundary]
+    after = [(max(start, boundary), end) for start, end in merged if end >= boundary]
+    return before, after
+
+def merge_time_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge overlapping or adjacent inclusive time ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _fetch_trajectory_array(connection, sql: str, params: list, width: int = len(TRAJECTORY_COLUMNS)) -> np.ndarray:
+    """Run an all-integer query on the raw DBAPI connection and pack the rows into an int64 array."""
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width)
+    return flat.reshape(len(rows), width)
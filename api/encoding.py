@@ -0,0 +1,206 @@
+import re
+from typing import Callable, Dict, NamedTuple
+
+import numpy as np
+
+from .database import (
+    CELL_COLUMNS,
+    DISTANCE_COLUMNS,
+    MISSING_VALUE,
+    TRAJECTORY_COLUMNS,
+    trajectory_to_csv,
+)
+
+# Rows within this many seconds after the prediction timestamp are never downsampled
+ADAPTIVE_HORIZON = 100
+# Rows within this many seconds before the prediction timestamp are never downsampled
+ADAPTIVE_RECENT = 10
+# Sampling step, in seconds, of the rows outside those ranges
+ADAPTIVE_STEP = 10
+
+_CSV_FIELDS = (
+    "time: An integer representing the elapsed time in seconds since the start of the route.\n"
+    "    cell1, distance1, cell2, distance2, …, cell5, distance5: The candidate cell tower IDs and their "
+    "respective distances (in meters) from the user's current position."
+)
+
+
+class TrajectoryEncoding(NamedTuple):
+    """A way of writing a trajectory window into the prompt."""
+    name: str
+    description: str  # Tells the LLM how to read the encoded data
+    encode: Callable[[np.ndarray, int], str]  # (trajectory array, prediction timestamp) -> text
+
+
+def encode_csv(data: np.ndarray, timestamp: int) -> str:
+    """The full window as CSV, one row per second."""
+    return trajectory_to_csv(data)
+
+
+def encode_rle(data: np.ndarray, timestamp: int) -> str:
+    """
+    Run-length encoding of serving-cell segments: one line per stretch of time with
+    the same cell1, with the serving distance at both ends and the other candidate
+    cells at the end of the segment.
+    """
+    if len(data) == 0:
+        return ""
+    serving = data[:, 1]
+    # A segment starts at the first row, on every serving cell change and after a gap in time
+    starts = np.flatnonzero(np.r_[True, (serving[1:] != serving[:-1]) | (np.diff(data[:, 0]) != 1)])
+    ends = np.r_[starts[1:], len(data)] - 1
+
+    lines = ["start,end,cell,distance_start,distance_end,neighbours"]
+    for start, end in zip(starts, ends):
+        neighbours = [str(cell) for cell in data[end, CELL_COLUMNS[1:]] if cell != MISSING_VALUE]
+        lines.append(
+            f"{data[start, 0]},{data[end, 0]},{serving[start]},{data[start, 2]},{data[end, 2]},{' '.join(neighbours)}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def encode_dictionary(data: np.ndarray, timestamp: int) -> str:
+    """
+    CSV with every cell ID replaced by a short index, preceded by the index -> cell ID legend.
+    """
+    if len(data) == 0:
+        return ""
+    cells = data[:, CELL_COLUMNS]
+    ids = np.unique(cells[cells != MISSING_VALUE])
+    encoded = data.copy()
+    present = cells != MISSING_VALUE
+    encoded_cells = np.full(cells.shape, MISSING_VALUE, dtype=np.int64)
+    encoded_cells[present] = np.searchsorted(ids, cells[present])
+    encoded[:, CELL_COLUMNS] = encoded_cells
+
+    legend = "cells: " + " ".join(f"{idx}={cell}" for idx, cell in enumerate(ids))
+    return legend + "\n" + trajectory_to_csv(encoded)
+
+
+def encode_delta(data: np.ndarray, timestamp: int) -> str:
+    """
+    CSV with delta-encoded time, cells and distances. time is the step from the
+    previous row (the first row is absolute). A cell is left empty when the same
+    slot held the same cell in the previous row, and its distance is then written
+    as a signed change (+3, -12, +0); otherwise the cell ID and absolute distance
+    are written.
+    """
+    if len(data) == 0:
+        return ""
+    cells = data[:, CELL_COLUMNS]
+    distances = data[:, DISTANCE_COLUMNS]
+    times = np.r_[data[0, 0], np.diff(data[:, 0])]
+    # Same cell in the same slot as the row before, with both distances known
+    same = np.zeros(cells.shape, dtype=bool)
+    same[1:] = (cells[1:] == cells[:-1]) & (cells[1:] != MISSING_VALUE)
+    same[1:] &= (distances[1:] != MISSING_VALUE) & (distances[:-1] != MISSING_VALUE)
+    steps = np.zeros(distances.shape, dtype=np.int64)
+    steps[1:] = distances[1:] - distances[:-1]
+
+    lines = [",".join(TRAJECTORY_COLUMNS)]
+    for row in range(len(data)):
+        fields = [str(times[row])]
+        for slot in range(len(CELL_COLUMNS)):
+            cell, distance = cells[row, slot], distances[row, slot]
+            if same[row, slot]:
+                fields.extend(["", f"{steps[row, slot]:+d}"])
+            else:
+                fields.extend([
+                    "" if cell == MISSING_VALUE else str(cell),
+                    "" if distance == MISSING_VALUE else str(distance),
+                ])
+        lines.append(",".join(fields))
+    return "\n".join(lines) + "\n"
+
+
+def encode_adaptive(data: np.ndarray, timestamp: int) -> str:
+    """
+    CSV keeping every row close to the prediction timestamp and every serving cell
+    change, but only one row every ADAPTIVE_STEP seconds elsewhere.
+    """
+    if len(data) == 0:
+        return ""
+    times = data[:, 0]
+    serving = data[:, 1]
+    keep = (times >= timestamp - ADAPTIVE_RECENT) & (times <= timestamp + ADAPTIVE_HORIZON)
+    keep |= times % ADAPTIVE_STEP == 0
+    # Rows right before and at a handover show where the serving cell changes
+    changes = np.flatnonzero(serving[1:] != serving[:-1])
+    keep[changes] = True
+    keep[changes + 1] = True
+    keep[[0, -1]] = True
+    return trajectory_to_csv(data[keep])
+
+
+TRAJECTORY_ENCODINGS: Dict[str, TrajectoryEncoding] = {
+    "csv": TrajectoryEncoding(
+        "csv",
+        "The input CSV has the following fields:\n\n    " + _CSV_FIELDS,
+        encode_csv,
+    ),
+    "rle": TrajectoryEncoding(
+        "rle",
+        "The input CSV has one line per segment of time during which the user stays closest to the same cell tower:\n\n"
+        "    start, end: First and last second of the segment, in elapsed seconds since the start of the route.\n"
+        "    cell: The closest (serving) cell tower ID during the segment.\n"
+        "    distance_start, distance_end: Distance (in meters) to that tower at the start and end of the segment.\n"
+        "    neighbours: The other candidate cell tower IDs (within 2 km) at the end of the segment.",
+        encode_rle,
+    ),
+    "dictionary": TrajectoryEncoding(
+        "dictionary",
+        "The input starts with a legend line 'cells: index=cell_tower_id ...'. The CSV that follows has the "
+        "following fields, where every cell is given by its legend index; always answer with the real cell "
+        "tower ID from the legend:\n\n    " + _CSV_FIELDS,
+        encode_dictionary,
+    ),
+    "delta": TrajectoryEncoding(
+        "delta",
+        "The input CSV is delta encoded. time is the number of seconds since the previous row (the first row "
+        "holds the absolute elapsed time). An empty cell means the same cell tower as in the previous row, and "
+        "its distance is then the signed change since the previous row (+3, -12, +0); otherwise the cell tower "
+        "ID and its absolute distance are given. The fields are:\n\n    " + _CSV_FIELDS,
+        encode_delta,
+    ),
+    "adaptive": TrajectoryEncoding(
+        "adaptive",
+        f"The input CSV has one row per second for the {ADAPTIVE_HORIZON} seconds after the prediction time and "
+        f"around every change of the closest cell tower, and one row every {ADAPTIVE_STEP} seconds elsewhere. "
+        "The fields are:\n\n    " + _CSV_FIELDS,
+        encode_adaptive,
+    ),
+}
+
+
+def get_trajectory_encoding(name: str) -> TrajectoryEncoding:
+    """
+    Look up a trajectory encoding by name.
+
+    Raises:
+        ValueError: Unknown encoding.
+    """
+    try:
+        return TRAJECTORY_ENCODINGS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown trajectory encoding '{name}', expected one of: {', '.join(TRAJECTORY_ENCODINGS)}"
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate LLM token count: words, runs of up to three digits and single
+    punctuation characters each count as one token.
+    """
+    return len(re.findall(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]", text))
+
+
+def encoding_report(data: np.ndarray, timestamp: int) -> Dict[str, Dict[str, int]]:
+    """
+    Size of the encoded window, in characters and estimated tokens, for every encoding.
+    """
+    report = {}
+    for name, encoding in TRAJECTORY_ENCODINGS.items():
+        text = encoding.encode(data, timestamp)
+        report[name] = {"chars": len(text), "tokens": estimate_tokens(text)}
+    return report
@@ -0,0 +1,95 @@
+"""
+Stand-in for the Gemini chat model, for load tests and offline runs.
+
+FakeChatModel answers the recommendation prompt after a simulated latency, without
+any network call. It is selected with LLM_BACKEND=fake, or passed as `llm` to
+NetworkAgentManager.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from .encoding import estimate_tokens
+
+# Candidate towers and the serving cell, as rendered into the recommendation prompt
+_LOADS_PATTERN = re.compile(r"['\"]?(\d+)['\"]?\s*:\s*([\d.]+)")
+_CURRENT_CELL_PATTERN = re.compile(r"current cell_tower_id is (\d+)")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with a recommendation JSON after a simulated delay.
+
+    Latency is log-normal around `latency_ms` (`latency_sigma`=0 makes it constant).
+    Unless fixed `responses` are given, the answer picks one of the towers of the
+    prompt's load map, preferring lightly loaded ones, or the current cell when the
+    prompt has none. A fraction `malformed_rate` of answers is not valid JSON.
+    """
+
+    latency_ms: float = 500.0
+    latency_sigma: float = 0.0
+    responses: Optional[List[str]] = None
+    malformed_rate: float = 0.0
+    seed: Optional[int] = None
+    calls: int = 0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._latency())
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._latency())
+        return self._result(messages)
+
+    def _latency(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return self._rng.lognormvariate(0.0, self.latency_sigma) * self.latency_ms / 1000
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        self.calls += 1
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = self._answer(prompt)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": estimate_tokens(prompt),
+                "output_tokens": estimate_tokens(text),
+                "total_tokens": estimate_tokens(prompt) + estimate_tokens(text),
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _answer(self, prompt: str) -> str:
+        if self._rng.random() < self.malformed_rate:
+            return "I could not determine the optimal handover tower from the data."
+        if self.responses:
+            return self._rng.choice(self.responses)
+
+        loads_start = prompt.find("cell tower load on multiple towers as:")
+        loads = _LOADS_PATTERN.findall(prompt[loads_start:prompt.find("\n", loads_start)]) if loads_start >= 0 else []
+        if loads:
+            # Lightly loaded towers are more likely, like a model that takes the loads into account
+            scale = 100.0 if max(float(load) for _, load in loads) > 1 else 1.0
+            weights = [max(0.05, 1.0 - float(load) / scale) for _, load in loads]
+            tower = self._rng.choices([tower for tower, _ in loads], weights=weights)[0]
+        else:
+            current = _CURRENT_CELL_PATTERN.search(prompt)
+            tower = current.group(1) if current else "0"
+        answer = {"optimal_handover_tower": int(tower), "reason": "Simulated recommendation"}
+        return f"```json\n{json.dumps(answer)}\n```"
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import math
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from .database import TRAJECTORY_COLUMNS, invalidate_user_trajectory
+
+logger = logging.getLogger(__name__)
+
+# Columns of an ingested row, in insert order
+INGEST_COLUMNS = ["user_id"] + TRAJECTORY_COLUMNS
+# time, cell1 and distance1 are required, the other candidate cells are optional
+REQUIRED_COLUMNS = TRAJECTORY_COLUMNS[:3]
+# Values are stored as SQLite integers and read back as int64
+INT64_MIN = -(2 ** 63)
+INT64_MAX = 2 ** 63 - 1
+
+_INSERT_SQL = (
+    f"INSERT INTO user_trajectory ({', '.join(INGEST_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(INGEST_COLUMNS))})"
+)
+
+
+class IngestBufferFull(Exception):
+    """Raised when the ingestion buffer has no room for new rows within the timeout."""
+
+
+class TrajectoryWriteBuffer:
+    """
+    In-memory buffer between the ingestion endpoint and the `user_trajectory` table.
+
+    Rows are flushed in one batched transaction whenever `flush_rows` rows are
+    buffered or `flush_interval` seconds have passed. Buffered and in-flight rows
+    never exceed `max_rows`; writers wait for room and are rejected with
+    IngestBufferFull when none frees up in time.
+
+    A flush failing because the database is locked or busy keeps its rows buffered
+    for the next one. Any other failure would fail again on every retry and block
+    the rows behind it, so the batch is dropped and counted instead.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        max_rows: int = 200_000,
+        flush_rows: int = 5_000,
+        flush_interval: float = 0.5,
+    ):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.rows_dropped = 0
+        self.batches_dropped = 0
+        self.flushes = 0
+        self._rows: List[tuple] = []
+        self._in_flight = 0
+        self._space: Optional[asyncio.Condition] = None
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        """Start the background flush loop."""
+        self._space = asyncio.Condition()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write out whatever is still buffered."""
+        if self._task is not None:
+            # Wake the loop rather than cancelling it, so a flush in progress completes
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def add(self, rows: List[tuple], timeout: Optional[float] = None) -> None:
+        """
+        Buffer rows shaped like INGEST_COLUMNS, waiting up to `timeout` seconds for room.
+
+        Raises:
+            IngestBufferFull: No room was freed in time.
+            ValueError: More rows than the whole buffer can hold.
+        """
+        if len(rows) > self.max_rows:
+            raise ValueError(f"Cannot buffer {len(rows)} rows at once, the limit is {self.max_rows}")
+
+        loop = asyncio.get_running_loop()
+        # One deadline for the whole wait, every flush wakes the writers up again
+        deadline = None if timeout is None else loop.time() + timeout
+        async with self._space:
+            while len(self._rows) + self._in_flight + len(rows) > self.max_rows:
+                self._flush_requested.set()
+                remaining = None if deadline is None else deadline - loop.time()
+                try:
+                    if remaining is not None and remaining <= 0:
+                        raise asyncio.TimeoutError
+                    await asyncio.wait_for(self._space.wait(), remaining)
+                except asyncio.TimeoutError:
+                    self.rows_rejected += len(rows)
+                    raise IngestBufferFull(f"Ingestion buffer is full ({self.max_rows} rows)")
+            self._rows.extend(rows)
+            if len(self._rows) >= self.flush_rows:
+                self._flush_requested.set()
+
+    async def flush(self) -> None:
+        """Write all buffered rows in a single transaction."""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            async with self._space:
+                rows, self._rows = self._rows, []
+                self._in_flight = len(rows)
+            if not rows:
+                return
+            try:
+                await self._write(rows)
+                self.rows_written += len(rows)
+                self.flushes += 1
+            except Exception as e:
+                if not _is_transient(e):
+                    logger.error(f"Error flushing {len(rows)} trajectory rows, dropping them", exc_info=True)
+                    self.rows_dropped += len(rows)
+                    self.batches_dropped += 1
+                    return
+                logger.error(f"Error flushing {len(rows)} trajectory rows, keeping them buffered", exc_info=True)
+                async with self._space:
+                    self._rows[:0] = rows
+                raise
+            finally:
+                async with self._space:
+                    self._in_flight = 0
+                    self._space.notify_all()
+
+            # Cached windows of these users are stale now
+            for user_id in {row[0] for row in rows}:
+                invalidate_user_trajectory(user_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered_rows": len(self._rows),
+            "in_flight_rows": self._in_flight,
+            "max_rows": self.max_rows,
+            "rows_written": self.rows_written,
+            "rows_rejected": self.rows_rejected,
+            "rows_dropped": self.rows_dropped,
+            "batches_dropped": self.batches_dropped,
+            "flushes": self.flushes,
+        }
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Already logged, the rows are retried on the next flush
+                if not self._stopping:
+                    await asyncio.sleep(self.flush_interval)
+
+    async def _write(self, rows: List[tuple]) -> None:
+        async with self.session_factory() as session:
+            await session.run_sync(lambda sync_session: _insert_rows(sync_session.connection(), rows))
+            await session.commit()
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed write may succeed when retried: the database was locked or busy."""
+    if isinstance(error, OperationalError):
+        error = error.orig
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _insert_rows(connection, rows: List[tuple]) -> None:
+    cursor = connection.connection.cursor()
+    try:
+        cursor.executemany(_INSERT_SQL, rows)
+    finally:
+        cursor.close()
+
+
+def _row_values(user_id, row: Dict) -> tuple:
+    """Convert one row object to an INGEST_COLUMNS tuple."""
+    if not isinstance(row, dict):
+        raise ValueError(f"Trajectory rows must be objects, got {type(row).__name__}")
+    for name in REQUIRED_COLUMNS:
+        if row.get(name) is None:
+            raise ValueError(f"Trajectory row is missing '{name}'")
+    return (str(user_id),) + tuple(
+        None if row.get(name) is None else _int64_value(name, row[name]) for name in TRAJECTORY_COLUMNS
+    )
+
+
+def _int64_value(name: str, value) -> int:
+    """The value of a trajectory column as an integer, or ValueError when it does not fit an int64."""
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(f"Trajectory row field '{name}' is not a finite number")
+    value = int(value)
+    if not INT64_MIN <= value <= INT64_MAX:
+        raise ValueError(f"Trajectory row field '{name}' is out of the int64 range")
+    return value
+
+
+def parse_json_rows(payload) -> List[tuple]:
+    """
+    Parse a JSON ingestion payload: one {"user_id": ..., "rows": [...]} object or a
+    list of them, each row an object with the TRAJECTORY_COLUMNS fields.
+    """
+    batches = payload if isinstance(payload, list) else [payload]
+    rows = []
+    for batch in batches:
+        if not isinstance(batch, dict) or "user_id" not in batch or not isinstance(batch.get("rows", []), list):
+            raise ValueError("Each batch needs a 'user_id' and a list of 'rows'")
+        rows.extend(_row_values(batch["user_id"], row) for row in batch.get("rows", []))
+    return rows
+
+
+def parse_ndjson_rows(lines: Iterable[bytes]) -> List[tuple]:
+    """
+    Parse newline-delimited JSON, one row object with its own "user_id" per line.
+    """
+    rows = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row = json.loads(line)
+        if not isinstance(row, dict) or "user_id" not in row:
+            raise ValueError("Each NDJSON row needs to be an object with a 'user_id'")
+        rows.append(_row_values(row["user_id"], row))
+    return rows
@@ -0,0 +1,270 @@
+"""
+Streaming bulk loader for the trajectory CSV.
+
+Reads the CSV in chunks of lines and inserts them with executemany, so memory stays
+bounded whatever the file size. Each checkpoint interval is one transaction run with
+bulk-load PRAGMAs, which also saves the byte offset reached and the ids of the rows
+inserted to the trajectory_load_checkpoint table, so an interrupted load resumes where
+it stopped; a load started over (--restart, or another file) first deletes the rows of
+the unfinished one. When the table starts out empty and nothing serves from it, the
+trajectory indexes are dropped for the load and rebuilt once at the end.
+
+Sample usage (from the repository root):
+    python -m api.loader data/user_trajectory.csv --db user_trajectory.db
+
+Arguments:
+    csv_path: Path to the trajectory CSV (user_id, time, cell1, distance1 ... cell5, distance5).
+    --db: SQLite database file (default: the one of DATABASE_URL).
+    --chunk-rows: Rows per executemany batch (default: 50000).
+    --checkpoint-rows: Rows per transaction / checkpoint (default: 1000000).
+    --restart: Delete the rows of an unfinished load and load the file from the start.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from itertools import islice
+from typing import Callable, Optional
+
+from sqlalchemy import create_engine
+
+from .database import Base, TrajectoryLoadCheckpoint, UserTrajectory, TRAJECTORY_COLUMNS, engine
+
+# Columns inserted from the CSV, other CSV columns (e.g. id) are ignored
+LOAD_COLUMNS = ["user_id"] + TRAJECTORY_COLUMNS
+
+_INSERT_SQL = (
+    f"INSERT INTO user_trajectory ({', '.join(LOAD_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(LOAD_COLUMNS))})"
+)
+
+_CHECKPOINT_TABLE = TrajectoryLoadCheckpoint.__tablename__
+_SAVE_CHECKPOINT_SQL = (
+    f"INSERT OR REPLACE INTO {_CHECKPOINT_TABLE} (id, csv_path, csv_size, offset, rows, id_ranges) "
+    "VALUES (1, ?, ?, ?, ?, ?)"
+)
+
+# Trade durability for speed while loading, a crash is covered by the checkpoint
+_BULK_LOAD_PRAGMAS = [
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",  # 64 MB page cache
+]
+
+
+def load_trajectory_csv(
+    csv_path: str,
+    db_path: str,
+    chunk_rows: int = 50_000,
+    checkpoint_rows: int = 1_000_000,
+    resume: bool = True,
+    drop_indexes: bool = True,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> int:
+    """
+    Stream a trajectory CSV into the user_trajectory table.
+
+    Args:
+        csv_path: Path to the CSV file, with a header row.
+        db_path: SQLite database file.
+        chunk_rows: Rows parsed and inserted per executemany call.
+        checkpoint_rows: Rows per transaction, each one saving the checkpoint.
+        resume: Continue an unfinished load of the same file; otherwise its rows are
+            deleted and the file is loaded from the start.
+        drop_indexes: Drop the trajectory indexes while loading into an empty table;
+            False keeps them, for a table that is read from during the load.
+        progress: Called as progress(rows_loaded, bytes_read, bytes_total) after each chunk.
+
+    Returns:
+        int: Rows loaded by this call.
+    """
+    csv_size = os.path.getsize(csv_path)
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    indexes = list(UserTrajectory.__table__.indexes)
+
+    connection = sync_engine.raw_connection()
+    loaded = 0
+    try:
+        cursor = connection.cursor()
+        checkpoint = _read_checkpoint(cursor)
+        if checkpoint is not None and not (resume and _same_file(checkpoint, csv_path, csv_size)):
+            # Starting over: the rows of the unfinished load would be loaded twice
+            _delete_loaded_rows(cursor, checkpoint)
+            connection.commit()
+            checkpoint = None
+
+        empty = cursor.execute("SELECT 1 FROM user_trajectory LIMIT 1").fetchone() is None
+        with sync_engine.begin() as conn:
+            for index in indexes:
+                if drop_indexes and empty:
+                    index.drop(conn, checkfirst=True)
+                elif not drop_indexes:
+                    # An interrupted load may have dropped them
+                    index.create(conn, checkfirst=True)
+
+        for pragma in _BULK_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+
+        with open(csv_path, "rb") as f:
+            header = next(csv.reader([f.readline().decode("utf-8")]))
+            positions = _column_positions(header)
+            offset = f.tell()
+            total_rows = 0
+            id_ranges = []
+            if checkpoint is not None:
+                offset, total_rows, id_ranges = checkpoint["offset"], checkpoint["rows"], checkpoint["id_ranges"]
+                f.seek(offset)
+
+            first_id = None
+            uncommitted = 0
+            while True:
+                lines = list(islice(f, chunk_rows))
+                if not lines:
+                    break
+                offset += sum(len(line) for line in lines)
+                rows = [
+                    _row_values(values, positions)
+                    for values in csv.reader(line.decode("utf-8") for line in lines)
+                    if values
+                ]
+                if first_id is None:
+                    first_id = _begin(cursor)
+                cursor.executemany(_INSERT_SQL, rows)
+                loaded += len(rows)
+                total_rows += len(rows)
+                uncommitted += len(rows)
+
+                if uncommitted >= checkpoint_rows:
+                    id_ranges.append([first_id, _last_id(cursor)])
+                    cursor.execute(
+                        _SAVE_CHECKPOINT_SQL,
+                        (os.path.abspath(csv_path), csv_size, offset, total_rows, json.dumps(id_ranges)),
+                    )
+                    connection.commit()
+                    first_id = None
+                    uncommitted = 0
+                if progress is not None:
+                    progress(total_rows, offset, csv_size)
+
+        # The last rows and the end of the load commit together
+        cursor.execute(f"DELETE FROM {_CHECKPOINT_TABLE}")
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    # Building the indexes once is much cheaper than maintaining them row by row
+    with sync_engine.begin() as conn:
+        for index in indexes:
+            index.create(conn, checkfirst=True)
+    sync_engine.dispose()
+    return loaded
+
+
+def has_unfinished_load(db_path: str) -> bool:
+    """Whether an interrupted load left a checkpoint behind."""
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (_CHECKPOINT_TABLE,)
+        ).fetchone()
+        return exists is not None and _read_checkpoint(cursor) is not None
+    finally:
+        connection.close()
+
+
+def _begin(cursor) -> int:
+    """Open a write transaction; returns the id its first inserted row will get."""
+    # Taking the write lock first keeps other writers from interleaving rows
+    cursor.execute("BEGIN IMMEDIATE")
+    return _last_id(cursor) + 1
+
+
+def _last_id(cursor) -> int:
+    return cursor.execute("SELECT COALESCE(MAX(id), 0) FROM user_trajectory").fetchone()[0]
+
+
+def _column_positions(header):
+    """Position of every LOAD_COLUMNS column in the CSV header, None when absent."""
+    header = [name.strip() for name in header]
+    for name in ["user_id"] + TRAJECTORY_COLUMNS[:3]:
+        if name not in header:
+            raise ValueError(f"CSV header is missing the '{name}' column")
+    return [header.index(name) if name in header else None for name in LOAD_COLUMNS]
+
+
+def _row_values(values, positions) -> tuple:
+    row = [None if position is None else values[position] for position in positions]
+    return (row[0],) + tuple(_to_int(value) for value in row[1:])
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        # pandas writes integer columns with missing values as floats
+        return int(float(value))
+
+
+def _read_checkpoint(cursor):
+    row = cursor.execute(f"SELECT csv_path, csv_size, offset, rows, id_ranges FROM {_CHECKPOINT_TABLE}").fetchone()
+    if row is None:
+        return None
+    return {"csv_path": row[0], "csv_size": row[1], "offset": row[2], "rows": row[3], "id_ranges": json.loads(row[4])}
+
+
+def _same_file(checkpoint, csv_path: str, csv_size: int) -> bool:
+    # Only resume a load of the very same file
+    return checkpoint["csv_path"] == os.path.abspath(csv_path) and checkpoint["csv_size"] == csv_size
+
+
+def _delete_loaded_rows(cursor, checkpoint) -> None:
+    for first_id, last_id in checkpoint["id_ranges"]:
+        cursor.execute("DELETE FROM user_trajectory WHERE id BETWEEN ? AND ?", (first_id, last_id))
+    cursor.execute(f"DELETE FROM {_CHECKPOINT_TABLE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a trajectory CSV into the user_trajectory table.")
+    parser.add_argument("csv_path", help="Path to the trajectory CSV")
+    parser.add_argument("--db", default=engine.url.database,
+                        help="SQLite database file (default: the one of DATABASE_URL)")
+    parser.add_argument("--chunk-rows", type=int, default=50_000,
+                        help="Rows per executemany batch (default: 50000)")
+    parser.add_argument("--checkpoint-rows", type=int, default=1_000_000,
+                        help="Rows per transaction / checkpoint (default: 1000000)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Delete the rows of an unfinished load and load the file from the start")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def report(rows, bytes_read, bytes_total):
+        elapsed = time.perf_counter() - started
+        sys.stdout.write(
+            f"\r{rows:,} rows, {bytes_read / max(1, bytes_total):6.1%} of the file, "
+            f"{rows / max(elapsed, 1e-9):,.0f} rows/s"
+        )
+        sys.stdout.flush()
+
+    loaded = load_trajectory_csv(
+        args.csv_path,
+        args.db,
+        chunk_rows=args.chunk_rows,
+        checkpoint_rows=args.checkpoint_rows,
+        resume=not args.restart,
+        progress=report,
+    )
+    print(f"\nLoaded {loaded:,} rows into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
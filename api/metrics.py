@@ -0,0 +1,186 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "mobility_"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds, with their count and sum.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One more slot for values above the last bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate the q-quantile (0..1) by linear interpolation inside its bucket.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                # Values above the last bound are reported at that bound
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Count, total and mean seconds and estimated p50/p95/p99."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class StageTimings:
+    """
+    Latency histograms of the stages of a prediction (trajectory fetch, serialization,
+    LLM call, parse, ...), one histogram per stage name.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms: Dict[str, Histogram] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Record the duration of the enclosed block under `stage`, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return {stage: histogram.snapshot() for stage, histogram in self.histograms.items()}
+
+    def reset(self) -> None:
+        self.histograms.clear()
+
+    def render(self, name: str, documentation: str) -> List[str]:
+        """Prometheus text lines of all stages, as one histogram labelled by stage."""
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        return lines
+
+
+class Counter:
+    """
+    Monotonically increasing count, one value per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(zip(self.labelnames, key))} {value}")
+        return lines
+
+
+def render_gauges(gauges: Iterable[Tuple[str, str, float]]) -> List[str]:
+    """Prometheus text lines of (name, documentation, value) gauges read at scrape time."""
+    lines = []
+    for name, documentation, value in gauges:
+        lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"])
+    return lines
+
+
+def render_prometheus(gauges: Iterable[Tuple[str, str, float]] = ()) -> str:
+    """
+    All metrics of this process in the Prometheus text exposition format: the
+    prediction stage histograms, the counters and the given gauges.
+    """
+    lines = stage_timings.render(
+        f"{METRIC_PREFIX}prediction_stage_seconds", "Duration of each stage of a prediction."
+    )
+    for counter in COUNTERS:
+        lines.extend(counter.render())
+    lines.extend(render_gauges(gauges))
+    return "\n".join(lines) + "\n"
+
+
+def _labels(pairs) -> str:
+    rendered = [f'{name}="{_escape(value)}"' for name, value in pairs]
+    return "{" + ",".join(rendered) + "}" if rendered else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Stage timings of every prediction served by this process
+stage_timings = StageTimings()
+
+PREDICTIONS = Counter(f"{METRIC_PREFIX}predictions_total", "Predictions served, by answering source.", ["source"])
+PREDICTION_ERRORS = Counter(f"{METRIC_PREFIX}prediction_errors_total", "Predictions that failed with an error.")
+PREDICTION_FALLBACKS = Counter(
+    f"{METRIC_PREFIX}prediction_fallbacks_total", "Predictions answered by the local fallback, by cause.", ["cause"]
+)
+LLM_CALLS = Counter(f"{METRIC_PREFIX}llm_calls_total", "Calls to the recommendation LLM.")
+LLM_HEDGES = Counter(f"{METRIC_PREFIX}llm_hedges_total", "Hedged second requests sent to the recommendation LLM.")
+LLM_TOKENS = Counter(
+    f"{METRIC_PREFIX}llm_tokens_total", "Tokens sent to and received from the recommendation LLM.", ["direction"]
+)
+PRECOMPUTE_COMPUTED = Counter(f"{METRIC_PREFIX}precompute_computed_total", "Predictions computed ahead of time.")
+PRECOMPUTE_USED = Counter(f"{METRIC_PREFIX}precompute_used_total", "Requests answered by a precomputed prediction.")
+PRECOMPUTE_WASTED = Counter(
+    f"{METRIC_PREFIX}precompute_wasted_total", "Precomputed predictions evicted or expired without being used."
+)
+PRECOMPUTE_STALE = Counter(
+    f"{METRIC_PREFIX}precompute_stale_total", "Precomputed predictions skipped because the loads drifted."
+)
+COUNTERS = [
+    PREDICTIONS, PREDICTION_ERRORS, PREDICTION_FALLBACKS, LLM_CALLS, LLM_HEDGES, LLM_TOKENS,
+    PRECOMPUTE_COMPUTED, PRECOMPUTE_USED, PRECOMPUTE_WASTED, PRECOMPUTE_STALE,
+]
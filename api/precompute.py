@@ -0,0 +1,287 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+from .cache import LRUCache
+from .database import MISSING_VALUE, get_user_trajectory_window
+from .metrics import PRECOMPUTE_COMPUTED, PRECOMPUTE_STALE, PRECOMPUTE_USED, PRECOMPUTE_WASTED
+from .services import _normalized_loads
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest observation in the moving average of the time between requests
+_EMA_WEIGHT = 0.3
+
+
+class PrecomputedPredictions(LRUCache):
+    """
+    Table of speculatively computed predictions keyed on (user, serving cell,
+    timestamp bucket). Each entry keeps the tower loads it was computed with and is
+    only served while the request's loads stay within `load_tolerance` of them.
+    Entries evicted or expired without ever being served are counted as wasted.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: Optional[float] = None,
+        timestamp_bucket: int = 10,
+        load_tolerance: float = 0.1,
+    ):
+        super().__init__(max_size=max_entries, ttl=ttl, on_evict=self._evicted)
+        self.timestamp_bucket = max(1, timestamp_bucket)
+        self.load_tolerance = load_tolerance
+        self.computed = 0
+        self.used = 0
+        self.wasted = 0
+        self.stale = 0
+
+    def make_key(self, user_id: str, current_cell_tower, timestamp: int) -> tuple:
+        return (user_id, str(current_cell_tower), timestamp // self.timestamp_bucket)
+
+    def store(self, user_id: str, current_cell_tower, timestamp: int, loads: Dict[str, float], result: Dict) -> None:
+        """
+        Keep `result`, computed with `loads` (normalized to 0..1), for later lookups.
+        """
+        key = self.make_key(user_id, current_cell_tower, timestamp)
+        self.put(key, {"result": dict(result), "loads": loads, "used": False})
+        self.computed += 1
+        PRECOMPUTE_COMPUTED.inc()
+
+    def lookup(self, user_id: str, current_cell_tower, timestamp: int, loads: Dict[str, float]) -> Optional[Dict]:
+        """
+        Return the precomputed result of a request, or None when there is none or the
+        loads (normalized to 0..1) have drifted past the tolerance since it was computed.
+        """
+        entry = self.get(self.make_key(user_id, current_cell_tower, timestamp))
+        if entry is None:
+            return None
+        if not _loads_within(entry["loads"], loads, self.load_tolerance):
+            self.stale += 1
+            PRECOMPUTE_STALE.inc()
+            return None
+        entry["used"] = True
+        self.used += 1
+        PRECOMPUTE_USED.inc()
+        return dict(entry["result"])
+
+    def has(self, user_id: str, current_cell_tower, timestamp: int) -> bool:
+        return self.make_key(user_id, current_cell_tower, timestamp) in self
+
+    def stats(self) -> Dict[str, float]:
+        stats = super().stats()
+        stats.update(computed=self.computed, used=self.used, wasted=self.wasted, stale=self.stale)
+        return stats
+
+    def _evicted(self, key: Hashable, entry: Dict) -> None:
+        if not entry["used"]:
+            self.wasted += 1
+            PRECOMPUTE_WASTED.inc()
+
+
+class ActiveUser:
+    """Request history of one user, used to anticipate their next requests."""
+
+    __slots__ = (
+        "user_id", "last_seen", "request_interval", "last_timestamp",
+        "current_cell_tower", "cell_tower_loads", "precomputed_until",
+    )
+
+    def __init__(self, user_id: str, now: float, timestamp: int, current_cell_tower, cell_tower_loads: Dict):
+        self.user_id = user_id
+        self.last_seen = now
+        self.request_interval: Optional[float] = None  # Wall-clock seconds between requests
+        self.last_timestamp = timestamp
+        self.current_cell_tower = current_cell_tower
+        self.cell_tower_loads = cell_tower_loads
+        self.precomputed_until = timestamp
+
+    @property
+    def next_expected(self) -> float:
+        """Monotonic time the next request of the user is expected at."""
+        return self.last_seen + (self.request_interval or 0.0)
+
+
+class PrecomputeScheduler:
+    """
+    Background precomputation of the upcoming predictions of active users.
+
+    Every prediction request marks its user active. While a user's precomputed
+    results do not reach `horizon` seconds past their latest request timestamp, the
+    user is queued for precomputation, the users expected to ask again soonest first.
+    A bounded pool of `workers` tasks computes one prediction per timestamp bucket up
+    to the horizon, with the serving cell taken from the trajectory at that time and
+    the latest loads seen, and stores them in `store`. Users idle for `idle_after`
+    seconds stop being precomputed.
+    """
+
+    def __init__(
+        self,
+        manager,
+        session_factory,
+        store: PrecomputedPredictions,
+        horizon: int = 60,
+        workers: int = 4,
+        max_users: int = 10_000,
+        idle_after: float = 300.0,
+        sweep_interval: float = 5.0,
+    ):
+        self.manager = manager
+        self.session_factory = session_factory
+        self.store = store
+        self.horizon = horizon
+        self.workers = workers
+        self.max_users = max_users
+        self.idle_after = idle_after
+        self.sweep_interval = sweep_interval
+        self.users: "OrderedDict[str, ActiveUser]" = OrderedDict()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._queued = set()
+        self._sequence = itertools.count()
+        self._tasks = []
+        self._stopping = False
+        self._wake: Optional[asyncio.Event] = None
+
+    def observe(self, user_id: str, timestamp: int, current_cell_tower, cell_tower_loads: Dict) -> None:
+        """
+        Record a prediction request of a user and queue the user if their
+        precomputed results run short.
+        """
+        now = time.monotonic()
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = ActiveUser(user_id, now, timestamp, current_cell_tower, cell_tower_loads)
+            while len(self.users) > self.max_users:
+                self.users.popitem(last=False)
+        else:
+            self.users.move_to_end(user_id)
+            user.request_interval = _ema(user.request_interval, now - user.last_seen)
+            user.last_seen = now
+            user.last_timestamp = max(user.last_timestamp, timestamp)
+            user.current_cell_tower = current_cell_tower
+            user.cell_tower_loads = cell_tower_loads
+        self._schedule(user)
+
+    async def start(self) -> None:
+        """Start the worker pool and the sweep loop."""
+        self._queue = asyncio.PriorityQueue()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self) -> None:
+        """Stop the workers once their current precomputation completes."""
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wake.set()
+        for _ in range(self.workers):
+            # Sorts after every real job, and wakes a worker waiting on an empty queue
+            self._queue.put_nowait((math.inf, next(self._sequence), None))
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active_users": len(self.users),
+            "queued_users": len(self._queued),
+            "workers": self.workers,
+            **self.store.stats(),
+        }
+
+    def _schedule(self, user: ActiveUser) -> None:
+        if self._queue is None or self._stopping or user.user_id in self._queued:
+            return
+        if user.precomputed_until >= user.last_timestamp + self.horizon // 2:
+            return
+        self._queued.add(user.user_id)
+        self._queue.put_nowait((user.next_expected, next(self._sequence), user.user_id))
+
+    async def _work(self) -> None:
+        while True:
+            _, _, user_id = await self._queue.get()
+            if user_id is None or self._stopping:
+                return
+            self._queued.discard(user_id)
+            user = self.users.get(user_id)
+            if user is None:
+                continue
+            try:
+                await self._precompute(user)
+            except Exception:
+                logger.warning(f"Error precomputing predictions for user_id: {user_id}", exc_info=True)
+
+    async def _precompute(self, user: ActiveUser) -> None:
+        bucket = self.store.timestamp_bucket
+        # Requests land in the buckets of the timestamps ahead of the latest one
+        first = (max(user.precomputed_until, user.last_timestamp) // bucket + 1) * bucket
+        last = user.last_timestamp + self.horizon
+        if first > last:
+            return
+
+        agent = self.manager.get_agent(user.user_id)
+        loads = user.cell_tower_loads
+        normalized = _normalized_loads(loads)
+        async with self.session_factory() as db:
+            trajectory = await get_user_trajectory_window(user.user_id, first, last, db)
+            for timestamp in range(first, last + 1, bucket):
+                if self._stopping:
+                    return
+                current_cell_tower = _serving_cell(trajectory, timestamp, user.current_cell_tower)
+                if not self.store.has(user.user_id, current_cell_tower, timestamp):
+                    result = await agent.precompute_best_cell_towers(
+                        user.user_id, loads, timestamp, current_cell_tower, db
+                    )
+                    # A fallback stands in for a failed LLM call, it is not worth keeping
+                    if result["source"] != "fallback":
+                        self.store.store(user.user_id, current_cell_tower, timestamp, normalized, result)
+                user.precomputed_until = timestamp
+
+    async def _sweep(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                return
+            now = time.monotonic()
+            idle = [user_id for user_id, user in self.users.items() if now - user.last_seen > self.idle_after]
+            for user_id in idle:
+                del self.users[user_id]
+            self.store.expire()
+            # Users whose horizon moved on without a new request being seen
+            for user in self.users.values():
+                self._schedule(user)
+
+
+def _serving_cell(trajectory: np.ndarray, timestamp: int, default):
+    """cell1 of the trajectory at `timestamp`, `default` when unknown."""
+    if len(trajectory) == 0:
+        return default
+    idx = min(int(np.searchsorted(trajectory[:, 0], timestamp)), len(trajectory) - 1)
+    if trajectory[idx, 0] != timestamp or trajectory[idx, 1] == MISSING_VALUE:
+        return default
+    return str(int(trajectory[idx, 1]))
+
+
+def _loads_within(computed: Dict[str, float], current: Dict[str, float], tolerance: float) -> bool:
+    """
+    Whether no tower load known at computation time moved by more than `tolerance`.
+    Towers the user has come in range of since then have no load to compare.
+    """
+    common = computed.keys() & current.keys()
+    if current and not common:
+        return False
+    return all(abs(computed[tower] - current[tower]) <= tolerance for tower in common)
+
+
+def _ema(previous: Optional[float], value: float) -> float:
+    return value if previous is None else (1 - _EMA_WEIGHT) * previous + _EMA_WEIGHT * value
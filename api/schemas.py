@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 class LoadDataRequest(BaseModel):
     csv_file: str
@@ -13,3 +13,24 @@ class PredictRequest(BaseModel):
 class PredictResponse(BaseModel):
     optimal_handover_tower: str 
     reason: str
+    source: str = "llm"  # Which path answered: "periodicity", "llm" or "fallback"
+    confidence: Optional[float] = None
+
+
+class BatchPredictItem(BaseModel):
+    user_id: str
+    result: Optional[PredictResponse] = None
+    error: Optional[str] = None  # Set instead of result when this item failed
+
+class BatchPredictResponse(BaseModel):
+    results: List[BatchPredictItem]
+
+class IngestResponse(BaseModel):
+    accepted: int  # Rows buffered for writing
+
+class ReadinessResponse(BaseModel):
+    status: str  # "loading", "ready" or "failed"
+    rows_loaded: int = 0  # CSV rows loaded so far
+    progress: Optional[float] = None  # Fraction of the CSV read, while it loads
+    seconds: Optional[float] = None  # Duration of the data load, once finished
+    error: Optional[str] = None
@@ -1,47 +1,49 @@
-from langchain.chains import LLMChain
-from collections import defaultdict
+from collections import OrderedDict
+import asyncio
 import json
-from typing import Dict
+import logging
+import sys
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
 import re
+import time
+
+import numpy as np
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 
-# Import your database models and retrieval function.
-from .database import UserContext, get_user_trajectory_data
-
-# LangChain imports
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts.chat import (
-    ChatPromptTemplate,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
+from .cache import PredictionCache, SingleFlight
+from .config import get_fake_llm_latency_ms, get_fake_llm_latency_sigma
+from .encoding import TrajectoryEncoding, estimate_tokens, get_trajectory_encoding
+from .user_model import UserModel, UserModelStore
+from .metrics import (
+    LLM_CALLS,
+    LLM_HEDGES,
+    LLM_TOKENS,
+    PREDICTION_ERRORS,
+    PREDICTION_FALLBACKS,
+    PREDICTIONS,
+    stage_timings,
 )
-from langchain_google_genai import ChatGoogleGenerativeAI  # LLM interface
-from langchain_core.messages.ai import AIMessage
-from langchain_core.messages.human import HumanMessage
-
-
-
-
-from langchain.prompts import PromptTemplate  # Import the base PromptTemplate.
-from langchain.prompts.chat import (
-    ChatPromptTemplate,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate
+# Import your database models and retrieval function.
+from .database import (
+    CELL_COLUMNS,
+    MISSING_VALUE,
+    TRAJECTORY_COLUMNS,
+    get_user_trajectory_ranges,
+    get_user_trajectory_window,
+    trajectory_window_bounds,
 )
 
+# LangChain and the LLM clients take seconds to import, they are imported on the
+# first prompt render / LLM call instead (build_recommendation_chat_prompt, build_recommendation_llm)
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.prompts import ChatPromptTemplate
 
-recommendation_prompt = PromptTemplate(
-    input_variables=["trajectory_data", "cell_tower_loads", "timestamp", "current_cell_tower"],
-    template="""
 
-    The input CSV has the following fields:
+RECOMMENDATION_TEMPLATE = """
 
-    time: An integer representing the elapsed time in seconds since the start of the route.
-    cell1, distance1, cell2, distance2, …, cell5, distance5: The candidate cell tower IDs and their respective distances (in meters) from the user's current position.
+    {trajectory_format}
     {trajectory_data}
 
     What are the best 2-3 cell towers for handover?  Consider the historical patterns and insights from the pattern in above data.
@@ -49,32 +51,367 @@ recommendation_prompt = PromptTemplate(
     Predict the cell tower at the {timestamp}th second, to have least amount of handovers in next 100 seconds based on mobility pattern. When the current cell_tower_id is {current_cell_tower}
     Clearly give your answer in following json format: {{"optimal_handover_tower": int, "reason": "string"}}
     """
-)
 
+logger = logging.getLogger(__name__)
 
-class UserNetworkAgent:
-    def __init__(self, api_key: str, user_id: str):
-        self.user_id = user_id
-        self.llm = ChatGoogleGenerativeAI(
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+
+class PeriodicityPredictor:
+    """
+    Local, LLM-free handover predictor built on the periodicity of a user's trajectory.
+
+    The serving cell series (cell1) just before `timestamp` is compared with the same
+    stretch one or more periods earlier (daily, weekly, ...). The fraction of matching
+    seconds is the categorical autocorrelation of the series at that lag. When the
+    user repeats a route, what happened right after `timestamp` in the previous
+    cycles projects where the user is heading, and the candidate tower that stays in
+    range for the longest part of the prediction horizon (penalized by its load) is
+    recommended.
+    """
+
+    def __init__(
+        self,
+        periods: Sequence[int] = (DAY_SECONDS, WEEK_SECONDS),
+        max_cycles: int = 4,
+        min_cycles: int = 2,
+        lookback: int = 100,
+        horizon: int = 100,
+        tolerance: int = 5,
+        load_weight: float = 0.5,
+    ):
+        """
+        Args:
+            periods: Candidate periods in seconds.
+            max_cycles: How many past cycles of each period are inspected.
+            min_cycles: Cycles with data required before a prediction is made.
+            lookback: Seconds before `timestamp` used to match the cycles.
+            horizon: Seconds after `timestamp` the handover should hold for.
+            tolerance: Maximum shift in seconds when aligning a past cycle.
+            load_weight: Penalty applied to a tower's normalized load.
+        """
+        self.periods = list(periods)
+        self.max_cycles = max_cycles
+        self.min_cycles = min_cycles
+        self.lookback = lookback
+        self.horizon = horizon
+        self.tolerance = tolerance
+        self.load_weight = load_weight
+
+    async def predict(
+        self,
+        user_id: str,
+        cell_tower_loads: Dict,
+        timestamp: int,
+        current_cell_tower,
+        db: AsyncSession,
+        periods: Optional[Sequence[int]] = None,
+    ) -> Optional[Dict]:
+        """
+        Predict the handover tower from the user's periodic history.
+
+        Args:
+            periods: Periods to evaluate, all candidate periods when None.
+
+        Returns:
+            dict: optimal_handover_tower, reason and confidence (0..1), with the period
+            it is based on and the fraction of its serving cells matching, or None
+            when there are not enough past cycles to say anything.
+        """
+        periods = self.periods if periods is None else periods
+        ranges = [(max(0, timestamp - self.lookback), timestamp - 1)]
+        for period in periods:
+            for cycle in range(1, self.max_cycles + 1):
+                start = timestamp - cycle * period - self.lookback - self.tolerance
+                end = timestamp - cycle * period + self.horizon + self.tolerance
+                if end >= 0:
+                    ranges.append((max(0, start), end))
+        data = await get_user_trajectory_ranges(user_id, ranges, db)
+        return self.predict_from_history(data, cell_tower_loads, timestamp, current_cell_tower, periods)
+
+    def predict_from_history(
+        self,
+        data: np.ndarray,
+        cell_tower_loads: Dict,
+        timestamp: int,
+        current_cell_tower,
+        periods: Optional[Sequence[int]] = None,
+    ) -> Optional[Dict]:
+        """
+        Same as `predict`, on an already fetched trajectory array (rows sorted by time).
+        """
+        if len(data) == 0:
+            return None
+
+        recent = _cells_at(data, timestamp + np.arange(-self.lookback, 0))[:, 0]
+        if not (recent != MISSING_VALUE).any():
+            return None
+
+        best = None
+        for period in self.periods if periods is None else periods:
+            candidate = self._evaluate_period(data, recent, timestamp, period)
+            if candidate is not None and (best is None or candidate["match"] > best["match"]):
+                best = candidate
+        if best is None:
+            return None
+
+        loads = _normalized_loads(cell_tower_loads)
+        towers, cycle_scores = self._score_towers(best["projections"], loads)
+        if len(towers) == 0:
+            return None
+
+        # Average over cycles, ties are broken in favour of staying on the current tower
+        scores = cycle_scores.mean(axis=0)
+        order = np.flatnonzero(scores == scores.max())
+        chosen = order[0]
+        for idx in order:
+            if str(towers[idx]) == str(current_cell_tower):
+                chosen = idx
+        agreement = float(np.mean(cycle_scores.argmax(axis=1) == chosen))
+        confidence = best["match"] * agreement
+
+        tower = str(towers[chosen])
+        dwell = scores[chosen] / max(1e-9, 1 - self.load_weight * loads.get(tower, 0.0)) * self.horizon
+        return {
+            "optimal_handover_tower": tower,
+            "reason": (
+                f"User repeats its trajectory every {best['period']} seconds "
+                f"({len(best['projections'])} past cycles, {best['match']:.0%} of the serving cells matching). "
+                f"In those cycles tower {tower} stayed in range for {dwell:.0f} of the next "
+                f"{self.horizon} seconds on average, with current load {cell_tower_loads.get(tower, 'unknown')}."
+            ),
+            "confidence": round(confidence, 4),
+            "period": best["period"],
+            "match": best["match"],
+        }
+
+    def _evaluate_period(self, data: np.ndarray, recent: np.ndarray, timestamp: int, period: int) -> Optional[Dict]:
+        """
+        Align each past cycle of `period` with the recent serving cells and collect the
+        projected candidate cells for the horizon.
+        """
+        offsets = np.arange(-self.lookback, 0)
+        shifts = np.arange(-self.tolerance, self.tolerance + 1)
+        matches = []
+        projections = []
+        for cycle in range(1, self.max_cycles + 1):
+            base = timestamp - cycle * period
+            if base + self.horizon < 0:
+                break
+            # Autocorrelation at lag `cycle * period`, allowing a small shift of the cycle
+            past = _cells_at(data, base + shifts[:, None] + offsets[None, :])[..., 0]
+            valid = (past != MISSING_VALUE) & (recent != MISSING_VALUE)[None, :]
+            counts = valid.sum(axis=1)
+            if counts.max() < self.lookback // 2:
+                continue
+            fractions = ((past == recent[None, :]) & valid).sum(axis=1) / np.maximum(counts, 1)
+            shift = shifts[fractions.argmax()]
+            projection = _cells_at(data, base + shift + np.arange(self.horizon))
+            if (projection[0] == MISSING_VALUE).all():
+                continue
+            matches.append(float(fractions.max()))
+            projections.append(projection)
+
+        if len(projections) < self.min_cycles:
+            return None
+        return {"period": period, "match": float(np.mean(matches)), "projections": projections}
+
+    def _score_towers(self, projections, loads: Dict[str, float]):
+        """
+        Score every tower in range at the start of the horizon, for each projected cycle.
+
+        Returns:
+            tuple: (towers, scores) with scores of shape (cycles, towers). A tower's
+            score is the fraction of the horizon it stays in range, reduced by its load.
+        """
+        stacked = np.stack(projections)  # (cycles, horizon, 5)
+        towers = np.unique(stacked[:, 0, :])
+        towers = towers[towers != MISSING_VALUE]
+        # present[c, t, h]: tower t is a candidate cell at second h of cycle c
+        present = (stacked[:, None, :, :] == towers[None, :, None, None]).any(axis=3)
+        dwell = np.where(present.all(axis=2), self.horizon, (~present).argmax(axis=2))
+        penalty = np.array([1 - self.load_weight * loads.get(str(tower), 0.0) for tower in towers])
+        return towers, dwell / self.horizon * penalty[None, :]
+
+
+def _cells_at(data: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """
+    Look up cell1..cell5 at the given times, MISSING_VALUE where there is no row.
+    """
+    times = np.asarray(times)
+    cells = np.full(times.shape + (len(CELL_COLUMNS),), MISSING_VALUE, dtype=np.int64)
+    if len(data) == 0:
+        return cells
+    idx = np.clip(np.searchsorted(data[:, 0], times), 0, len(data) - 1)
+    found = data[idx, 0] == times
+    cells[found] = data[idx[found]][:, CELL_COLUMNS]
+    return cells
+
+
+def _normalized_loads(cell_tower_loads: Dict) -> Dict[str, float]:
+    """
+    Bring tower loads to 0..1, accepting both fractions and percentages.
+    """
+    if not cell_tower_loads:
+        return {}
+    scale = 100.0 if max(cell_tower_loads.values()) > 1 else 1.0
+    return {str(tower): min(1.0, float(load) / scale) for tower, load in cell_tower_loads.items()}
+
+
+def fallback_prediction(
+    cell_tower_loads: Dict,
+    current_cell_tower,
+    nearby_cells: Optional[Sequence] = None,
+    margin: float = 0.1,
+) -> Dict:
+    """
+    LLM-free answer: stay on the current cell, unless a nearby cell is less loaded by
+    more than `margin` (loads normalized to 0..1), in which case the least loaded
+    nearby cell is picked.
+
+    Args:
+        cell_tower_loads: Load of each tower, as in the request
+        current_cell_tower: Serving cell of the user
+        nearby_cells: Candidate cells in range of the user; every tower of
+            cell_tower_loads when unknown
+        margin: Load advantage needed to leave the current cell
+    """
+    loads = _normalized_loads(cell_tower_loads)
+    current = str(current_cell_tower)
+    candidates = [str(cell) for cell in nearby_cells or [] if str(cell) in loads] or list(loads)
+    current_load = loads.get(current)
+    best = min(candidates, key=lambda cell: loads[cell], default=None)
+
+    if best is None or best == current or (current_load is not None and current_load - loads[best] <= margin):
+        reason = "Staying on the current cell tower"
+        if current_load is not None:
+            reason += f" (load {current_load:.2f})"
+        return {"optimal_handover_tower": current, "reason": reason, "source": "fallback"}
+    return {
+        "optimal_handover_tower": best,
+        "reason": f"Least loaded nearby cell tower (load {loads[best]:.2f})",
+        "source": "fallback",
+    }
+
+
+async def _until(awaitable, deadline: Optional[float]):
+    """
+    Await `awaitable` until the loop time `deadline`, without a limit when None.
+
+    Raises:
+        asyncio.TimeoutError: No result by the deadline.
+    """
+    if deadline is None:
+        return await awaitable
+    return await asyncio.wait_for(awaitable, max(0.0, deadline - asyncio.get_running_loop().time()))
+
+
+async def _first_response(call, deadline: Optional[float], hedge_delay: Optional[float]):
+    """
+    Await `call()` until the loop time `deadline`, sending a second, hedged call when
+    the first has not answered after `hedge_delay` seconds. The first successful
+    response wins and the other call is cancelled.
+
+    Raises:
+        asyncio.TimeoutError: No response by the deadline.
+        Exception: The error of the last call when all of them failed.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.ensure_future(call())]
+    pending = set(tasks)
+    hedge_at = loop.time() + hedge_delay if hedge_delay else None
+    error = None
+    try:
+        while pending:
+            wake_times = [t for t in (deadline, hedge_at) if t is not None]
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, min(wake_times) - loop.time()) if wake_times else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+
+            if hedge_at is not None and loop.time() >= hedge_at:
+                hedge_at = None
+                if deadline is None or loop.time() < deadline:
+                    LLM_HEDGES.inc()
+                    hedge = asyncio.ensure_future(call())
+                    tasks.append(hedge)
+                    pending.add(hedge)
+            elif not done and deadline is not None and loop.time() >= deadline:
+                raise asyncio.TimeoutError()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def build_recommendation_chat_prompt() -> "ChatPromptTemplate":
+    """System and recommendation prompts of the handover recommendation."""
+    from langchain_core.prompts import (
+        ChatPromptTemplate,
+        HumanMessagePromptTemplate,
+        PromptTemplate,
+        SystemMessagePromptTemplate,
+    )
+
+    recommendation_prompt = PromptTemplate(
+        input_variables=["trajectory_format", "trajectory_data", "cell_tower_loads", "timestamp", "current_cell_tower"],
+        template=RECOMMENDATION_TEMPLATE,
+    )
+    system_prompt = SystemMessagePromptTemplate.from_template(
+        "You are a network optimization assistant. Analyze the following user trajectory data in csv format. "
+        "For each user position, the data has recorded five candidate cell towers (within 2 km) along with their respective distances. "
+        "Identify patterns and key insights related to user movement, cell tower usage, and potential handover optimizations. "
+        "This analysis will be used as the basis for future recommendations."
+    )
+    human_prompt = HumanMessagePromptTemplate(prompt=recommendation_prompt)
+    return ChatPromptTemplate.from_messages([system_prompt, human_prompt])
+
+
+def build_recommendation_llm(api_key: str, backend: str = "gemini") -> "BaseChatModel":
+    """
+    Build the chat model answering the recommendation prompt.
+
+    Args:
+        api_key: Gemini API key
+        backend: "gemini", or "fake" for the simulated model of api/fake_llm.py
+
+    Raises:
+        ValueError: Unknown backend.
+    """
+    if backend == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
             model="gemini-1.5-pro",
             google_api_key=api_key,
             temperature=0,
             convert_system_message_to_human=True,
         )
-        
-        self.system_prompt = SystemMessagePromptTemplate.from_template(
-            "You are a network optimization assistant. Analyze the following user trajectory data in csv format. "
-            "For each user position, the data has recorded five candidate cell towers (within 2 km) along with their respective distances. "
-            "Identify patterns and key insights related to user movement, cell tower usage, and potential handover optimizations. "
-            "This analysis will be used as the basis for future recommendations."
-        )
-        self.recommendation_prompt = HumanMessagePromptTemplate(prompt=recommendation_prompt)
- 
-        self.recommendation_chain = LLMChain(
-            llm=self.llm,
-            prompt=ChatPromptTemplate.from_messages([self.system_prompt, self.recommendation_prompt]),
-            verbose=True
-        )
+    if backend == "fake":
+        from .fake_llm import FakeChatModel
+
+        return FakeChatModel(latency_ms=get_fake_llm_latency_ms(), latency_sigma=get_fake_llm_latency_sigma())
+    raise ValueError(f"Unknown LLM backend '{backend}', expected gemini or fake")
+
+
+class UserNetworkAgent:
+    """
+    Per-user handle on the shared prediction stack. It only holds the user id and a
+    reference to its manager, so keeping many of them around is cheap.
+    """
+
+    __slots__ = ("user_id", "manager")
+
+    def __init__(self, user_id: str, manager: "NetworkAgentManager"):
+        self.user_id = user_id
+        self.manager = manager
 
     async def predict_best_cell_towers(
         self,
@@ -83,17 +420,207 @@ class UserNetworkAgent:
         timestamp: int,
         current_cell_tower: int,
         db: AsyncSession,
-    ) -> str:
+    ) -> Dict:
+        # The deadline covers the whole request, not only the stages left after the cache lookups
+        deadline = self.manager.prediction_deadline()
+        loads = _normalized_loads(cell_tower_loads)
+        precompute = self.manager.precompute
+        if precompute is not None:
+            precompute.observe(user_id, timestamp, current_cell_tower, cell_tower_loads)
+
+        # Near-identical requests are answered from the prediction cache
+        prediction_cache = self.manager.prediction_cache
+        cache_key = prediction_cache.make_key(user_id, current_cell_tower, timestamp, loads)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None:
+            PREDICTIONS.inc(source=cached["source"])
+            return dict(cached)
+
+        # Then by a result computed ahead of time, if the loads have not drifted since
+        if precompute is not None:
+            precomputed = precompute.store.lookup(user_id, current_cell_tower, timestamp, loads)
+            if precomputed is not None:
+                prediction_cache.put(cache_key, dict(precomputed))
+                PREDICTIONS.inc(source=precomputed["source"])
+                return precomputed
+
+        async def predict_and_cache():
+            # Runs detached from this request, which may end before it does: it gets its own
+            # session, and is the only one to query, so a request holds one pooled connection
+            async with AsyncSession(db.bind, expire_on_commit=False) as call_db:
+                result, model = await self._predict(
+                    user_id, cell_tower_loads, timestamp, current_cell_tower, call_db, deadline
+                )
+            # A fallback only stands in for one slow or failed LLM call, the next request retries it
+            if result["source"] != "fallback":
+                prediction_cache.put(cache_key, dict(result))
+                if model is not None:
+                    model.observe_prediction(timestamp, current_cell_tower, loads, dict(result))
+                    self.manager.user_model_changed(user_id, model)
+            return result
+
+        # Concurrent requests for the same user, serving cell and timestamp bucket wait
+        # for the first one instead of querying the database and the LLM again
+        flight_key = (user_id, str(current_cell_tower), timestamp // prediction_cache.timestamp_bucket)
+        try:
+            result = await self.manager.in_flight_predictions.do(flight_key, predict_and_cache)
+        except Exception:
+            PREDICTION_ERRORS.inc()
+            raise
+        PREDICTIONS.inc(source=result["source"])
+        return dict(result)
+
+    async def precompute_best_cell_towers(
+        self,
+        user_id: str,
+        cell_tower_loads: Dict,
+        timestamp: int,
+        current_cell_tower: int,
+        db: AsyncSession,
+    ) -> Dict:
+        """
+        Predict ahead of a request, for the precompute store. Nothing is cached and the
+        user's model is only read: a speculative prediction must not update it.
+        """
+        result, _ = await self._predict(
+            user_id, cell_tower_loads, timestamp, current_cell_tower, db, self.manager.prediction_deadline(),
+            update_model=False,
+        )
+        return result
+
+    async def _predict(
+        self,
+        user_id: str,
+        cell_tower_loads: Dict,
+        timestamp: int,
+        current_cell_tower: int,
+        db: AsyncSession,
+        deadline: Optional[float],
+        update_model: bool = True,
+    ) -> Tuple[Dict, Optional[UserModel]]:
+        """
+        Predict within the loop time `deadline`: each stage gets the time left, and
+        once it runs out the local fallback answers.
+
+        Returns:
+            (dict, UserModel): The prediction, and the user's model when loaded.
+        """
+        no_rows = np.empty((0, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+        try:
+            model = await _until(self.manager.get_user_model(user_id, db), deadline)
+        except asyncio.TimeoutError:
+            return self._fallback("timeout", user_id, cell_tower_loads, timestamp, current_cell_tower, no_rows), None
+
+        # Answer locally when the user's periodic pattern is clear enough
+        predictor = self.manager.periodicity_predictor
+        periods = predictor.periods if model is None else model.periods_to_check(predictor.periods, update=update_model)
+        local_result = None
+        if periods:
+            try:
+                with stage_timings.time("periodicity"):
+                    local_result = await _until(
+                        predictor.predict(user_id, cell_tower_loads, timestamp, current_cell_tower, db, periods=periods),
+                        deadline,
+                    )
+            except asyncio.TimeoutError:
+                result = self._fallback("timeout", user_id, cell_tower_loads, timestamp, current_cell_tower, no_rows, model)
+                return result, model
+            if local_result is not None and local_result["confidence"] < self.manager.confidence_threshold:
+                local_result = None
+            if model is not None and update_model:
+                # Only a confident period is worth remembering, the others end up asking the LLM anyway
+                model.observe_periodicity(local_result, all_periods=len(periods) == len(predictor.periods))
+                self.manager.user_model_changed(user_id, model)
+        if local_result is not None:
+            del local_result["period"], local_result["match"]
+            local_result["source"] = "periodicity"
+            return local_result, model
+
         # Fetch trajectory data directly here
-        trajectory_data = await get_user_trajectory_data(user_id, timestamp, db)
+        time_window_start, time_window_end = trajectory_window_bounds(timestamp)
+        try:
+            with stage_timings.time("trajectory_fetch"):
+                trajectory = await _until(
+                    get_user_trajectory_window(user_id, time_window_start, time_window_end, db), deadline
+                )
+        except asyncio.TimeoutError:
+            result = self._fallback("timeout", user_id, cell_tower_loads, timestamp, current_cell_tower, no_rows, model)
+            return result, model
+        if model is not None and update_model and model.observe_trajectory(trajectory[trajectory[:, 0] <= timestamp]):
+            self.manager.user_model_changed(user_id, model)
+        encoding = self.manager.trajectory_encoding
+        with stage_timings.time("serialization"):
+            trajectory_data = encoding.encode(trajectory, timestamp)
+        logger.debug(
+            f"Encoded {len(trajectory)} trajectory rows for user_id: {user_id} as {encoding.name}, "
+            f"~{estimate_tokens(trajectory_data)} tokens"
+        )
         
-        recommendation_result = await self.recommendation_chain.apredict(
-            trajectory_data=trajectory_data,
-            timestamp=timestamp, 
-            cell_tower_loads=cell_tower_loads,
-            current_cell_tower=current_cell_tower
+        with stage_timings.time("prompt_render"):
+            messages = self.manager.recommendation_prompt.format_messages(
+                trajectory_format=encoding.description,
+                trajectory_data=trajectory_data,
+                timestamp=timestamp, 
+                cell_tower_loads=cell_tower_loads,
+                current_cell_tower=current_cell_tower
+            )
+        # Whatever the LLM does, answer by the deadline: time out, fail or talk
+        # nonsense, and the local fallback answers instead
+        try:
+            with stage_timings.time("llm"):
+                response = await _first_response(
+                    lambda: self.manager.recommendation_llm.ainvoke(messages),
+                    deadline,
+                    self.manager.llm_hedge_delay,
+                )
+        except asyncio.TimeoutError:
+            result = self._fallback("timeout", user_id, cell_tower_loads, timestamp, current_cell_tower, trajectory, model)
+            return result, model
+        except Exception:
+            logger.warning(f"LLM call failed for user_id: {user_id}", exc_info=True)
+            result = self._fallback("llm_error", user_id, cell_tower_loads, timestamp, current_cell_tower, trajectory, model)
+            return result, model
+        _count_llm_tokens(messages, response)
+
+        try:
+            with stage_timings.time("parse"):
+                result = parse_prompt_output_json(response.content)
+            if "optimal_handover_tower" not in result:
+                raise ValueError("No optimal_handover_tower in the LLM answer")
+        except (ValueError, TypeError):
+            # TypeError: the message content was not text
+            logger.warning(f"Unparseable LLM answer for user_id: {user_id}: {response.content!r}")
+            result = self._fallback("parse_error", user_id, cell_tower_loads, timestamp, current_cell_tower, trajectory, model)
+            return result, model
+        result["reason"] = str(result.get("reason", ""))
+        result["source"] = "llm"
+        return result, model
+
+    def _fallback(
+        self,
+        cause: str,
+        user_id: str,
+        cell_tower_loads: Dict,
+        timestamp: int,
+        current_cell_tower,
+        trajectory: np.ndarray,
+        model=None,
+    ) -> Dict:
+        logger.info(f"Answering user_id: {user_id} with the local fallback ({cause})")
+        PREDICTION_FALLBACKS.inc(cause=cause)
+        nearby = [cell for cell in _cells_at(trajectory, np.array([timestamp]))[0] if cell != MISSING_VALUE]
+        if not nearby and model is not None:
+            # No row at this time: the cells the user was handed over to from here before
+            nearby = model.handover_targets(current_cell_tower)
+        result = fallback_prediction(
+            cell_tower_loads,
+            current_cell_tower,
+            nearby_cells=nearby,
+            margin=self.manager.fallback_load_margin,
         )
-        return parse_prompt_output_json(recommendation_result)
+        # A timeout may come before the LLM is asked, in any stage of the prediction
+        result["reason"] += " (timeout)" if cause == "timeout" else f" (LLM {cause.replace('_', ' ')})"
+        return result
 
 
     # async def predict_worst_cell_towers(
@@ -130,6 +657,9 @@ def parse_prompt_output_json(input_str):
 
     Returns:
         dict: The parsed JSON data as a Python dictionary.
+
+    Raises:
+        ValueError: Not JSON, or JSON other than an object.
     """
     # Remove the opening delimiter (e.g., ```json or ```) and any whitespace that follows.
     clean_json = re.sub(r'^```(?:json)?\s*', '', input_str)
@@ -138,6 +668,8 @@ def parse_prompt_output_json(input_str):
     
     # Parse the cleaned JSON string
     result = json.loads(clean_json)
+    if not isinstance(result, dict):
+        raise ValueError(f"Expected a JSON object, got {type(result).__name__}")
     
     # Convert optimal_handover_tower to string if present
     if 'optimal_handover_tower' in result:
@@ -146,14 +678,148 @@ def parse_prompt_output_json(input_str):
     return result
 
 class NetworkAgentManager:
-    def __init__(self, api_key: str):
+    """
+    Hands out per-user agents, bounded to `max_agents` with least-recently-used
+    eviction, and owns the state they share: the recommendation prompt and chat model
+    (built on first use), the periodicity predictor, the prediction cache, the
+    coalescing of in-flight predictions, the trajectory encoding of the prompt and
+    the learned per-user models, when a UserModelStore is given.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        confidence_threshold: float = 0.8,
+        max_agents: int = 100_000,
+        prediction_cache: Optional[PredictionCache] = None,
+        trajectory_encoding: str = "csv",
+        llm: Optional["BaseChatModel"] = None,
+        llm_backend: str = "gemini",
+        predict_deadline: Optional[float] = 10.0,
+        llm_hedge_delay: Optional[float] = None,
+        fallback_load_margin: float = 0.1,
+        user_models: Optional[UserModelStore] = None,
+    ):
         self.api_key = api_key
-        self.user_agents: Dict[str, UserNetworkAgent] = {}
+        # Chat model answering the recommendation prompt, built from llm_backend when not given
+        self.llm = llm
+        self.llm_backend = llm_backend
+        # Seconds a prediction may take before the local fallback answers (None: no limit),
+        # and after which a second LLM request is sent (None: never)
+        self.predict_deadline = predict_deadline
+        self.llm_hedge_delay = llm_hedge_delay
+        self.fallback_load_margin = fallback_load_margin
+        # Background precomputation of upcoming predictions, attached by the app when enabled
+        self.precompute = None
+        self.confidence_threshold = confidence_threshold
+        self.max_agents = max_agents
+        self.periodicity_predictor = PeriodicityPredictor()
+        self.prediction_cache = prediction_cache or PredictionCache(max_entries=100_000, ttl=60)
+        self.in_flight_predictions = SingleFlight()
+        self.trajectory_encoding: TrajectoryEncoding = get_trajectory_encoding(trajectory_encoding)
+        self.user_agents: "OrderedDict[str, UserNetworkAgent]" = OrderedDict()
+        self.agents_created = 0
+        self.agents_evicted = 0
+        self._agent_bytes = 0
+        self._recommendation_prompt = None
+        self.user_models = user_models
+        if user_models is not None:
+            user_models.on_load = self._restore_last_prediction
+
+    @property
+    def recommendation_prompt(self) -> "ChatPromptTemplate":
+        """The shared recommendation chat prompt, built on first use."""
+        if self._recommendation_prompt is None:
+            self._recommendation_prompt = build_recommendation_chat_prompt()
+        return self._recommendation_prompt
+
+    @property
+    def recommendation_llm(self) -> "BaseChatModel":
+        """The shared recommendation chat model, built on first use."""
+        if self.llm is None:
+            self.llm = build_recommendation_llm(self.api_key, self.llm_backend)
+        return self.llm
+
+    def warm_up(self) -> None:
+        """Build the recommendation prompt and chat model (and import their libraries) ahead of the first prediction."""
+        self.recommendation_prompt
+        self.recommendation_llm
+
+    async def get_user_model(self, user_id: str, db: AsyncSession) -> Optional[UserModel]:
+        """The learned model of a user, None when models are disabled."""
+        if self.user_models is None:
+            return None
+        return await self.user_models.get(user_id, db)
+
+    def user_model_changed(self, user_id: str, model: UserModel) -> None:
+        self.user_models.mark_dirty(user_id, model)
+
+    def _restore_last_prediction(self, user_id: str, model: UserModel) -> None:
+        """
+        Put the last prediction of a loaded model back into the prediction cache, for
+        what is left of its TTL. Predictions stored without their time are not restored.
+        """
+        last = model.last_prediction
+        if last is None or "predicted_at" not in last:
+            return
+        age = max(0.0, time.time() - last["predicted_at"])
+        ttl = self.prediction_cache.ttl
+        if ttl is not None and age >= ttl:
+            return
+        key = self.prediction_cache.make_key(user_id, last["current_cell_tower"], last["timestamp"], last["loads"])
+        if key not in self.prediction_cache:
+            self.prediction_cache.put(key, dict(last["result"]), age=age)
+
+    def prediction_deadline(self) -> Optional[float]:
+        """The loop time by which a prediction starting now must answer, None without a limit."""
+        if self.predict_deadline is None:
+            return None
+        return asyncio.get_running_loop().time() + self.predict_deadline
 
     def get_agent(self, user_id: str) -> UserNetworkAgent:
         """
         Retrieve an existing agent for the user or create a new one.
         """
-        if user_id not in self.user_agents:
-            self.user_agents[user_id] = UserNetworkAgent(self.api_key, user_id)
-        return self.user_agents[user_id]
+        agent = self.user_agents.get(user_id)
+        if agent is not None:
+            self.user_agents.move_to_end(user_id)
+            return agent
+
+        agent = UserNetworkAgent(user_id, self)
+        self.user_agents[user_id] = agent
+        self.agents_created += 1
+        self._agent_bytes += _agent_size(agent)
+        while len(self.user_agents) > self.max_agents:
+            _, evicted = self.user_agents.popitem(last=False)
+            self._agent_bytes -= _agent_size(evicted)
+            self.agents_evicted += 1
+        return agent
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Agent pool metrics. Memory is an estimate of the agents and the pool itself,
+        the shared chain is not included.
+        """
+        return {
+            "agents": len(self.user_agents),
+            "max_agents": self.max_agents,
+            "agents_created": self.agents_created,
+            "agents_evicted": self.agents_evicted,
+            "memory_bytes": self._agent_bytes + sys.getsizeof(self.user_agents),
+        }
+
+
+def _count_llm_tokens(messages, response) -> None:
+    """Add an LLM call to the token counters, estimating the counts the model did not report."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    LLM_CALLS.inc()
+    LLM_TOKENS.inc(
+        usage.get("input_tokens") or sum(estimate_tokens(str(message.content)) for message in messages),
+        direction="input",
+    )
+    LLM_TOKENS.inc(usage.get("output_tokens") or estimate_tokens(str(response.content)), direction="output")
+
+
+def _agent_size(agent: UserNetworkAgent) -> int:
+    """Approximate memory held by one agent, including its user id."""
+    return sys.getsizeof(agent) + sys.getsizeof(agent.user_id)
@@ -0,0 +1,264 @@
+"""
+Memory-mapped columnar trajectory store, a read-optimized alternative to querying the
+user_trajectory table for every trajectory window (TRAJECTORY_BACKEND=columnar).
+
+A store is a directory holding a snapshot of the table as fixed-width int64 NumPy
+files, sorted by (user_id, time):
+
+    rows.npy      (N, len(TRAJECTORY_COLUMNS)) rows in TRAJECTORY_COLUMNS order,
+                  MISSING_VALUE in place of empty cells/distances
+    time.npy      (N,) the time column again, contiguous for the binary searches
+    users.npy     (U,) user ids, in the order of their rows
+    offsets.npy   (U + 1,) first row of every user, then N
+    meta.json     format version, columns, row count and highest table id included
+
+The arrays are memory-mapped: opening a store takes the same time whatever its size,
+and only the pages of the windows read are ever loaded. A window read is a lookup of
+the user's rows, two binary searches on their times and a zero-copy slice.
+
+SQLite stays the write path. Rows added after the snapshot (table id above the one
+recorded in meta.json) are read from the table, only for the users that have any,
+and merged in. Migrating again folds them into a new snapshot.
+
+Sample usage (from the repository root):
+    python -m api.storage migrate --db user_trajectory.db --out data/trajectory_store
+
+Arguments:
+    --db: SQLite database file (default: the one of DATABASE_URL).
+    --out: Store directory, replaced atomically (default: TRAJECTORY_STORE_PATH).
+    --chunk-rows: Rows read from the table at a time (default: 200000).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from itertools import chain
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import get_trajectory_store_path
+from .database import MISSING_VALUE, TRAJECTORY_COLUMNS, _TRAJECTORY_WINDOW_SQL, _fetch_trajectory_array, engine
+
+STORE_VERSION = 1
+
+_WIDTH = len(TRAJECTORY_COLUMNS)
+
+# The whole table in (user_id, time) index order, as of the snapshot's highest id
+_SNAPSHOT_SQL = (
+    "SELECT user_id, time, "
+    + ", ".join(f"IFNULL({name}, {MISSING_VALUE})" for name in TRAJECTORY_COLUMNS[1:])
+    + " FROM user_trajectory WHERE id <= ? ORDER BY user_id, time, id"
+)
+
+# Rows of a window written after the snapshot
+_DELTA_WINDOW_SQL = _TRAJECTORY_WINDOW_SQL + " AND id > ?"
+
+
+def store_exists(path: str) -> bool:
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def migrate_trajectory_table(
+    db_path: str,
+    out_path: str,
+    chunk_rows: int = 200_000,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """
+    Write a columnar snapshot of the user_trajectory table to `out_path`.
+
+    The table is read in one transaction, chunk by chunk straight into memory-mapped
+    output files, so memory stays bounded whatever the table size. The store is built
+    next to `out_path` and renamed into place, readers of a previous snapshot are
+    never exposed to a partial one.
+
+    Args:
+        db_path: SQLite database file.
+        out_path: Store directory.
+        chunk_rows: Rows fetched from the table at a time.
+        progress: Called as progress(rows_written, rows_total) after each chunk.
+
+    Returns:
+        int: Rows in the snapshot.
+    """
+    tmp_path = f"{out_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Count and rows come from the same read snapshot, even with concurrent writers
+        connection.execute("BEGIN")
+        count, max_id = connection.execute("SELECT COUNT(*), IFNULL(MAX(id), 0) FROM user_trajectory").fetchone()
+        rows = _open_output(os.path.join(tmp_path, "rows.npy"), (count, _WIDTH))
+        times = _open_output(os.path.join(tmp_path, "time.npy"), (count,))
+
+        users: List[str] = []
+        offsets: List[int] = []
+        previous = None
+        position = 0
+        cursor = connection.execute(_SNAPSHOT_SQL, (max_id,))
+        while True:
+            batch = cursor.fetchmany(chunk_rows)
+            if not batch:
+                break
+            block = np.fromiter(
+                chain.from_iterable(row[1:] for row in batch), dtype=np.int64, count=len(batch) * _WIDTH
+            ).reshape(len(batch), _WIDTH)
+            rows[position:position + len(batch)] = block
+            times[position:position + len(batch)] = block[:, 0]
+            for i, row in enumerate(batch):
+                if row[0] != previous:
+                    previous = row[0]
+                    users.append(previous)
+                    offsets.append(position + i)
+            position += len(batch)
+            if progress is not None:
+                progress(position, count)
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
+
+    if isinstance(rows, np.memmap):
+        rows.flush()
+        times.flush()
+    del rows, times
+    offsets.append(position)
+    np.save(os.path.join(tmp_path, "users.npy"), np.array(users, dtype=str))
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"version": STORE_VERSION, "columns": TRAJECTORY_COLUMNS, "rows": position,
+                   "users": len(users), "max_id": max_id}, f)
+
+    old_path = f"{out_path}.old-{os.getpid()}"
+    if os.path.exists(out_path):
+        os.replace(out_path, old_path)
+    os.replace(tmp_path, out_path)
+    # Open snapshots keep their mappings of the removed files
+    shutil.rmtree(old_path, ignore_errors=True)
+    return position
+
+
+class ColumnarTrajectoryStore:
+    """
+    Read side of a store written by migrate_trajectory_table.
+
+    Raises:
+        FileNotFoundError: No store at `path`.
+        ValueError: The store was written with another format or other columns.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION or meta.get("columns") != TRAJECTORY_COLUMNS:
+            raise ValueError(f"Trajectory store at {path} has an unsupported format, migrate it again")
+        self.max_id = meta["max_id"]
+        self.rows = _load(path, "rows.npy", (0, _WIDTH))
+        self.times = _load(path, "time.npy", (0,))
+        self._offsets = np.load(os.path.join(path, "offsets.npy"))
+        self._users = {user_id: i for i, user_id in enumerate(np.load(os.path.join(path, "users.npy")).tolist())}
+        # Users with rows newer than the snapshot, None until read from the table
+        self._delta_users: Optional[Set[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def window(self, user_id: str, start: int, end: int) -> np.ndarray:
+        """Snapshot rows of a user with start <= time <= end, a read-only view of the store."""
+        i = self._users.get(user_id)
+        if i is None:
+            return self.rows[:0]
+        first, last = self._offsets[i], self._offsets[i + 1]
+        times = self.times[first:last]
+        lo = first + np.searchsorted(times, start, side="left")
+        hi = first + np.searchsorted(times, end, side="right")
+        return self.rows[lo:hi]
+
+    def load_delta_users(self, connection) -> None:
+        """Find the users with rows written after the snapshot, on a SQLAlchemy connection."""
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute("SELECT DISTINCT user_id FROM user_trajectory WHERE id > ?", (self.max_id,))
+            self._delta_users = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def rows_written(self, user_id: str) -> None:
+        """Record that rows of `user_id` were written to the table after the snapshot."""
+        if self._delta_users is not None:
+            self._delta_users.add(user_id)
+
+    async def read_ranges(self, user_id: str, merged: List[Tuple[int, int]], db: AsyncSession) -> np.ndarray:
+        """
+        Rows of a user inside merged, sorted (start, end) ranges, sorted by time: the
+        snapshot rows, plus those written since when the user has any.
+        """
+        if self._delta_users is None:
+            await db.run_sync(lambda session: self.load_delta_users(session.connection()))
+        parts = [self.window(user_id, start, end) for start, end in merged]
+
+        if user_id in self._delta_users:
+            sql = " UNION ALL ".join([_DELTA_WINDOW_SQL] * len(merged))
+            params = [value for start, end in merged for value in (user_id, start, end, self.max_id)]
+            delta = await db.run_sync(lambda session: _fetch_trajectory_array(session.connection(), sql, params))
+            if len(delta):
+                data = np.concatenate(parts + [delta])
+                return data[np.argsort(data[:, 0], kind="stable")]
+
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.empty((0, _WIDTH), dtype=np.int64)
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self.rows),
+            "users": len(self._users),
+            "max_id": self.max_id,
+            "delta_users": None if self._delta_users is None else len(self._delta_users),
+        }
+
+
+def _open_output(path: str, shape: tuple) -> np.ndarray:
+    # A zero-length array cannot be memory-mapped
+    if shape[0] == 0:
+        return np.empty(shape, dtype=np.int64)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.int64, shape=shape)
+
+
+def _load(path: str, name: str, empty_shape: tuple) -> np.ndarray:
+    file_path = os.path.join(path, name)
+    if not os.path.exists(file_path):
+        return np.empty(empty_shape, dtype=np.int64)
+    return np.load(file_path, mmap_mode="r")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the memory-mapped columnar trajectory store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate = subparsers.add_parser("migrate", help="Snapshot the user_trajectory table into a store")
+    migrate.add_argument("--db", default=engine.url.database,
+                         help="SQLite database file (default: the one of DATABASE_URL)")
+    migrate.add_argument("--out", default=get_trajectory_store_path(),
+                         help="Store directory (default: TRAJECTORY_STORE_PATH)")
+    migrate.add_argument("--chunk-rows", type=int, default=200_000,
+                         help="Rows read from the table at a time (default: 200000)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def report(rows, total):
+        print(f"\r{rows:,} of {total:,} rows", end="", flush=True)
+
+    rows = migrate_trajectory_table(args.db, args.out, chunk_rows=args.chunk_rows, progress=report)
+    print(f"\nMigrated {rows:,} rows into {args.out} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
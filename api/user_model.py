@@ -0,0 +1,305 @@
+"""
+Learned per-user mobility models, kept across restarts in `user_contexts`.
+
+A UserModel accumulates what the predictions of a user reveal, from the trajectory
+rows they fetch anyway:
+
+    - the detected period of the user's trajectory (or that none was found), so the
+      periodicity predictor only reads the past cycles of that period, and skips
+      users without periodicity for a few requests
+    - serving-cell transitions (how often the user was handed over from one cell
+      to another), which the fallback uses as the nearby cells when the trajectory
+      has no row at the requested time
+    - the last prediction, put back into the prediction cache when the model is
+      loaded, for what is left of its TTL, so a repeated request is answered at once
+
+UserModelStore loads the model of a user lazily on their first request, keeps models
+in a bounded LRU cache, and writes changed models back in batches from a background
+loop, one upsert per batch. Models are stored in a compact binary form (to_bytes).
+"""
+
+import asyncio
+import json
+import logging
+import struct
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .cache import LRUCache
+from .database import CELL_COLUMNS, MISSING_VALUE, UserContext
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+
+# Detected period: not evaluated yet, or evaluated and none found
+PERIOD_UNKNOWN = -1
+PERIOD_NONE = 0
+# Requests a user without periodicity is not checked for it again
+PERIOD_RECHECK_REQUESTS = 10
+# Transitions kept per user, the most frequent ones
+MAX_TRANSITIONS = 64
+
+# version, period, period match, requests before the next period check,
+# time up to which transitions were counted, number of transitions
+_HEADER = struct.Struct("<BifHqH")
+_TRANSITION_DTYPE = np.dtype([("source", "<i8"), ("target", "<i8"), ("count", "<u4")])
+
+
+class UserModel:
+    """Learned mobility artifacts of one user."""
+
+    __slots__ = ("period", "period_match", "recheck_in", "transitions_until", "transitions", "last_prediction")
+
+    def __init__(self):
+        self.period = PERIOD_UNKNOWN
+        self.period_match = 0.0
+        self.recheck_in = 0
+        # Trajectory time up to which transitions were counted, so overlapping windows count once
+        self.transitions_until = -1
+        self.transitions: Dict[tuple, int] = {}
+        # {"timestamp", "current_cell_tower", "loads", "result"} of the last prediction
+        self.last_prediction: Optional[Dict] = None
+
+    def periods_to_check(self, candidates: Sequence[int], update: bool = True) -> List[int]:
+        """
+        Periods the periodicity predictor should evaluate for the next request: the
+        detected one, none while a user without periodicity waits for its recheck,
+        and every candidate otherwise. Without `update`, the wait is not counted down.
+        """
+        if self.period > 0 and self.period in candidates:
+            return [self.period]
+        if self.period == PERIOD_NONE and self.recheck_in > 0:
+            if update:
+                self.recheck_in -= 1
+            return []
+        return list(candidates)
+
+    def observe_periodicity(self, result: Optional[Dict], all_periods: bool) -> None:
+        """
+        Update the detected period from a periodicity prediction (its "period" and
+        "match" entries), evaluated on every candidate period or on the detected one.
+        """
+        if result is not None:
+            self.period = int(result["period"])
+            self.period_match = float(result["match"])
+        elif all_periods:
+            self.period = PERIOD_NONE
+            self.period_match = 0.0
+            self.recheck_in = PERIOD_RECHECK_REQUESTS
+        else:
+            # The detected period stopped matching, look at every period again
+            self.period = PERIOD_UNKNOWN
+
+    def observe_trajectory(self, data: np.ndarray) -> bool:
+        """Count the serving-cell changes of trajectory rows not seen yet; return whether any were."""
+        data = data[data[:, 0] > self.transitions_until]
+        if len(data) < 2:
+            return False
+        cells = data[:, CELL_COLUMNS[0]]
+        changes = np.flatnonzero((cells[1:] != cells[:-1]) & (cells[1:] != MISSING_VALUE) & (cells[:-1] != MISSING_VALUE))
+        for source, target in zip(cells[changes].tolist(), cells[changes + 1].tolist()):
+            self.transitions[(source, target)] = self.transitions.get((source, target), 0) + 1
+        self.transitions_until = int(data[-1, 0])
+        if len(self.transitions) > MAX_TRANSITIONS:
+            kept = sorted(self.transitions.items(), key=lambda item: item[1], reverse=True)[:MAX_TRANSITIONS]
+            self.transitions = dict(kept)
+        return True
+
+    def handover_targets(self, cell) -> List[str]:
+        """Cells the user was handed over to from `cell`, most frequent first."""
+        try:
+            cell = int(cell)
+        except (TypeError, ValueError):
+            return []
+        targets = [(count, target) for (source, target), count in self.transitions.items() if source == cell]
+        return [str(target) for _, target in sorted(targets, reverse=True)]
+
+    def observe_prediction(self, timestamp: int, current_cell_tower, loads: Dict[str, float], result: Dict) -> None:
+        self.last_prediction = {
+            "timestamp": int(timestamp),
+            "current_cell_tower": str(current_cell_tower),
+            "loads": loads,
+            "result": result,
+            # Wall clock, the prediction cache TTL still runs across restarts
+            "predicted_at": time.time(),
+        }
+
+    def to_bytes(self) -> bytes:
+        transitions = np.array(
+            [(source, target, count) for (source, target), count in self.transitions.items()],
+            dtype=_TRANSITION_DTYPE,
+        )
+        header = _HEADER.pack(
+            MODEL_VERSION, self.period, self.period_match, self.recheck_in, self.transitions_until, len(transitions)
+        )
+        last = b"" if self.last_prediction is None else json.dumps(self.last_prediction, separators=(",", ":")).encode()
+        return header + transitions.tobytes() + last
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "UserModel":
+        """
+        Raises:
+            ValueError: Not a model of this version.
+        """
+        model = cls()
+        if len(data) < _HEADER.size or data[0] != MODEL_VERSION:
+            raise ValueError("Unsupported user model format")
+        _, model.period, model.period_match, model.recheck_in, model.transitions_until, count = _HEADER.unpack_from(data)
+        end = _HEADER.size + count * _TRANSITION_DTYPE.itemsize
+        transitions = np.frombuffer(data[_HEADER.size:end], dtype=_TRANSITION_DTYPE)
+        model.transitions = {
+            (int(source), int(target)): int(count) for source, target, count in transitions.tolist()
+        }
+        if len(data) > end:
+            model.last_prediction = json.loads(data[end:])
+        return model
+
+
+class UserModelStore:
+    """
+    Per-user models loaded lazily from `user_contexts` and written back in batches.
+
+    Models are kept in an LRU cache of `max_users` entries. Changed models are queued
+    for writing and upserted together every `flush_interval` seconds, or as soon as
+    `flush_users` of them are waiting; a model evicted before its write is still
+    served from the queue.
+    """
+
+    def __init__(self, session_factory, max_users: int = 100_000, flush_interval: float = 1.0, flush_users: int = 1000):
+        self.session_factory = session_factory
+        self.models = LRUCache(max_size=max_users)
+        self.flush_interval = flush_interval
+        self.flush_users = flush_users
+        # Called as on_load(user_id, model) for every model read from the database
+        self.on_load = None
+        self.loaded = 0
+        self.created = 0
+        self.users_written = 0
+        self.flushes = 0
+        self._dirty: Dict[str, UserModel] = {}
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def get(self, user_id: str, db: AsyncSession) -> UserModel:
+        """The model of a user, read from the database on first use."""
+        model = self._cached(user_id)
+        if model is None:
+            await self.load_many([user_id], db)
+            model = self._cached(user_id)
+        return model
+
+    async def load_many(self, user_ids: Iterable[str], db: AsyncSession) -> None:
+        """Read the models of the given users not in memory yet, in one query."""
+        missing = list({user_id for user_id in user_ids if self._cached(user_id) is None})
+        if not missing:
+            return
+        result = await db.execute(
+            select(UserContext.user_id, UserContext.model).where(UserContext.user_id.in_(missing))
+        )
+        stored = dict(result.all())
+        for user_id in missing:
+            # Another request may have loaded the user meanwhile
+            if self._cached(user_id) is not None:
+                continue
+            model = None
+            if stored.get(user_id):
+                try:
+                    model = UserModel.from_bytes(stored[user_id])
+                except ValueError:
+                    logger.warning(f"Ignoring the stored model of user_id: {user_id}", exc_info=True)
+            if model is None:
+                model = UserModel()
+                self.created += 1
+            else:
+                self.loaded += 1
+                if self.on_load is not None:
+                    self.on_load(user_id, model)
+            self.models.put(user_id, model)
+
+    def mark_dirty(self, user_id: str, model: UserModel) -> None:
+        """Queue the model of a user for the next batched write."""
+        self._dirty[user_id] = model
+        if len(self._dirty) >= self.flush_users and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    async def start(self) -> None:
+        """Start the background write-back loop."""
+        self._flush_requested = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the write-back loop and write the models still queued."""
+        if self._task is not None:
+            self._stopping = True
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Upsert every queued model in a single transaction."""
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            now = datetime.utcnow()
+            rows = [
+                {"user_id": user_id, "model": model.to_bytes(), "created_at": now, "updated_at": now}
+                for user_id, model in dirty.items()
+            ]
+            statement = insert(UserContext)
+            statement = statement.on_conflict_do_update(
+                index_elements=[UserContext.user_id],
+                set_={"model": statement.excluded.model, "updated_at": statement.excluded.updated_at},
+            )
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(statement, rows)
+                    await session.commit()
+            except Exception:
+                # Requeued unless changed again meanwhile, the newer version wins
+                for user_id, model in dirty.items():
+                    self._dirty.setdefault(user_id, model)
+                raise
+            self.users_written += len(rows)
+            self.flushes += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "models": len(self.models),
+            "loaded": self.loaded,
+            "created": self.created,
+            "dirty": len(self._dirty),
+            "users_written": self.users_written,
+            "flushes": self.flushes,
+        }
+
+    def _cached(self, user_id: str) -> Optional[UserModel]:
+        model = self.models.get(user_id)
+        if model is None:
+            model = self._dirty.get(user_id)
+            if model is not None:
+                self.models.put(user_id, model)
+        return model
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.error("Error writing back user models, retrying on the next flush", exc_info=True)
@@ -0,0 +1,150 @@
+"""
+Trajectory compaction benchmark: api/compaction.py on a scratch table of --days of
+one-row-per-second history per user.
+
+Measures, before and after one compaction pass (raw rows older than --retention-days
+dropped):
+
+    - size:     rows of user_trajectory, and size of the database file after VACUUM
+    - history:  latency of the periodicity lookup of PeriodicityPredictor (the recent
+                window plus the same window 1 to 4 days and 1 to 4 weeks earlier,
+                where they exist), whose older cycles are rebuilt from the segments
+                once compacted
+    - fidelity: fraction of those reads returning the same time and cell1 as before
+
+along with the duration of the pass.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_compaction --users 10 --days 14 --retention-days 2
+
+Arguments:
+    --users: Number of users (default: 5).
+    --days: Days of history per user (default: 9).
+    --retention-days: Days of raw history kept (default: 2).
+    --queries: History reads per measurement (default: 200).
+    --db: Scratch SQLite file (default: a temporary file).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.compaction import TrajectoryCompactor
+from api.database import Base, get_user_trajectory_ranges, raw_horizons
+from benchmarks.bench_trajectory_window import INDEX_NAME, create_table, grow_table
+
+DAY_SECONDS = 24 * 3600
+
+
+def history_ranges(timestamp, lookback=100, horizon=100, tolerance=5, cycles=4):
+    """Time ranges read by PeriodicityPredictor.predict with its defaults."""
+    ranges = [(max(0, timestamp - lookback), timestamp - 1)]
+    for period in (DAY_SECONDS, 7 * DAY_SECONDS):
+        for cycle in range(1, cycles + 1):
+            start = timestamp - cycle * period - lookback - tolerance
+            end = timestamp - cycle * period + horizon + tolerance
+            if end >= 0:
+                ranges.append((max(0, start), end))
+    return ranges
+
+
+def table_size(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("VACUUM")
+        rows = conn.execute("SELECT COUNT(*) FROM user_trajectory").fetchone()[0]
+    return rows, round(os.path.getsize(db_path) / 2**20, 1)
+
+
+async def read_all(session_factory, reads):
+    latencies = []
+    results = []
+    async with session_factory() as db:
+        for user_id, ranges in reads:
+            started = time.perf_counter()
+            results.append(await get_user_trajectory_ranges(user_id, ranges, db))
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    stats = {"p50_ms": round(statistics.median(latencies), 3), "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3)}
+    return stats, results
+
+
+async def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_compaction_"), "bench.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_table(db_path)
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    started = time.perf_counter()
+    grow_table(db_path, 0, args.users * args.days * DAY_SECONDS, args.users)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"CREATE INDEX {INDEX_NAME} ON user_trajectory (user_id, time)")
+    print(f"{args.users} users x {args.days} days (loaded in {time.perf_counter() - started:.1f}s)\n")
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    rng = random.Random(0)
+    # Requests near the end of the history, the way live traffic arrives
+    reads = [
+        (str(rng.randrange(args.users)), history_ranges(args.days * DAY_SECONDS - rng.randrange(1, 3600)))
+        for _ in range(args.queries)
+    ]
+
+    results = {}
+    raw_horizons.clear()
+    rows, size_mb = table_size(db_path)
+    results["before"], expected = await read_all(session_factory, reads)
+    results["before"].update(rows=rows, size_mb=size_mb)
+
+    compactor = TrajectoryCompactor(db_path, compact_after=DAY_SECONDS, retention=args.retention_days * DAY_SECONDS)
+    totals = await compactor.compact_once()
+    results["compaction"] = {**totals, "seconds": round(compactor.last_pass_seconds, 2)}
+    await engine.dispose()
+
+    rows, size_mb = table_size(db_path)
+    results["after"], actual = await read_all(session_factory, reads)
+    results["after"].update(rows=rows, size_mb=size_mb)
+    same = [np.array_equal(a[:, :2], b[:, :2]) for a, b in zip(expected, actual)]
+    results["after"]["same_time_and_cell1"] = float(np.mean(same))
+    await engine.dispose()
+
+    print(f"compaction: {totals['rows_compacted']:,} rows into {totals['segments_written']:,} segments, "
+          f"{totals['rows_dropped']:,} raw rows dropped, in {compactor.last_pass_seconds:.1f}s\n")
+    for name in ("before", "after"):
+        stats = results[name]
+        print(f"  {name:>6}  {stats['rows']:>11,} rows {stats['size_mb']:>8} MB  "
+              f"history p50 {stats['p50_ms']:7.3f} ms p95 {stats['p95_ms']:7.3f} ms")
+    print(f"\n  reads with the same time and cell1 after compaction: {results['after']['same_time_and_cell1']:.1%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trajectory compaction and retention.")
+    parser.add_argument("--users", type=int, default=5, help="Number of users (default: 5)")
+    parser.add_argument("--days", type=int, default=9, help="Days of history per user (default: 9)")
+    parser.add_argument("--retention-days", type=int, default=2, help="Days of raw history kept (default: 2)")
+    parser.add_argument("--queries", type=int, default=200, help="History reads per measurement (default: 200)")
+    parser.add_argument("--db", type=str, default=None, help="Scratch SQLite file (default: a temporary file)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
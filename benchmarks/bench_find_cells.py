@@ -0,0 +1,166 @@
+"""
+find_cells fetch benchmark against a local stand-in of the OpenCellID API
+(benchmarks/opencellid_server.py).
+
+Fetches every tile of the 2 km grid of util-scripts/find_cells.py over the stand-in
+region with:
+
+    - loop:     the original one-request-at-a-time requests.get loop, without retries
+    - async:    util-scripts/cell_fetcher.py, --concurrency requests in flight with
+                retries, on an empty cache
+    - resumed:  a run interrupted after half of the tiles, then rerun: only the
+                unfinished tiles are requested again
+    - cached:   a rerun once every tile is cached
+
+and reports the wall time, HTTP requests, retries and cells found of each.
+
+Then compares the tilings of find_cells.py on the same region: the fixed 2 km grid,
+the adaptive quadtree from root tiles of up to 4 km², and from root tiles of up to
+--root-km x --root-km (which the stand-in accepts, unlike the public API's 4 km² BBOX
+limit), by requests made, requests saved against the fixed grid and cells found out
+of those the stand-in serves.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_find_cells --latency-ms 100 --error-rate 0.05 --concurrency 16
+
+Arguments:
+    --latency-ms: Latency of every stand-in response (default: 50).
+    --error-rate: Fraction of stand-in requests failing with a 503 (default: 0.05).
+    --concurrency: Requests in flight of the async fetcher (default: 8).
+    --rate: Requests per second of the async fetcher, 0 for no limit (default: 0).
+    --cell-size-km: Grid tile size (default: 2).
+    --root-km: Root tile size of the coarse quadtree run (default: 8).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts"))
+
+from benchmarks.opencellid_server import DEFAULT_BBOX, OpenCellIDStandIn, make_cells, serve_in_thread  # noqa: E402
+from cell_fetcher import CellFetcher, CellsWriter, TileCache  # noqa: E402
+from find_cells import QuadtreeTiling, get_grid_cells, get_root_cells  # noqa: E402
+
+
+def loop_fetch(base_url, grid_cells, mcc=404, mnc=45):
+    """The original find_cells loop, without its printing."""
+    all_cells_data = []
+    failed = 0
+    for cell in grid_cells:
+        cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon = cell
+        bbox_str = f"{cell_min_lat},{cell_min_lon},{cell_max_lat},{cell_max_lon}"
+        url = f"{base_url}?key=&BBOX={bbox_str}&mcc={mcc}&mnc={mnc}&radio=LTE&format=json"
+        response = requests.get(url)
+        if response.status_code == 200:
+            all_cells_data.extend(response.json().get("cells", []))
+        else:
+            failed += 1
+    return len(all_cells_data), failed
+
+
+def fetch(base_url, grid_cells, cache_dir, output, concurrency, rate, tiling=None):
+    fetcher = CellFetcher(None, 404, 45, base_url=base_url, concurrency=concurrency, rate=rate,
+                          retries=5, backoff=0.05, cache=TileCache(cache_dir), limit=50)
+
+    def on_tile(tile, response, cached):
+        writer.add(response)
+        if tiling is not None:
+            return tiling.on_response(tile, response)
+
+    with CellsWriter(output) as writer:
+        failed = asyncio.run(fetcher.fetch_all(grid_cells, on_tile))
+    return writer.count, len(failed), fetcher.stats
+
+
+def percent(value):
+    return "-" if value is None else f"{value:.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark find_cells fetching against a local OpenCellID stand-in.")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latency of every response (default: 50)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of requests failing with a 503")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (default: 8)")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second, 0 for no limit (default: 0)")
+    parser.add_argument("--cell-size-km", type=float, default=2, help="Grid tile size (default: 2)")
+    parser.add_argument("--root-km", type=float, default=8, help="Root tile size of the coarse quadtree (default: 8)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    min_lon, min_lat, max_lon, max_lat = DEFAULT_BBOX
+    grid_cells = get_grid_cells(min_lat, min_lon, max_lat, max_lon, cell_size_km=args.cell_size_km)
+    stand_in = OpenCellIDStandIn(make_cells(DEFAULT_BBOX, 2000, 3000, seed=args.seed),
+                                 latency_ms=args.latency_ms, error_rate=args.error_rate, seed=args.seed)
+    base_url, stop = serve_in_thread(stand_in)
+    results = []
+
+    def record(name, seconds, cells, failed, requests_made, retries=None):
+        result = {"run": name, "seconds": round(seconds, 2), "requests": requests_made,
+                  "retries": retries, "cells": cells, "failed_tiles": failed}
+        results.append(result)
+        print(f"{name:>8} {seconds:>8.2f}s {requests_made:>9} {'-' if retries is None else retries:>8} "
+              f"{cells:>7} {failed:>7}")
+
+    print(f"{len(grid_cells)} tiles, {args.latency_ms:g} ms latency, {args.error_rate:.0%} errors\n")
+    print(f"{'run':>8} {'time':>9} {'requests':>9} {'retries':>8} {'cells':>7} {'failed':>7}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "cells_data.json")
+
+            stand_in.requests = 0
+            started = time.perf_counter()
+            cells, failed = loop_fetch(base_url, grid_cells)
+            record("loop", time.perf_counter() - started, cells, failed, stand_in.requests)
+
+            for name, cache_dir in (("async", "cold"), ("resumed", "resumed"), ("cached", "cold")):
+                cache_dir = os.path.join(directory, cache_dir)
+                if name == "resumed":
+                    # Interrupted after half of the tiles
+                    fetch(base_url, grid_cells[:len(grid_cells) // 2], cache_dir, output, args.concurrency, args.rate)
+                started = time.perf_counter()
+                cells, failed, stats = fetch(base_url, grid_cells, cache_dir, output, args.concurrency, args.rate)
+                record(name, time.perf_counter() - started, cells, failed, stats["requests"], stats["retries"])
+
+            print(f"\n{'tiling':>16} {'requests':>9} {'saved':>7} {'vs fine':>8} {'cells':>7} {'of':>6} "
+                  f"{'coverage':>9}")
+            for name, root_km in (("grid", None),
+                                  ("quadtree", args.cell_size_km),
+                                  (f"quadtree {args.root_km:g} km", args.root_km)):
+                if root_km is None:
+                    roots = grid_cells
+                    tiling = None
+                else:
+                    roots = get_root_cells(min_lat, min_lon, max_lat, max_lon, max_area_km2=root_km * root_km)
+                    tiling = QuadtreeTiling(roots)
+                cache_dir = os.path.join(directory, f"tiling-{len(results)}")
+                cells, failed, stats = fetch(base_url, roots, cache_dir, output, args.concurrency, args.rate, tiling)
+                report = tiling.report(grid_tiles=len(grid_cells)) if tiling else {}
+                coverage = report.get("coverage")
+                results.append({"tiling": name, "requests": stats["requests"], "cells": cells,
+                                "served_cells": len(stand_in.cells), "coverage": coverage,
+                                "saving_vs_grid": report.get("saving_vs_grid"),
+                                "saving_vs_fine_grid": report.get("saving_vs_fine_grid")})
+                print(f"{name:>16} {stats['requests']:>9} {percent(report.get('saving_vs_grid')):>7} "
+                      f"{percent(report.get('saving_vs_fine_grid')):>8} {cells:>7} {len(stand_in.cells):>6} "
+                      f"{percent(coverage):>9}")
+    finally:
+        stop()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+generate_trajectory benchmark: the vectorized route-to-trajectory pipeline of
+util-scripts/generate_trajectory.py against a per-time-step loop.
+
+On a random route of --points points (about 10 m apart) and --cells cells around it,
+times each stage of the pipeline on one sample per route point:
+
+    - sample:   positions along the route at every time step
+    - nearest:  the 5 nearest cells of every position, in one k-nearest query
+    - write:    formatting the trajectory CSV rows
+
+against a loop computing the haversine distance from each position to every cell and
+keeping the 5 closest, timed on the first --loop-points positions and extrapolated.
+The nearest cells of both are compared on that prefix.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_generate_trajectory --points 1000000 --cells 5000
+
+Arguments:
+    --points: Route length in points (default: 1000000).
+    --cells: Cells around the route (default: 3000).
+    --loop-points: Positions the loop is timed on (default: 200).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts"))
+
+from benchmarks.bench_geo_primitives import make_route, timed  # noqa: E402
+from benchmarks.opencellid_server import make_cells  # noqa: E402
+from common_utils import consecutive_distances, haversine_sklearn  # noqa: E402
+from generate_trajectory import nearest_cells, sample_route, write_trajectory_rows  # noqa: E402
+
+
+def loop_nearest_cells(cells, positions, k=5):
+    """One haversine distance per (position, cell) pair, the 5 closest kept."""
+    rows = []
+    for lon, lat in positions:
+        distances = sorted((haversine_sklearn(lon, lat, cell["lon"], cell["lat"]), cell["cellid"]) for cell in cells)
+        rows.append([cell_id for _, cell_id in distances[:k]])
+    return np.array(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generate_trajectory against a per-time-step loop.")
+    parser.add_argument("--points", type=int, default=1_000_000, help="Route length in points (default: 1000000)")
+    parser.add_argument("--cells", type=int, default=3000, help="Cells around the route (default: 3000)")
+    parser.add_argument("--loop-points", type=int, default=200, help="Positions the loop is timed on (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    route = np.array(make_route(args.points, 10, rng))
+    (min_lon, min_lat), (max_lon, max_lat) = route.min(axis=0), route.max(axis=0)
+    cells = make_cells((min_lon, min_lat, max_lon, max_lat), args.cells, 0, seed=args.seed)
+
+    # One time step per route point on average
+    speed = float(consecutive_distances(route).sum()) / args.points
+    sample_s, (times, positions) = timed(sample_route, route, [0.0], [speed], 1.0)
+    nearest_s, (cell_ids, distances) = timed(nearest_cells, cells, positions)
+    write_s, _ = timed(write_trajectory_rows, io.StringIO(), 1, times.astype(np.int64), cell_ids, distances)
+    total_s = sample_s + nearest_s + write_s
+
+    prefix = positions[:args.loop_points]
+    loop_s, expected = timed(loop_nearest_cells, cells, prefix)
+    loop_s *= len(positions) / len(prefix)
+    same = float(np.mean(cell_ids[:len(prefix)] == expected))
+
+    results = {
+        "route_points": args.points,
+        "rows": len(times),
+        "cells": args.cells,
+        "sample_s": round(sample_s, 3),
+        "nearest_s": round(nearest_s, 3),
+        "write_s": round(write_s, 3),
+        "total_s": round(total_s, 3),
+        "loop_s": round(loop_s, 1),
+        "speedup": round(loop_s / total_s),
+        "same_cells": same,
+    }
+    print(f"{args.points:,} route points, {len(times):,} rows, {args.cells} cells\n")
+    print(f"  sample   {sample_s:8.3f}s")
+    print(f"  nearest  {nearest_s:8.3f}s")
+    print(f"  write    {write_s:8.3f}s")
+    print(f"  total    {total_s:8.3f}s")
+    print(f"  loop     {loop_s:8.1f}s (extrapolated from {len(prefix):,} positions), "
+          f"{results['speedup']}x slower, same cells: {same:.1%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Micro-benchmark of the vectorized distance and interpolation primitives of
+util-scripts/common_utils.py against the per-point loops they replace.
+
+On a random route of --points points ([lon, lat], about --spacing meters apart):
+
+    - consecutive:  distances between consecutive points
+                    (loop: haversine_sklearn per pair, as geojson_to_csv did)
+    - smooth:       densifying the route every --interval meters
+                    (loop: the original smooth_coordinates of geojson_smooth.py)
+    - one_to_many:  distances from one point to every route point
+    - pairwise:     distances between --cells cells and every route point
+
+Loops are timed on the first --loop-points points and extrapolated linearly to the
+whole route; the vectorized versions run on all of it, and their results are checked
+against the loops on the shared prefix.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_geo_primitives --points 1000000
+
+Arguments:
+    --points: Route length in points (default: 1000000).
+    --spacing: Mean distance between route points, in meters (default: 25).
+    --interval: Densification interval in meters (default: 10).
+    --loop-points: Route points the loops are timed on (default: 20000).
+    --cells: Cells of the many-to-many measurement (default: 50).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts"))
+
+from common_utils import (  # noqa: E402
+    consecutive_distances,
+    distances_from,
+    haversine_sklearn,
+    interpolate,
+    pairwise_distances,
+)
+from geojson_smooth import smooth_coordinates  # noqa: E402
+
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111_195.0
+
+
+def loop_smooth_coordinates(coords, interval=10):
+    """The original smooth_coordinates of geojson_smooth.py."""
+    if not coords:
+        return []
+    smoothed = [coords[0]]
+    for i in range(1, len(coords)):
+        start = smoothed[-1]
+        end = coords[i]
+        d = haversine_sklearn(start[0], start[1], end[0], end[1])
+        if d > interval:
+            num_points = int(d // interval)
+            for j in range(1, num_points + 1):
+                fraction = (j * interval) / d
+                if fraction < 1:
+                    smoothed.append(interpolate(start, end, fraction))
+            smoothed.append(end)
+        else:
+            smoothed.append(end)
+    return smoothed
+
+
+def make_route(points, spacing, rng):
+    steps = rng.normal(0, 0.5, size=(points, 2)) * spacing / METERS_PER_DEGREE
+    return (np.array([77.59, 12.97]) + np.cumsum(steps, axis=0)).tolist()
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized geo primitives of common_utils.")
+    parser.add_argument("--points", type=int, default=1_000_000, help="Route length in points (default: 1000000)")
+    parser.add_argument("--spacing", type=float, default=25, help="Mean meters between route points (default: 25)")
+    parser.add_argument("--interval", type=float, default=10, help="Densification interval in meters (default: 10)")
+    parser.add_argument("--loop-points", type=int, default=20_000,
+                        help="Route points the loops are timed on (default: 20000)")
+    parser.add_argument("--cells", type=int, default=50, help="Cells of the many-to-many measurement (default: 50)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    route = make_route(args.points, args.spacing, rng)
+    prefix = route[:args.loop_points]
+    scale = args.points / len(prefix)
+    cells = make_route(args.cells, 5_000, rng)
+    results = []
+
+    def record(name, loop_seconds, vectorized_seconds, max_error):
+        result = {
+            "primitive": name,
+            "loop_s": round(loop_seconds * scale, 3),
+            "vectorized_s": round(vectorized_seconds, 4),
+            "speedup": round(loop_seconds * scale / vectorized_seconds),
+            "max_abs_error": max_error,
+        }
+        results.append(result)
+        print(f"{name:>12} {result['loop_s']:>11.2f}s {result['vectorized_s']:>11.4f}s "
+              f"{result['speedup']:>8}x  {max_error:.2e}")
+
+    print(f"{args.points:,} route points (loops timed on {len(prefix):,} and extrapolated)\n")
+    print(f"{'primitive':>12} {'loop':>12} {'vectorized':>12} {'speedup':>9}  max error")
+
+    loop_s, expected = timed(lambda: [haversine_sklearn(*a, *b) for a, b in zip(prefix[:-1], prefix[1:])])
+    vectorized_s, distances = timed(consecutive_distances, route)
+    record("consecutive", loop_s, vectorized_s, float(np.max(np.abs(distances[:len(expected)] - expected))))
+
+    loop_s, expected = timed(loop_smooth_coordinates, prefix, args.interval)
+    vectorized_s, _ = timed(smooth_coordinates, route, args.interval)
+    smoothed_prefix = smooth_coordinates(prefix, args.interval)
+    same_length = len(smoothed_prefix) == len(expected)
+    error = float(np.max(np.abs(np.array(smoothed_prefix) - np.array(expected)))) if same_length else float("inf")
+    record("smooth", loop_s, vectorized_s, error)
+
+    point = cells[0]
+    loop_s, expected = timed(lambda: [haversine_sklearn(point[0], point[1], lon, lat) for lon, lat in prefix])
+    vectorized_s, distances = timed(distances_from, point, route)
+    record("one_to_many", loop_s, vectorized_s, float(np.max(np.abs(distances[:len(expected)] - expected))))
+
+    loop_prefix = prefix[:max(1, len(prefix) // len(cells))]
+    loop_s, expected = timed(lambda: [[haversine_sklearn(c[0], c[1], lon, lat) for lon, lat in loop_prefix] for c in cells])
+    loop_s *= len(prefix) / len(loop_prefix)
+    vectorized_s, distances = timed(pairwise_distances, cells, route)
+    record("pairwise", loop_s, vectorized_s, float(np.max(np.abs(distances[:, :len(loop_prefix)] - expected))))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+geojson_smooth benchmark: the vectorized great-circle densification against the
+original per-segment loop.
+
+Two measurements:
+
+    - route:       one long LineString of --points points ([lon, lat], about
+                   --spacing meters apart) densified every --interval meters with
+                   the original loop, the vectorized linear interpolation (--linear)
+                   and the vectorized great-circle interpolation (the default). The
+                   loop is timed on the first --loop-points points and extrapolated
+                   to the whole route; both vectorized outputs are compared with it
+                   on that prefix, in meters.
+    - collection:  a FeatureCollection of --features features, half LineStrings and
+                   half MultiLineStrings of --feature-points points in total each,
+                   smoothed in this process and with a pool of --workers processes.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_geojson_smooth --points 1000000 --features 200 --workers 4
+
+Arguments:
+    --points: Route length in points (default: 1000000).
+    --spacing: Mean distance between route points, in meters (default: 25).
+    --interval: Densification interval in meters (default: 10).
+    --loop-points: Route points the loop is timed on (default: 20000).
+    --features: Features of the collection measurement (default: 200).
+    --feature-points: Points of each feature (default: 20000).
+    --workers: Worker processes of the pooled collection run, 0 for one per CPU (default: 0).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts"))
+
+from benchmarks.bench_geo_primitives import loop_smooth_coordinates, make_route, timed  # noqa: E402
+from common_utils import haversine_vectorized  # noqa: E402
+from geojson_smooth import smooth_coordinates, smooth_features  # noqa: E402
+
+
+def max_deviation_meters(coords, expected):
+    """Largest distance between corresponding points, infinite when the lengths differ."""
+    if len(coords) != len(expected):
+        return float("inf")
+    coords, expected = np.asarray(coords), np.asarray(expected)
+    return float(np.max(haversine_vectorized(coords[:, 0], coords[:, 1], expected[:, 0], expected[:, 1])))
+
+
+def make_collection(features, points, spacing, rng):
+    collection = []
+    for i in range(features):
+        route = make_route(points, spacing, rng)
+        if i % 2:
+            geometry = {"type": "MultiLineString", "coordinates": [route[:points // 2], route[points // 2:]]}
+        else:
+            geometry = {"type": "LineString", "coordinates": route}
+        collection.append({"type": "Feature", "properties": {"id": i}, "geometry": geometry})
+    return collection
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark geojson_smooth: great-circle densification vs. the loop.")
+    parser.add_argument("--points", type=int, default=1_000_000, help="Route length in points (default: 1000000)")
+    parser.add_argument("--spacing", type=float, default=25, help="Mean meters between route points (default: 25)")
+    parser.add_argument("--interval", type=float, default=10, help="Densification interval in meters (default: 10)")
+    parser.add_argument("--loop-points", type=int, default=20_000,
+                        help="Route points the loop is timed on (default: 20000)")
+    parser.add_argument("--features", type=int, default=200, help="Features of the collection (default: 200)")
+    parser.add_argument("--feature-points", type=int, default=20_000, help="Points of each feature (default: 20000)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes of the pooled run, 0 for one per CPU (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    route = make_route(args.points, args.spacing, rng)
+    prefix = route[:args.loop_points]
+    results = {}
+
+    loop_s, expected = timed(loop_smooth_coordinates, prefix, args.interval)
+    loop_s *= args.points / len(prefix)
+    print(f"{args.points:,} route points (loop timed on {len(prefix):,} and extrapolated)\n")
+    print(f"{'method':>13} {'time':>10} {'speedup':>9}  max deviation from the loop")
+    print(f"{'loop':>13} {loop_s:>9.2f}s")
+    results["route"] = {"points": args.points, "loop_s": round(loop_s, 2)}
+    for name, great_circle in (("linear", False), ("great_circle", True)):
+        seconds, smoothed = timed(smooth_coordinates, route, args.interval, great_circle)
+        deviation = max_deviation_meters(smooth_coordinates(prefix, args.interval, great_circle), expected)
+        results["route"][name] = {
+            "seconds": round(seconds, 3),
+            "speedup": round(loop_s / seconds),
+            "output_points": len(smoothed),
+            "max_deviation_m": deviation,
+        }
+        print(f"{name:>13} {seconds:>9.3f}s {round(loop_s / seconds):>8}x  {deviation:.2e} m")
+
+    workers = args.workers or os.cpu_count() or 1
+    collection = make_collection(args.features, args.feature_points, args.spacing, rng)
+    serial_s, serial = timed(smooth_features, copy.deepcopy(collection), args.interval, True, 1)
+    pooled_s, pooled = timed(smooth_features, collection, args.interval, True, workers)
+    same = [f["geometry"] for f in serial] == [f["geometry"] for f in pooled]
+    results["collection"] = {
+        "features": args.features,
+        "feature_points": args.feature_points,
+        "workers": workers,
+        "serial_s": round(serial_s, 3),
+        "pooled_s": round(pooled_s, 3),
+        "speedup": round(serial_s / pooled_s, 2),
+        "same_output": same,
+    }
+    print(f"\n{args.features} features x {args.feature_points:,} points: "
+          f"serial {serial_s:.2f}s, {workers} workers {pooled_s:.2f}s "
+          f"({serial_s / pooled_s:.2f}x), same output: {same}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Peak memory of util-scripts/geojson_to_csv.py and util-scripts/geojson_smooth.py
+against the size of their input, loading the whole file versus --stream.
+
+For every size in --sizes-mb, writes a FeatureCollection of LineStrings of
+--feature-points points each to a temporary directory, runs each script on it in a
+child process (loaded and --stream, and for geojson_smooth also --stream --compact)
+and reports its wall time, peak resident set size (from os.wait4) and output size.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_geojson_streaming --sizes-mb 10 100 500
+
+Arguments:
+    --sizes-mb: Input sizes to measure, in megabytes (default: 10, 50, 200).
+    --feature-points: Points of each LineString (default: 5000).
+    --interval: Densification interval of geojson_smooth, in meters (default: 10).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_geo_primitives import make_route
+
+UTIL_SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts")
+
+# (script, extra arguments) of every measured run
+RUNS = [
+    ("geojson_to_csv.py", []),
+    ("geojson_to_csv.py", ["--stream"]),
+    ("geojson_smooth.py", []),
+    ("geojson_smooth.py", ["--stream"]),
+    ("geojson_smooth.py", ["--stream", "--compact"]),
+]
+
+
+def write_geojson(path, size_bytes, feature_points, rng):
+    """Write LineString features to `path` until it holds at least `size_bytes`."""
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "features": [')
+        written = 0
+        while f.tell() < size_bytes:
+            feature = {
+                "type": "Feature",
+                "properties": {"id": written},
+                "geometry": {"type": "LineString", "coordinates": make_route(feature_points, 25, rng)},
+            }
+            f.write(("," if written else "") + "\n" + json.dumps(feature))
+            written += 1
+        f.write("\n]}\n")
+    return written
+
+
+def run(script, arguments, input_path, output_path, interval):
+    """Run a script in a child process; return its wall time and peak RSS in bytes."""
+    command = [sys.executable, script, input_path, *arguments]
+    command += ["-o", output_path] if script == "geojson_to_csv.py" else ["-o", output_path, "-i", str(interval)]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=UTIL_SCRIPTS)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    # ru_maxrss is in kilobytes on Linux
+    return seconds, usage.ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the peak memory of the GeoJSON scripts against file size.")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[10, 50, 200], help="Input sizes in MB")
+    parser.add_argument("--feature-points", type=int, default=5000, help="Points of each LineString (default: 5000)")
+    parser.add_argument("--interval", type=float, default=10, help="Densification interval in meters (default: 10)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    print(f"{'input':>9} {'script':>18} {'mode':>18} {'time':>9} {'peak RSS':>10} {'output':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        input_path = os.path.join(directory, "input.geojson")
+        output_path = os.path.join(directory, "output")
+        for size_mb in args.sizes_mb:
+            features = write_geojson(input_path, int(size_mb * 1e6), args.feature_points, rng)
+            input_mb = os.path.getsize(input_path) / 1e6
+            for script, arguments in RUNS:
+                seconds, peak_rss = run(script, arguments, input_path, output_path, args.interval)
+                mode = " ".join(arguments) or "load"
+                result = {
+                    "input_mb": round(input_mb, 1),
+                    "features": features,
+                    "script": script,
+                    "mode": mode,
+                    "seconds": round(seconds, 2),
+                    "peak_rss_mb": round(peak_rss / 1e6, 1),
+                    "output_mb": round(os.path.getsize(output_path) / 1e6, 1),
+                }
+                results.append(result)
+                print(f"{input_mb:>7.1f}MB {script:>18} {mode:>18} {seconds:>8.2f}s "
+                      f"{result['peak_rss_mb']:>8.1f}MB {result['output_mb']:>8.1f}MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Sustained trajectory ingestion benchmark.
+
+Runs the FastAPI app in-process against a scratch SQLite database and has concurrent
+producers POST trajectory batches to /trajectory for a fixed duration. Reports the
+accepted and written rows/second, request latency and backpressure rejections.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_ingest --duration 20 --producers 8 --batch-rows 500 --format ndjson
+
+Arguments:
+    --duration: Seconds to keep producing (default: 10).
+    --producers: Concurrent producers (default: 8).
+    --batch-rows: Rows per request (default: 500).
+    --users: Users the rows are spread over (default: 100).
+    --format: Request body format, json or ndjson (default: ndjson).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+
+def build_body(fmt, batch_rows, users, batch_index):
+    """One request body of `batch_rows` rows for `users` users."""
+    rows = []
+    for i in range(batch_rows):
+        t = batch_index * batch_rows + i
+        cell = 100_000 + (t // 300) % 50
+        row = {"time": t, "cell1": cell, "distance1": 100, "cell2": cell + 1, "distance2": 200,
+               "cell3": cell + 2, "distance3": 300, "cell4": cell + 3, "distance4": 400,
+               "cell5": cell + 4, "distance5": 500}
+        rows.append((str(t % users), row))
+
+    if fmt == "ndjson":
+        return "\n".join(json.dumps({"user_id": user_id, **row}) for user_id, row in rows), "application/x-ndjson"
+    batches = {}
+    for user_id, row in rows:
+        batches.setdefault(user_id, []).append(row)
+    payload = [{"user_id": user_id, "rows": user_rows} for user_id, user_rows in batches.items()]
+    return json.dumps(payload), "application/json"
+
+
+async def run(args, db_path):
+    import httpx
+    from api import app as app_module
+    from api.database import engine, initialize_database
+
+    engine.echo = False
+    await initialize_database()
+    buffer = app_module.trajectory_write_buffer
+    await buffer.start()
+
+    bodies = [build_body(args.format, args.batch_rows, args.users, i) for i in range(16)]
+    latencies = []
+    accepted = 0
+    rejected = 0
+
+    async def producer(client, offset):
+        nonlocal accepted, rejected
+        i = offset
+        while time.perf_counter() < deadline:
+            body, content_type = bodies[i % len(bodies)]
+            i += 1
+            sent = time.perf_counter()
+            response = await client.post("/trajectory", content=body, headers={"Content-Type": content_type})
+            latencies.append((time.perf_counter() - sent) * 1000)
+            if response.status_code == 202:
+                accepted += response.json()["accepted"]
+            elif response.status_code == 503:
+                rejected += args.batch_rows
+            else:
+                raise RuntimeError(f"Unexpected response {response.status_code}: {response.text}")
+            # The in-process transport never waits on a socket, yield like a real server would
+            await asyncio.sleep(0)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(producer(client, i) for i in range(args.producers)))
+        produced_in = time.perf_counter() - started
+        await buffer.stop()
+        written_in = time.perf_counter() - started
+
+    with sqlite3.connect(db_path) as conn:
+        rows_in_db = conn.execute("SELECT COUNT(*) FROM user_trajectory").fetchone()[0]
+
+    latencies.sort()
+    return {
+        "format": args.format,
+        "producers": args.producers,
+        "batch_rows": args.batch_rows,
+        "duration_s": round(produced_in, 3),
+        "requests": len(latencies),
+        "accepted_rows": accepted,
+        "rejected_rows": rejected,
+        "rows_in_db": rows_in_db,
+        "accepted_rows_per_s": round(accepted / produced_in),
+        "written_rows_per_s": round(rows_in_db / written_in),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))], 3),
+        "flushes": buffer.flushes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sustained trajectory ingestion through /trajectory.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to keep producing (default: 10)")
+    parser.add_argument("--producers", type=int, default=8, help="Concurrent producers (default: 8)")
+    parser.add_argument("--batch-rows", type=int, default=500, help="Rows per request (default: 500)")
+    parser.add_argument("--users", type=int, default=100, help="Users the rows are spread over (default: 100)")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="ndjson",
+                        help="Request body format (default: ndjson)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    # The app reads its database location at import time
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_ingest_"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    logging.disable(logging.INFO)
+
+    result = asyncio.run(run(args, db_path))
+    for key, value in result.items():
+        print(f"{key:>20}: {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
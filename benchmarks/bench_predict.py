@@ -0,0 +1,292 @@
+"""
+Offline load test of /predict.
+
+Runs the FastAPI app in-process against a scratch SQLite database seeded with
+synthetic trajectories, with the fake LLM backend (api/fake_llm.py) in place of
+Gemini, and drives concurrent /predict requests. Reports p50/p95/p99 latency,
+throughput, the answering source of the responses and the per-stage breakdown
+(periodicity, trajectory fetch, serialization, prompt render, LLM, parse) of api/metrics.py.
+
+The results are written as JSON with --json; --compare checks a run against such a
+file and exits with status 1 when a latency percentile or the throughput regressed
+by more than --tolerance.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_predict --requests 2000 --concurrency 64 --json baseline.json
+    python -m benchmarks.bench_predict --requests 2000 --concurrency 64 --compare baseline.json
+
+Arguments:
+    --requests: Number of /predict requests (default: 1000).
+    --concurrency: Requests in flight at once (default: 32).
+    --users: Seeded users (default: 200).
+    --history: Seconds of trajectory seeded per user (default: 3600).
+    --repeat-rate: Fraction of requests repeating a recent request (default: 0.1).
+    --llm-latency-ms: Median latency of the fake LLM (default: 200).
+    --llm-latency-sigma: Log-normal sigma of the fake LLM latency, 0 for constant (default: 0.5).
+    --llm-malformed-rate: Fraction of fake LLM answers that are not valid JSON (default: 0).
+    --encoding: TRAJECTORY_ENCODING of the prompt (default: csv).
+    --deadline: PREDICT_DEADLINE_SECONDS, 0 for no limit (default: 10).
+    --hedge-delay: LLM_HEDGE_DELAY_SECONDS, 0 to never hedge (default: 0).
+    --request-step: Seconds each user moves along their trajectory between requests, 0 for random timestamps (default: 0).
+    --precompute: Enable PRECOMPUTE_ENABLED, the background precomputation of upcoming predictions.
+    --seed: Random seed of the data, the requests and the fake LLM (default: 0).
+    --json: Optional path to also write the results as JSON.
+    --compare: JSON results of an earlier run to compare against.
+    --tolerance: Allowed relative regression for --compare (default: 0.1).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Latency keys compared by --compare, lower is better
+COMPARED_LATENCIES = ["p50_ms", "p95_ms", "p99_ms"]
+
+
+def seed_trajectories(db_path, users, history, seed):
+    """
+    Insert `history` seconds of synthetic trajectory per user: each user drives past
+    a row of towers, the five candidates being the nearest towers along the road.
+    """
+    from api.database import TRAJECTORY_COLUMNS
+
+    rng = np.random.default_rng(seed)
+    insert_sql = (
+        f"INSERT INTO user_trajectory (user_id, {', '.join(TRAJECTORY_COLUMNS)}) "
+        f"VALUES ({', '.join(['?'] * (len(TRAJECTORY_COLUMNS) + 1))})"
+    )
+    times = np.arange(history)
+    with sqlite3.connect(db_path) as conn:
+        for user in range(users):
+            towers = 180_000 + rng.choice(200_000, size=256, replace=False)
+            tower_positions = np.cumsum(rng.uniform(400, 1200, size=len(towers)))
+            position = tower_positions[2] + rng.uniform(8, 20) * times
+            position = np.minimum(position, tower_positions[-3])
+            distances = np.abs(position[:, None] - tower_positions[None, :]).astype(np.int64)
+            nearest = np.argsort(distances, axis=1)[:, :5]
+            data = np.empty((history, len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+            data[:, 0] = times
+            data[:, 1::2] = towers[nearest]
+            data[:, 2::2] = np.take_along_axis(distances, nearest, axis=1)
+            conn.executemany(insert_sql, ((str(user), *row) for row in data.tolist()))
+
+
+def build_requests(db_path, count, history, repeat_rate, seed, request_step=0):
+    """
+    Request bodies: a random user at a random second, with the candidate cells of that
+    second and random loads. A `repeat_rate` fraction repeats one of the last requests.
+    With `request_step`, every user instead moves forward along their trajectory by
+    that many seconds from one request to the next, and tower loads drift slowly.
+    """
+    rng = random.Random(seed)
+    with sqlite3.connect(db_path) as conn:
+        users = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM user_trajectory")]
+        next_timestamp = {user_id: rng.randrange(100, history // 2) for user_id in users}
+        tower_loads = {}
+
+        def load_of(cell):
+            # Random loads, drifting slowly when users walk their trajectories like live traffic
+            if not request_step:
+                return rng.random()
+            load = tower_loads.get(cell, rng.random())
+            tower_loads[cell] = min(1.0, max(0.0, load + rng.uniform(-0.02, 0.02)))
+            return tower_loads[cell]
+
+        requests = []
+        for _ in range(count):
+            if requests and rng.random() < repeat_rate:
+                requests.append(rng.choice(requests[-50:]))
+                continue
+            user_id = rng.choice(users)
+            if request_step:
+                timestamp = next_timestamp[user_id]
+                next_timestamp[user_id] = 100 + (timestamp + request_step - 100) % (history - 200)
+            else:
+                timestamp = rng.randrange(100, history - 100)
+            cells = conn.execute(
+                "SELECT cell1, cell2, cell3, cell4, cell5 FROM user_trajectory WHERE user_id = ? AND time = ?",
+                (user_id, timestamp),
+            ).fetchone()
+            requests.append({
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "current_cell_tower": str(cells[0]),
+                "cell_tower_loads": {str(cell): round(load_of(cell), 2) for cell in cells},
+            })
+    return requests
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run(args, db_path):
+    import httpx
+    from api import app as app_module
+    from api.database import initialize_database
+    from api.fake_llm import FakeChatModel
+    from api.metrics import stage_timings
+
+    await initialize_database()
+    seed_trajectories(db_path, args.users, args.history, args.seed)
+    requests = build_requests(db_path, args.requests, args.history, args.repeat_rate, args.seed, args.request_step)
+
+    manager = app_module.network_agent_manager
+    manager.llm = FakeChatModel(
+        latency_ms=args.llm_latency_ms,
+        latency_sigma=args.llm_latency_sigma,
+        malformed_rate=args.llm_malformed_rate,
+        seed=args.seed,
+    )
+    if args.precompute:
+        await app_module.precompute_scheduler.start()
+    stage_timings.reset()
+
+    latencies = []
+    statuses = {}
+    sources = {}
+    queue = asyncio.Queue()
+    for body in requests:
+        queue.put_nowait(body)
+
+    async def worker(client):
+        while not queue.empty():
+            body = queue.get_nowait()
+            sent = time.perf_counter()
+            response = await client.post("/predict", json=body)
+            latencies.append((time.perf_counter() - sent) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                source = response.json()["source"]
+                sources[source] = sources.get(source, 0) + 1
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    await app_module.precompute_scheduler.stop()
+
+    latencies.sort()
+    stages = {
+        stage: {
+            "count": snapshot["count"],
+            "mean_ms": round(snapshot["mean"] * 1000, 3),
+            "p50_ms": round(snapshot["p50"] * 1000, 3),
+            "p95_ms": round(snapshot["p95"] * 1000, 3),
+            "p99_ms": round(snapshot["p99"] * 1000, 3),
+        }
+        for stage, snapshot in stage_timings.snapshot().items()
+    }
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+        "requests": len(latencies),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "sources": sources,
+        "llm_calls": manager.llm.calls,
+        "coalesced": manager.in_flight_predictions.coalesced,
+        "prediction_cache_hits": manager.prediction_cache.hits,
+        "precomputed_used": app_module.precompute_scheduler.store.used,
+        "precomputed_wasted": app_module.precompute_scheduler.store.wasted,
+        "precomputed_stale": app_module.precompute_scheduler.store.stale,
+        "stages": stages,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Print the change of every compared metric, return the regressed ones."""
+    regressions = []
+    print(f"\n{'metric':>16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key in COMPARED_LATENCIES + ["throughput_rps"]:
+        before, after = baseline[key], result[key]
+        change = (after - before) / before if before else 0.0
+        # Latencies regress when they grow, throughput when it drops
+        regressed = change > tolerance if key != "throughput_rps" else change < -tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{key:>16} {before:>10} {after:>10} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    for stage, current in result["stages"].items():
+        if stage in baseline.get("stages", {}):
+            before = baseline["stages"][stage]["p95_ms"]
+            print(f"{stage + ' p95':>16} {before:>10} {current['p95_ms']:>10}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /predict with a fake LLM backend.")
+    parser.add_argument("--requests", type=int, default=1000, help="Number of /predict requests (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at once (default: 32)")
+    parser.add_argument("--users", type=int, default=200, help="Seeded users (default: 200)")
+    parser.add_argument("--history", type=int, default=3600, help="Seconds of trajectory per user (default: 3600)")
+    parser.add_argument("--repeat-rate", type=float, default=0.1,
+                        help="Fraction of requests repeating a recent request (default: 0.1)")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Median fake LLM latency (default: 200)")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5,
+                        help="Log-normal sigma of the fake LLM latency, 0 for constant (default: 0.5)")
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0,
+                        help="Fraction of fake LLM answers that are not valid JSON (default: 0)")
+    parser.add_argument("--encoding", type=str, default="csv", help="TRAJECTORY_ENCODING of the prompt (default: csv)")
+    parser.add_argument("--deadline", type=float, default=10,
+                        help="PREDICT_DEADLINE_SECONDS, 0 for no limit (default: 10)")
+    parser.add_argument("--hedge-delay", type=float, default=0,
+                        help="LLM_HEDGE_DELAY_SECONDS, 0 to never hedge (default: 0)")
+    parser.add_argument("--request-step", type=int, default=0,
+                        help="Seconds each user moves along their trajectory between requests (default: 0, random)")
+    parser.add_argument("--precompute", action="store_true", help="Precompute upcoming predictions in the background")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    parser.add_argument("--compare", type=str, default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative regression for --compare (default: 0.1)")
+    args = parser.parse_args()
+
+    # The app reads its configuration at import time
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_predict_"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["TRAJECTORY_ENCODING"] = args.encoding
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["PREDICT_DEADLINE_SECONDS"] = str(args.deadline)
+    os.environ["LLM_HEDGE_DELAY_SECONDS"] = str(args.hedge_delay)
+    os.environ["PRECOMPUTE_ENABLED"] = "true" if args.precompute else "false"
+    logging.disable(logging.ERROR)
+
+    result = asyncio.run(run(args, db_path))
+    for key, value in result.items():
+        if key not in ("config", "stages"):
+            print(f"{key:>22}: {value}")
+    print(f"\n{'stage':>18} {'count':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, timing in result["stages"].items():
+        print(f"{stage:>18} {timing['count']:>7} {timing['mean_ms']:>9} {timing['p50_ms']:>9} "
+              f"{timing['p95_ms']:>9} {timing['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
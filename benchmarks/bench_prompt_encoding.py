@@ -0,0 +1,164 @@
+"""
+Prompt size and latency benchmark of the trajectory encodings.
+
+Encodes the same trajectory windows with every encoding of api/encoding.py and reports
+the encoded size (characters, estimated tokens), the size of the full rendered prompt
+and the encoding time. With --live, every prompt is also sent to Gemini to measure
+end-to-end latency and the input tokens actually billed.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_prompt_encoding
+    python -m benchmarks.bench_prompt_encoding --db user_trajectory.db --user-id 1 --live
+
+Arguments:
+    --windows: Number of trajectory windows to encode (default: 20).
+    --db: SQLite database to read windows from (default: synthetic trajectories).
+    --user-id: User whose windows are read from --db (default: 1).
+    --live: Also call Gemini (needs GEMINI_API_KEY) and measure latency.
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import statistics
+import time
+
+import numpy as np
+
+from api.database import TRAJECTORY_COLUMNS, MISSING_VALUE, trajectory_window_bounds
+from api.encoding import TRAJECTORY_ENCODINGS, estimate_tokens
+from api.services import build_recommendation_chat_prompt, build_recommendation_llm, parse_prompt_output_json
+from api.config import get_gemini_api_key
+
+CELL_TOWER_LOADS = {"187650": 0.7, "187648": 0.1, "306258": 0.1, "334594": 0.15, "334593": 0.2}
+
+
+def synthetic_window(timestamp, seed):
+    """
+    A [timestamp-100, timestamp+200] window of a user driving past a row of towers:
+    the serving cell changes every 40-120 seconds and the five candidates are the
+    nearest towers along the road.
+    """
+    rng = np.random.default_rng(seed)
+    start, end = trajectory_window_bounds(timestamp)
+    times = np.arange(start, end + 1)
+    towers = 180_000 + rng.choice(200_000, size=64, replace=False)
+    tower_positions = np.cumsum(rng.uniform(400, 1200, size=len(towers)))
+    speed = rng.uniform(8, 20)
+    position = tower_positions[2] + speed * (times - start)
+
+    distances = np.abs(position[:, None] - tower_positions[None, :]).astype(np.int64)
+    nearest = np.argsort(distances, axis=1)[:, :5]
+    data = np.empty((len(times), len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+    data[:, 0] = times
+    data[:, 1::2] = towers[nearest]
+    data[:, 2::2] = np.take_along_axis(distances, nearest, axis=1)
+    return data
+
+
+def db_windows(db_path, user_id, count):
+    """Windows of a user read from an existing trajectory database."""
+    columns = ", ".join(f"IFNULL({name}, {MISSING_VALUE})" for name in TRAJECTORY_COLUMNS)
+    with sqlite3.connect(db_path) as conn:
+        max_time = conn.execute("SELECT MAX(time) FROM user_trajectory WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if max_time is None:
+            raise ValueError(f"No trajectory rows for user_id {user_id} in {db_path}")
+        for timestamp in np.linspace(0, max(0, max_time - 200), count).astype(int):
+            start, end = trajectory_window_bounds(int(timestamp))
+            rows = conn.execute(
+                f"SELECT {columns} FROM user_trajectory WHERE user_id = ? AND time BETWEEN ? AND ? ORDER BY time",
+                (user_id, start, end),
+            ).fetchall()
+            yield int(timestamp), np.array(rows, dtype=np.int64).reshape(-1, len(TRAJECTORY_COLUMNS))
+
+
+def render_prompt(chat_prompt, encoding, data, timestamp):
+    return chat_prompt.format_messages(
+        trajectory_format=encoding.description,
+        trajectory_data=encoding.encode(data, timestamp),
+        timestamp=timestamp,
+        cell_tower_loads=CELL_TOWER_LOADS,
+        current_cell_tower=int(data[len(data) // 3, 1]) if len(data) else 0,
+    )
+
+
+async def measure_live(llm, chat_prompt, encoding, windows):
+    """End-to-end Gemini latency and billed input tokens of one encoding."""
+    latencies, input_tokens, parse_failures = [], [], 0
+    for timestamp, data in windows:
+        messages = render_prompt(chat_prompt, encoding, data, timestamp)
+        started = time.perf_counter()
+        response = await llm.ainvoke(messages)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if getattr(response, "usage_metadata", None):
+            input_tokens.append(response.usage_metadata["input_tokens"])
+        try:
+            parse_prompt_output_json(response.content)
+        except ValueError:
+            parse_failures += 1
+    return {
+        "llm_p50_ms": round(statistics.median(latencies), 1),
+        "llm_max_ms": round(max(latencies), 1),
+        "billed_input_tokens": round(statistics.mean(input_tokens)) if input_tokens else None,
+        "parse_failures": parse_failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt size and latency of the trajectory encodings.")
+    parser.add_argument("--windows", type=int, default=20, help="Number of trajectory windows (default: 20)")
+    parser.add_argument("--db", type=str, default=None, help="SQLite database to read windows from")
+    parser.add_argument("--user-id", type=str, default="1", help="User whose windows are read from --db")
+    parser.add_argument("--live", action="store_true", help="Also call Gemini and measure latency")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.db:
+        windows = list(db_windows(args.db, args.user_id, args.windows))
+    else:
+        windows = [(1000 + 500 * i, synthetic_window(1000 + 500 * i, seed=i)) for i in range(args.windows)]
+
+    chat_prompt = build_recommendation_chat_prompt()
+    llm = build_recommendation_llm(get_gemini_api_key()) if args.live else None
+
+    results = []
+    for name, encoding in TRAJECTORY_ENCODINGS.items():
+        chars, tokens, prompt_tokens, encode_us = [], [], [], []
+        for timestamp, data in windows:
+            started = time.perf_counter()
+            text = encoding.encode(data, timestamp)
+            encode_us.append((time.perf_counter() - started) * 1e6)
+            chars.append(len(text))
+            tokens.append(estimate_tokens(text))
+            messages = render_prompt(chat_prompt, encoding, data, timestamp)
+            prompt_tokens.append(sum(estimate_tokens(message.content) for message in messages))
+
+        result = {
+            "encoding": name,
+            "data_chars": round(statistics.mean(chars)),
+            "data_tokens": round(statistics.mean(tokens)),
+            "prompt_tokens": round(statistics.mean(prompt_tokens)),
+            "encode_us": round(statistics.median(encode_us), 1),
+        }
+        if llm is not None:
+            result.update(asyncio.run(measure_live(llm, chat_prompt, encoding, windows)))
+        results.append(result)
+
+    baseline = results[0]["prompt_tokens"]
+    print(f"{'encoding':>10} {'chars':>8} {'tokens':>8} {'prompt':>8} {'vs csv':>7} {'encode':>10}")
+    for result in results:
+        print(f"{result['encoding']:>10} {result['data_chars']:>8} {result['data_tokens']:>8} "
+              f"{result['prompt_tokens']:>8} {result['prompt_tokens'] / baseline:>7.0%} {result['encode_us']:>8.0f}us"
+              + (f"  llm p50 {result['llm_p50_ms']:.0f} ms, billed {result['billed_input_tokens']} tokens"
+                 if "llm_p50_ms" in result else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
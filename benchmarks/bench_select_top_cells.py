@@ -0,0 +1,130 @@
+"""
+select_top_cells benchmark: the spatial index against the original double loop.
+
+Generates random cells over a city-sized box and a random route through it, and times
+selecting the cells closest to the route with:
+
+    - loop:   the original implementation, one haversine_distances call per
+              (cell, route point) pair
+    - index:  util-scripts/select_top_cells.py on the spatial index of
+              util-scripts/spatial_index.py
+
+The loop is only run while cells x route points stays under --loop-max-pairs; beyond
+that its time is extrapolated from the largest measured size.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_select_top_cells --cells 100 1000 100000 --route-points 100 10000
+
+Arguments:
+    --cells: Cell counts to measure (default: 100, 1000, 10000, 100000).
+    --route-points: Route lengths, in points, to measure (default: 100, 1000, 10000).
+    --top-n: Cells to select (default: 20).
+    --loop-max-pairs: Largest cells x route points run with the original loop (default: 50000).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import haversine_distances
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util-scripts"))
+
+from select_top_cells import find_nearest_cells  # noqa: E402
+
+# Roughly the extent of a large city
+CENTER = (77.59, 12.97)
+SPAN_DEGREES = 0.4
+
+
+def loop_find_nearest_cells(cells_data, geolocation_data, top_n=20):
+    """The original select_top_cells implementation, without its printing."""
+    results = []
+    for cell in cells_data.get("cells", []):
+        distances = []
+        cell_coords = np.radians([[cell["lat"], cell["lon"]]])
+        for geo_point in geolocation_data:
+            geo_point = list(reversed(geo_point))
+            geo_coords = np.radians([geo_point])
+            distance = haversine_distances(cell_coords, geo_coords)[0][0] * 6371
+            distances.append({"cell": cell, "geo_point": geo_point, "distance": distance})
+        results.append(sorted(distances, key=lambda x: x["distance"])[0])
+    return [data.get("cell") for data in sorted(results, key=lambda x: x["distance"])[:top_n]]
+
+
+def make_cells(count, rng):
+    lons = CENTER[0] + rng.uniform(-SPAN_DEGREES / 2, SPAN_DEGREES / 2, count)
+    lats = CENTER[1] + rng.uniform(-SPAN_DEGREES / 2, SPAN_DEGREES / 2, count)
+    return {"cells": [{"cellid": i, "lat": float(lat), "lon": float(lon)} for i, (lat, lon) in enumerate(zip(lats, lons))]}
+
+
+def make_route(points, rng):
+    """A random walk of `points` [lon, lat] points, about 10 m apart."""
+    steps = rng.normal(0, 1e-4, size=(points, 2)) + np.array([6e-5, 3e-5])
+    return (np.array(CENTER) - SPAN_DEGREES / 4 + np.cumsum(steps, axis=0)).tolist()
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark select_top_cells: spatial index vs. the original loop.")
+    parser.add_argument("--cells", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="Cell counts to measure")
+    parser.add_argument("--route-points", type=int, nargs="+", default=[100, 1000, 10000], help="Route lengths to measure")
+    parser.add_argument("--top-n", type=int, default=20, help="Cells to select (default: 20)")
+    parser.add_argument("--loop-max-pairs", type=int, default=50_000,
+                        help="Largest cells x route points run with the original loop (default: 50000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # Seconds per (cell, route point) pair of the loop, from the largest measured run
+    loop_pair_seconds = None
+    results = []
+    print(f"{'cells':>8} {'route':>8} {'loop':>12} {'index':>10} {'speedup':>9}  same")
+    for route_points in args.route_points:
+        route = make_route(route_points, rng)
+        for cell_count in args.cells:
+            cells = make_cells(cell_count, rng)
+            pairs = cell_count * route_points
+
+            index_seconds, selected = timed(find_nearest_cells, cells, route, top_n=args.top_n)
+            result = {"cells": cell_count, "route_points": route_points, "index_s": round(index_seconds, 4)}
+            if pairs <= args.loop_max_pairs:
+                loop_seconds, expected = timed(loop_find_nearest_cells, cells, route, top_n=args.top_n)
+                loop_pair_seconds = loop_seconds / pairs
+                result.update(loop_s=round(loop_seconds, 3), loop_extrapolated=False,
+                              same_selection=[c["cellid"] for c in selected] == [c["cellid"] for c in expected])
+            elif loop_pair_seconds is not None:
+                result.update(loop_s=round(loop_pair_seconds * pairs, 1), loop_extrapolated=True, same_selection=None)
+            else:
+                result.update(loop_s=None, loop_extrapolated=None, same_selection=None)
+            result["speedup"] = round(result["loop_s"] / index_seconds) if result["loop_s"] else None
+            results.append(result)
+
+            loop_label = "-" if result["loop_s"] is None else f"{result['loop_s']}s" + ("*" if result["loop_extrapolated"] else "")
+            print(f"{cell_count:>8} {route_points:>8} {loop_label:>12} {index_seconds:>9.3f}s "
+                  f"{(str(result['speedup']) + 'x') if result['speedup'] else '-':>9}  "
+                  f"{'-' if result['same_selection'] is None else result['same_selection']}")
+    print("\n* extrapolated from the largest measured loop run")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Cold start benchmark of the API server.
+
+Measures, each in fresh interpreters (median of --repeats runs):
+
+    - import:  time to import api.app, and the LLM stack modules it no longer imports
+               up front (paid on the first prompt render / Gemini call instead)
+    - startup: time from launching `uvicorn api.app:app` until it answers GET /ready
+               (serving) and until /ready reports the data loaded (ready), on a scratch
+               directory with a synthetic data/user_trajectory.csv of --rows rows, with
+               BACKGROUND_DATA_LOAD=true and false
+    - first prediction: latency of the first /predict once ready, with the fake LLM
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_startup --rows 1000000 --repeats 5 --json startup.json
+
+Arguments:
+    --rows: Rows of the synthetic trajectory CSV (default: 200000).
+    --users: Users the rows are spread over (default: 10).
+    --repeats: Runs per measurement (default: 3).
+    --timeout: Seconds to wait for a server to become ready (default: 300).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTED_MODULES = ["api.app"]
+LAZY_MODULES = ["langchain_core.prompts", "langchain_core.language_models.chat_models", "langchain_google_genai"]
+
+_IMPORT_SNIPPET = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def import_seconds(module):
+    """Import time of `module` in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET.format(module=module)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def write_csv(path, rows, users):
+    per_user = rows // users
+    with open(path, "w") as f:
+        f.write("user_id,time,cell1,distance1,cell2,distance2,cell3,distance3,cell4,distance4,cell5,distance5\n")
+        for user in range(users):
+            f.write("".join(
+                f"{user},{t},{1000 + t // 300},100,{2000 + t // 300},200,3,300,4,400,5,500\n" for t in range(per_user)
+            ))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(url, body=None):
+    """(status, JSON body) of a GET, or of a POST of `body`; None while nothing listens."""
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def start_server(workdir, background_load, timeout):
+    """Seconds until the server answers /ready and until it is ready, and the first prediction (ms)."""
+    database = os.path.join(workdir, "bench.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{database}",
+        "BACKGROUND_DATA_LOAD": str(background_load).lower(),
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_MS": "1",
+    }
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    serving = None
+    try:
+        while time.perf_counter() - started < timeout:
+            answer = request(f"http://127.0.0.1:{port}/ready")
+            if answer is not None:
+                serving = serving or time.perf_counter() - started
+                if answer[1]["status"] == "ready":
+                    break
+                if answer[1]["status"] == "failed":
+                    raise RuntimeError(f"Data load failed: {answer[1]['error']}")
+            time.sleep(0.01)
+        else:
+            raise RuntimeError(f"Server not ready after {timeout}s")
+        ready = time.perf_counter() - started
+        prediction_started = time.perf_counter()
+        status, _ = request(
+            f"http://127.0.0.1:{port}/predict",
+            {"user_id": "0", "cell_tower_loads": {"1001": 0.2}, "timestamp": 500, "current_cell_tower": "1001"},
+        )
+        first_prediction_ms = (time.perf_counter() - prediction_started) * 1000
+        if status != 200:
+            raise RuntimeError(f"/predict answered {status}")
+    finally:
+        server.terminate()
+        server.wait()
+    return serving, ready, first_prediction_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import and startup time of the API server.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows of the synthetic trajectory CSV (default: 200000)")
+    parser.add_argument("--users", type=int, default=10, help="Users the rows are spread over (default: 10)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per measurement (default: 3)")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for readiness (default: 300)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    results = {"import_s": {}, "startup": {}}
+    print("import (fresh interpreter, median)")
+    for module in IMPORTED_MODULES + LAZY_MODULES:
+        seconds = statistics.median(import_seconds(module) for _ in range(args.repeats))
+        results["import_s"][module] = round(seconds, 3)
+        note = "" if module in IMPORTED_MODULES else "  (deferred to first use)"
+        print(f"  {module:<45} {seconds:6.2f}s{note}")
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        write_csv(os.path.join(workdir, "data", "user_trajectory.csv"), args.rows, args.users)
+        print(f"\nstartup with a {args.rows:,}-row CSV (median)")
+        for background_load in (True, False):
+            runs = [start_server(workdir, background_load, args.timeout) for _ in range(args.repeats)]
+            serving, ready, first_prediction_ms = (statistics.median(values) for values in zip(*runs))
+            name = f"BACKGROUND_DATA_LOAD={str(background_load).lower()}"
+            results["startup"][name] = {"serving_s": round(serving, 3), "ready_s": round(ready, 3),
+                                        "first_prediction_ms": round(first_prediction_ms, 1)}
+            print(f"  {name:<27} serving after {serving:6.2f}s  ready after {ready:6.2f}s  "
+                  f"first prediction {first_prediction_ms:7.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
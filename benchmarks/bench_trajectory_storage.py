@@ -0,0 +1,172 @@
+"""
+Trajectory storage backend benchmark: the memory-mapped columnar store of api/storage.py
+against the indexed user_trajectory table.
+
+Grows a scratch table through the given sizes and, at every size, migrates it into a
+columnar store and measures, on both backends, the latency of:
+
+    - window:    the [timestamp-100, timestamp+200] window of a prediction
+    - history:   the periodicity lookup, the recent window plus the same window one
+                 to --cycles days earlier, in one call
+    - long:      a --long-seconds window, e.g. a whole-history analysis
+
+along with the migration time and the size on disk of the table and of the store.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_trajectory_storage --sizes 100000 1000000 10000000 --users 100
+
+Arguments:
+    --sizes: Table sizes (rows) to measure at (default: 100k, 1M).
+    --users: Number of users the rows are spread over (default: 100).
+    --queries: Reads per measurement (default: 300).
+    --cycles: Past days read by the history query (default: 3).
+    --long-seconds: Length of the long window (default: 3600).
+    --db: Scratch SQLite file (default: a temporary file).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.database import get_user_trajectory_ranges, merge_time_ranges
+from api.storage import ColumnarTrajectoryStore, migrate_trajectory_table
+from benchmarks.bench_trajectory_window import INDEX_NAME, create_table, grow_table
+
+DAY_SECONDS = 24 * 3600
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def make_queries(kind, users, max_time, queries, cycles, long_seconds, seed=0):
+    """(user_id, ranges) of `queries` random reads of one kind."""
+    rng = random.Random(seed)
+    reads = []
+    for _ in range(queries):
+        user_id = str(rng.randrange(users))
+        timestamp = rng.randrange(max(1, max_time))
+        if kind == "window":
+            ranges = [(max(0, timestamp - 100), timestamp + 200)]
+        elif kind == "history":
+            ranges = [(max(0, timestamp - 100), timestamp - 1)] + [
+                (max(0, timestamp - cycle * DAY_SECONDS - 100), timestamp - cycle * DAY_SECONDS + 200)
+                for cycle in range(1, cycles + 1)
+                if timestamp - cycle * DAY_SECONDS + 200 >= 0
+            ]
+        else:
+            ranges = [(max(0, timestamp - long_seconds), timestamp)]
+        reads.append((user_id, ranges))
+    return reads
+
+
+async def measure(session_factory, read, reads):
+    """Median and p99 latency (ms) and rows/s of the reads."""
+    latencies = []
+    rows = 0
+    async with session_factory() as db:
+        for user_id, ranges in reads:
+            started = time.perf_counter()
+            data = await read(user_id, ranges, db)
+            latencies.append((time.perf_counter() - started) * 1000)
+            rows += len(data)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 4),
+        "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))], 4),
+        "rows_per_s": round(rows / (sum(latencies) / 1000)),
+    }
+
+
+async def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_storage_"), "bench.db")
+    store_path = f"{db_path}.store"
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_table(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"CREATE INDEX {INDEX_NAME} ON user_trajectory (user_id, time)")
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    results = []
+    rows = 0
+    try:
+        for size in sorted(args.sizes):
+            grow_table(db_path, rows, size, args.users)
+            rows = size
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("VACUUM")
+
+            started = time.perf_counter()
+            migrate_trajectory_table(db_path, store_path)
+            migrate_s = time.perf_counter() - started
+            started = time.perf_counter()
+            store = ColumnarTrajectoryStore(store_path)
+            open_ms = (time.perf_counter() - started) * 1000
+            await engine.dispose()
+
+            async def read_columnar(user_id, ranges, db):
+                return await store.read_ranges(user_id, merge_time_ranges(ranges), db)
+
+            sizes = {"table_mb": round(os.path.getsize(db_path) / 2**20, 1),
+                     "store_mb": round(directory_size(store_path) / 2**20, 1)}
+            print(f"\n{size:,} rows: migrated in {migrate_s:.1f}s, store opened in {open_ms:.1f} ms, "
+                  f"table {sizes['table_mb']} MB, store {sizes['store_mb']} MB")
+
+            max_time = size // args.users
+            for kind in ("window", "history", "long"):
+                reads = make_queries(kind, args.users, max_time, args.queries, args.cycles, args.long_seconds)
+                line = f"  {kind:>8}"
+                for backend, read in (("sqlite", get_user_trajectory_ranges), ("columnar", read_columnar)):
+                    stats = await measure(session_factory, read, reads)
+                    results.append({"rows": size, "query": kind, "backend": backend, "queries": len(reads),
+                                    "migrate_s": round(migrate_s, 2), "open_ms": round(open_ms, 2),
+                                    **sizes, **stats})
+                    line += (f"  {backend} p50 {stats['p50_ms']:8.3f} ms p99 {stats['p99_ms']:8.3f} ms "
+                             f"{stats['rows_per_s']:>12,} rows/s")
+                print(line)
+            del store
+    finally:
+        await engine.dispose()
+        shutil.rmtree(store_path, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the columnar trajectory store against SQLite.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000],
+                        help="Table sizes (rows) to measure at (default: 100k 1M)")
+    parser.add_argument("--users", type=int, default=100,
+                        help="Number of users the rows are spread over (default: 100)")
+    parser.add_argument("--queries", type=int, default=300,
+                        help="Reads per measurement (default: 300)")
+    parser.add_argument("--cycles", type=int, default=3,
+                        help="Past days read by the history query (default: 3)")
+    parser.add_argument("--long-seconds", type=int, default=3600,
+                        help="Length of the long window (default: 3600)")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Scratch SQLite file (default: a temporary file)")
+    parser.add_argument("--json", type=str, default=None,
+                        help="Optional path to also write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Trajectory window query benchmark.
+
+Grows a scratch `user_trajectory` table through the given sizes and, at every size,
+measures the latency of the [timestamp-100, timestamp+200] window query with:
+
+    - orm:    the original path (ORM objects -> DataFrame -> astype(int))
+    - fast:   get_user_trajectory_ranges (raw DBAPI tuples -> NumPy)
+
+each with and without the (user_id, time) index.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_trajectory_window --sizes 10000 100000 1000000 10000000
+
+Arguments:
+    --sizes: Table sizes (rows) to measure at (default: 10k, 100k, 1M).
+    --users: Number of users the rows are spread over (default: 100).
+    --queries: Window queries per measurement (default: 200).
+    --db: Scratch SQLite file (default: a temporary file).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from api.database import UserTrajectory, TRAJECTORY_COLUMNS, get_user_trajectory_ranges
+
+INDEX_NAME = "ix_user_trajectory_user_id_time"
+INSERT_SQL = (
+    f"INSERT INTO user_trajectory (user_id, {', '.join(TRAJECTORY_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * (len(TRAJECTORY_COLUMNS) + 1))})"
+)
+
+
+def create_table(db_path):
+    """Create an empty user_trajectory table without the window index."""
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    UserTrajectory.__table__.create(sync_engine)
+    sync_engine.dispose()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+def grow_table(db_path, start_row, end_row, users, batch_size=100_000):
+    """
+    Append rows [start_row, end_row) of a synthetic dataset. Rows are interleaved
+    between users the way live measurement reports arrive, one per second per user.
+    """
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA synchronous=OFF")
+        for batch_start in range(start_row, end_row, batch_size):
+            rows = np.arange(batch_start, min(end_row, batch_start + batch_size))
+            user = rows % users
+            t = rows // users
+            cell = 100_000 + (t // 300) % 50
+            conn.executemany(
+                INSERT_SQL,
+                (
+                    (str(u), int(s), int(c), 100, int(c) + 1, 200, int(c) + 2, 300, int(c) + 3, 400, int(c) + 4, 500)
+                    for u, s, c in zip(user, t, cell)
+                ),
+            )
+
+
+async def query_orm(user_id, timestamp, db):
+    """The original window query of get_user_trajectory_data."""
+    result = await db.execute(
+        select(UserTrajectory)
+        .where(UserTrajectory.user_id == user_id)
+        .where(UserTrajectory.time >= max(0, timestamp - 100))
+        .where(UserTrajectory.time <= timestamp + 200)
+    )
+    trajectories = result.scalars().all()
+    df = pd.DataFrame([
+        {c.name: getattr(trajectory, c.name) for c in UserTrajectory.__table__.columns}
+        for trajectory in trajectories
+    ])
+    df = df.drop(["id", "user_id"], axis=1)
+    for col in df.columns:
+        df[col] = df[col].astype(int)
+    return df
+
+
+async def query_fast(user_id, timestamp, db):
+    return await get_user_trajectory_ranges(user_id, [(max(0, timestamp - 100), timestamp + 200)], db)
+
+
+async def measure(session_factory, query, users, max_time, queries, seed=0):
+    """Median and p95 latency (ms) of `queries` random window queries."""
+    rng = random.Random(seed)
+    latencies = []
+    async with session_factory() as db:
+        for _ in range(queries):
+            user_id = str(rng.randrange(users))
+            timestamp = rng.randrange(max(1, max_time))
+            started = time.perf_counter()
+            await query(user_id, timestamp, db)
+            latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+    }
+
+
+async def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench_window_"), "bench.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    create_table(db_path)
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    results = []
+    rows = 0
+    for size in sorted(args.sizes):
+        started = time.perf_counter()
+        grow_table(db_path, rows, size, args.users)
+        rows = size
+        print(f"\n{size:,} rows (loaded in {time.perf_counter() - started:.1f}s)")
+
+        max_time = size // args.users
+        for indexed in (False, True):
+            with sqlite3.connect(db_path) as conn:
+                if indexed:
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON user_trajectory (user_id, time)")
+                else:
+                    conn.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+            await engine.dispose()
+
+            for name, query in (("orm", query_orm), ("fast", query_fast)):
+                # Unindexed queries scan the whole table, keep them affordable on big tables
+                queries = args.queries if indexed else max(5, args.queries * 10_000 // size)
+                stats = await measure(session_factory, query, args.users, max_time, queries)
+                result = {"rows": size, "indexed": indexed, "path": name, "queries": queries, **stats}
+                results.append(result)
+                print(f"  {'indexed' if indexed else 'no index':>8}  {name:>4}  "
+                      f"p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms")
+
+    await engine.dispose()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trajectory window queries as the table grows.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Table sizes (rows) to measure at (default: 10k 100k 1M)")
+    parser.add_argument("--users", type=int, default=100,
+                        help="Number of users the rows are spread over (default: 100)")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Window queries per measurement (default: 200)")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Scratch SQLite file (default: a temporary file)")
+    parser.add_argument("--json", type=str, default=None,
+                        help="Optional path to also write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
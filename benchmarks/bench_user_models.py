@@ -0,0 +1,187 @@
+"""
+Warm-start benchmark of the persisted per-user models of api/user_model.py.
+
+Seeds a scratch database with the half hour around noon of --days days for
+--periodic-users repeating the same route every day and --aperiodic-users driving new
+roads, then replays --rounds prediction requests per user at noon of the last day
+(--request-step seconds apart, one round over every user at a time) through
+NetworkAgentManager with the fake LLM, in three processes:
+
+    - cold:          a fresh process without user models
+    - cold + models: a fresh process loading the models persisted by an earlier run
+                     over the preceding requests
+    - warm:          the process of that earlier run, continuing with its caches
+
+and reports the mean latency of each round, the periodicity checks made and the
+time spent in them, so the rounds a cold process needs to reach warm latency can
+be read off.
+
+Sample usage (from the repository root):
+    python -m benchmarks.bench_user_models --periodic-users 50 --aperiodic-users 50 --rounds 5
+
+Arguments:
+    --periodic-users: Users repeating a daily route (default: 30).
+    --aperiodic-users: Users without periodicity (default: 30).
+    --days: Days of history per user (default: 5).
+    --rounds: Requests per user and process (default: 5).
+    --request-step: Seconds between the requests of a user (default: 10).
+    --llm-latency-ms: Median latency of the fake LLM (default: 20).
+    --seed: Random seed (default: 0).
+    --json: Optional path to also write the results as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+DAY_SECONDS = 24 * 3600
+NOON = DAY_SECONDS // 2
+# Seconds of history seeded on either side of noon
+SEEDED_SECONDS = 900
+
+
+def seed_history(db_path, periodic_users, aperiodic_users, days, seed):
+    """
+    Periodic users pass the same towers at the same time of every day; aperiodic
+    users get a random tower every 5 minutes.
+    """
+    from api.database import TRAJECTORY_COLUMNS
+
+    rng = np.random.default_rng(seed)
+    insert_sql = (
+        f"INSERT INTO user_trajectory (user_id, {', '.join(TRAJECTORY_COLUMNS)}) "
+        f"VALUES ({', '.join(['?'] * (len(TRAJECTORY_COLUMNS) + 1))})"
+    )
+    times = (np.arange(days)[:, None] * DAY_SECONDS + np.arange(NOON - SEEDED_SECONDS, NOON + SEEDED_SECONDS)).ravel()
+    with sqlite3.connect(db_path) as conn:
+        for user in range(periodic_users + aperiodic_users):
+            towers = 180_000 + rng.choice(200_000, size=400, replace=False)
+            if user < periodic_users:
+                slot = (times % DAY_SECONDS) // 300
+            else:
+                slot = rng.integers(0, len(towers), size=len(times) // 300 + 1).repeat(300)[:len(times)]
+            data = np.empty((len(times), len(TRAJECTORY_COLUMNS)), dtype=np.int64)
+            data[:, 0] = times
+            for k in range(5):
+                data[:, 1 + 2 * k] = towers[(slot + k) % len(towers)]
+                data[:, 2 + 2 * k] = 100 * (k + 1)
+            conn.executemany(insert_sql, ((f"u{user}", *row) for row in data.tolist()))
+
+
+async def replay(manager, session_factory, users, timestamps):
+    """Mean latency (ms) of every round of requests, and the periodicity checks made."""
+    from api.metrics import stage_timings
+
+    stage_timings.reset()
+    rounds = []
+    for timestamp in timestamps:
+        latencies = []
+        for user_id in users:
+            async with session_factory() as db:
+                agent = manager.get_agent(user_id)
+                cell = await _serving_cell(user_id, timestamp, db)
+                started = time.perf_counter()
+                await agent.predict_best_cell_towers(user_id, {cell: 0.5}, timestamp, cell, db)
+                latencies.append((time.perf_counter() - started) * 1000)
+        rounds.append(round(float(np.mean(latencies)), 3))
+    periodicity = stage_timings.snapshot().get("periodicity", {"count": 0, "sum": 0.0})
+    return {"round_ms": rounds, "periodicity_checks": periodicity["count"],
+            "periodicity_ms": round(periodicity["sum"] * 1000, 1)}
+
+
+async def _serving_cell(user_id, timestamp, db):
+    from api.database import get_user_trajectory_ranges
+
+    data = await get_user_trajectory_ranges(user_id, [(timestamp, timestamp)], db)
+    return str(int(data[0, 1])) if len(data) else "0"
+
+
+async def run(args):
+    from sqlalchemy import create_engine
+
+    from api.database import AsyncSessionLocal, Base, trajectory_cache
+    from api.fake_llm import FakeChatModel
+    from api.services import NetworkAgentManager
+    from api.user_model import UserModelStore
+
+    db_path = os.environ["BENCH_DB_PATH"]
+    sync_engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    seed_history(db_path, args.periodic_users, args.aperiodic_users, args.days, args.seed)
+    users = [f"u{user}" for user in range(args.periodic_users + args.aperiodic_users)]
+    start = (args.days - 1) * DAY_SECONDS + NOON - args.rounds * args.request_step
+    before = [start + i * args.request_step for i in range(args.rounds)]
+    after = [start + (args.rounds + i) * args.request_step for i in range(args.rounds)]
+
+    def new_process(with_models):
+        trajectory_cache.clear()
+        store = UserModelStore(AsyncSessionLocal) if with_models else None
+        manager = NetworkAgentManager(api_key=None, llm=FakeChatModel(latency_ms=args.llm_latency_ms, seed=args.seed),
+                                      user_models=store)
+        return manager, store
+
+    results = {}
+    manager, _ = new_process(False)
+    results["cold"] = await replay(manager, AsyncSessionLocal, users, after)
+
+    # An earlier run learns and persists the models, then keeps going warm
+    manager, store = new_process(True)
+    await replay(manager, AsyncSessionLocal, users, before)
+    await store.flush()
+    warm_manager = manager
+
+    manager, store = new_process(True)
+    results["cold + models"] = await replay(manager, AsyncSessionLocal, users, after)
+    results["cold + models"]["models_loaded"] = store.loaded
+    results["warm"] = await replay(warm_manager, AsyncSessionLocal, users, after)
+
+    with sqlite3.connect(db_path) as conn:
+        sizes = conn.execute("SELECT AVG(LENGTH(model)), MAX(LENGTH(model)) FROM user_contexts").fetchone()
+    results["model_bytes"] = {"mean": round(sizes[0] or 0, 1), "max": sizes[1]}
+
+    print(f"{args.periodic_users} periodic + {args.aperiodic_users} aperiodic users, "
+          f"{args.rounds} rounds, fake LLM {args.llm_latency_ms:g} ms\n")
+    print(f"{'process':>14}  " + "  ".join(f"{f'round {i + 1}':>9}" for i in range(args.rounds))
+          + f"  {'periodicity checks':>19}  {'periodicity ms':>14}")
+    for name in ("cold", "cold + models", "warm"):
+        result = results[name]
+        print(f"{name:>14}  " + "  ".join(f"{ms:>7.2f}ms" for ms in result["round_ms"])
+              + f"  {result['periodicity_checks']:>19}  {result['periodicity_ms']:>14}")
+    print(f"\nstored model size: {results['model_bytes']['mean']} bytes on average, {results['model_bytes']['max']} at most")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.json}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark warm starts from persisted user models.")
+    parser.add_argument("--periodic-users", type=int, default=30, help="Users repeating a daily route (default: 30)")
+    parser.add_argument("--aperiodic-users", type=int, default=30, help="Users without periodicity (default: 30)")
+    parser.add_argument("--days", type=int, default=5, help="Days of history per user (default: 5)")
+    parser.add_argument("--rounds", type=int, default=5, help="Requests per user and process (default: 5)")
+    parser.add_argument("--request-step", type=int, default=10, help="Seconds between requests (default: 10)")
+    parser.add_argument("--llm-latency-ms", type=float, default=20, help="Median fake LLM latency (default: 20)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", type=str, default=None, help="Optional path to also write the results as JSON")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_user_models_"), "bench.db")
+    # Point the app at the scratch database before importing it
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db_path}"
+    os.environ["BENCH_DB_PATH"] = db_path
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
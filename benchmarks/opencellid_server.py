@@ -0,0 +1,135 @@
+"""
+Local stand-in for the OpenCellID getInArea API, to run util-scripts/find_cells.py and
+its benchmarks without an API key or network access.
+
+Serves a fixed random set of cells: --cells spread uniformly over the region and
+--urban-cells packed in a small box at its center. A request returns the cells inside
+its BBOX, at most --cap of them like the real API, after --latency-ms milliseconds,
+and fails with a 503 with probability --error-rate.
+
+Sample usage (from the repository root):
+    python -m benchmarks.opencellid_server --port 8081
+    cd util-scripts && python find_cells.py --mcc 404 --mnc 45 --input region.geojson \\
+        --base-url http://127.0.0.1:8081/cell/getInArea
+
+Arguments:
+    --port: Port to listen on (default: 8081).
+    --bbox: Region as min_lon min_lat max_lon max_lat (default: 77.45 12.85 77.75 13.15).
+    --cells: Cells spread over the region (default: 2000).
+    --urban-cells: Cells packed at the center of the region (default: 3000).
+    --cap: Cells returned per request at most (default: 50).
+    --latency-ms: Latency of every response (default: 50).
+    --error-rate: Fraction of requests failing with a 503 (default: 0).
+    --seed: Random seed (default: 0).
+"""
+
+import argparse
+import asyncio
+import random
+import threading
+
+import numpy as np
+from aiohttp import web
+
+DEFAULT_BBOX = (77.45, 12.85, 77.75, 13.15)
+PATH = "/cell/getInArea"
+
+
+def make_cells(bbox, cells, urban_cells, mcc=404, mnc=45, seed=0):
+    """Random cells over `bbox` (min_lon, min_lat, max_lon, max_lat), plus a dense center."""
+    rng = np.random.default_rng(seed)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lons = rng.uniform(min_lon, max_lon, cells)
+    lats = rng.uniform(min_lat, max_lat, cells)
+    center_lon, center_lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+    span = (max_lon - min_lon) / 20
+    lons = np.concatenate([lons, rng.uniform(center_lon - span, center_lon + span, urban_cells)])
+    lats = np.concatenate([lats, rng.uniform(center_lat - span, center_lat + span, urban_cells)])
+    return [
+        {"lat": float(lat), "lon": float(lon), "mcc": mcc, "mnc": mnc, "lac": 1000 + i // 100,
+         "cellid": 100_000 + i, "averageSignalStrength": 0, "range": 1000, "samples": 10,
+         "changeable": 1, "radio": "LTE"}
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    ]
+
+
+class OpenCellIDStandIn:
+    """The getInArea endpoint over a fixed list of cells, with its request count."""
+
+    def __init__(self, cells, cap=50, latency_ms=50, error_rate=0.0, seed=0):
+        self.cells = cells
+        self.lats = np.array([cell["lat"] for cell in cells])
+        self.lons = np.array([cell["lon"] for cell in cells])
+        self.cap = cap
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+
+    async def get_in_area(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.random.random() < self.error_rate:
+            return web.json_response({"error": "Service unavailable"}, status=503)
+        try:
+            min_lat, min_lon, max_lat, max_lon = map(float, request.query["BBOX"].split(","))
+        except (KeyError, ValueError):
+            return web.json_response({"error": "Invalid BBOX", "code": 4}, status=200)
+        limit = min(self.cap, int(request.query.get("limit", self.cap)))
+        inside = np.flatnonzero(
+            (self.lats >= min_lat) & (self.lats <= max_lat) & (self.lons >= min_lon) & (self.lons <= max_lon)
+        )
+        cells = [self.cells[i] for i in inside[:limit]]
+        return web.json_response({"count": len(cells), "cells": cells})
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get(PATH, self.get_in_area)
+        return app
+
+
+def serve_in_thread(stand_in, port=0):
+    """
+    Serve `stand_in` on 127.0.0.1 from a background thread, for callers that block.
+
+    Returns:
+        (str, callable): The getInArea URL, and a function stopping the server.
+    """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(stand_in.application())
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return f"http://127.0.0.1:{port}{PATH}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the OpenCellID getInArea API.")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on (default: 8081)")
+    parser.add_argument("--bbox", type=float, nargs=4, default=list(DEFAULT_BBOX),
+                        help="Region as min_lon min_lat max_lon max_lat")
+    parser.add_argument("--cells", type=int, default=2000, help="Cells spread over the region (default: 2000)")
+    parser.add_argument("--urban-cells", type=int, default=3000, help="Cells packed at the center (default: 3000)")
+    parser.add_argument("--cap", type=int, default=50, help="Cells returned per request at most (default: 50)")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latency of every response (default: 50)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests failing with a 503")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    cells = make_cells(args.bbox, args.cells, args.urban_cells, seed=args.seed)
+    stand_in = OpenCellIDStandIn(cells, args.cap, args.latency_ms, args.error_rate, args.seed)
+    print(f"Serving {len(cells)} cells on http://127.0.0.1:{args.port}{PATH}")
+    web.run_app(stand_in.application(), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
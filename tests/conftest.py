@@ -0,0 +1,16 @@
+"""
+Shared setup of the test suite: the app runs against a scratch SQLite database and
+the fake LLM, and the scripts of util-scripts/ are importable as top-level modules.
+"""
+
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Set before api.database is first imported, it reads them at import time
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='tests_'), 'test.db')}"
+os.environ["LLM_BACKEND"] = "fake"
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "util-scripts"))
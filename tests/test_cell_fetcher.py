@@ -0,0 +1,107 @@
+"""
+CellFetcher (util-scripts/cell_fetcher.py) against the local OpenCellID stand-in.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.opencellid_server import DEFAULT_BBOX, OpenCellIDStandIn, make_cells, serve_in_thread
+from cell_fetcher import CellFetcher, CellsWriter, TileCache
+
+# Quadrants of the stand-in's region, as tiles (min_lat, min_lon, max_lat, max_lon)
+MIN_LON, MIN_LAT, MAX_LON, MAX_LAT = DEFAULT_BBOX
+MID_LON, MID_LAT = (MIN_LON + MAX_LON) / 2, (MIN_LAT + MAX_LAT) / 2
+TILES = [
+    (MIN_LAT, MIN_LON, MID_LAT, MID_LON),
+    (MIN_LAT, MID_LON, MID_LAT, MAX_LON),
+    (MID_LAT, MIN_LON, MAX_LAT, MID_LON),
+    (MID_LAT, MID_LON, MAX_LAT, MAX_LON),
+]
+
+
+@pytest.fixture
+def server():
+    """Start a stand-in serving 200 cells with the given error rate; stopped after the test."""
+    stops = []
+
+    def start(error_rate=0.0):
+        stand_in = OpenCellIDStandIn(make_cells(DEFAULT_BBOX, 200, 0), cap=1000, latency_ms=5, error_rate=error_rate)
+        base_url, stop = serve_in_thread(stand_in)
+        stops.append(stop)
+        return stand_in, base_url
+
+    yield start
+    for stop in stops:
+        stop()
+
+
+def fetch(base_url, tiles, tmp_path, retries=3, **kwargs):
+    fetcher = CellFetcher(None, 404, 45, base_url=base_url, concurrency=4, retries=retries, backoff=0.01,
+                          cache=TileCache(str(tmp_path / "cache")), **kwargs)
+    output = tmp_path / "cells.json"
+    with CellsWriter(str(output)) as writer:
+        def on_tile(tile, response, cached):
+            writer.add(response)
+
+        failed = asyncio.run(fetcher.fetch_all(tiles, on_tile))
+    with open(output, "r", encoding="utf-8") as f:
+        cells = json.load(f)["cells"]
+    return fetcher, failed, cells
+
+
+def test_fetches_every_tile(server, tmp_path):
+    stand_in, base_url = server()
+    fetcher, failed, cells = fetch(base_url, TILES, tmp_path)
+    assert failed == []
+    assert sorted(cell["cellid"] for cell in cells) == sorted(cell["cellid"] for cell in stand_in.cells)
+    assert fetcher.stats["requests"] == stand_in.requests == len(TILES)
+    assert fetcher.stats["retries"] == 0
+
+
+def test_rerun_is_served_from_the_cache(server, tmp_path):
+    stand_in, base_url = server()
+    fetch(base_url, TILES[:2], tmp_path)
+    fetcher, failed, cells = fetch(base_url, TILES, tmp_path)
+    assert failed == []
+    assert len(cells) == len(stand_in.cells)
+    assert (fetcher.stats["cached"], fetcher.stats["requests"]) == (2, 2)
+    assert stand_in.requests == len(TILES)
+
+
+def test_server_errors_are_retried(server, tmp_path):
+    stand_in, base_url = server(error_rate=0.3)
+    fetcher, failed, cells = fetch(base_url, TILES, tmp_path, retries=20)
+    assert failed == []
+    assert len(cells) == len(stand_in.cells)
+    assert fetcher.stats["retries"] > 0
+    assert fetcher.stats["requests"] == stand_in.requests == len(TILES) + fetcher.stats["retries"]
+
+
+def test_tiles_fail_once_retries_run_out(server, tmp_path):
+    stand_in, base_url = server(error_rate=1.0)
+    fetcher, failed, cells = fetch(base_url, TILES, tmp_path, retries=2)
+    assert sorted(tile for tile, _ in failed) == sorted(TILES)
+    assert all("status code 503 after 3 attempts" in error for _, error in failed)
+    assert cells == []
+    assert stand_in.requests == 3 * len(TILES)
+    assert fetcher.stats["failed"] == len(TILES)
+    # Failed tiles are not cached, a rerun requests them again
+    assert list((tmp_path / "cache").iterdir()) == []
+
+
+def test_client_errors_are_not_retried(server, tmp_path):
+    _, base_url = server()
+    fetcher, failed, _ = fetch(base_url + "/missing", TILES[:1], tmp_path)
+    assert [error for _, error in failed] == [f"Tile {TILES[0]}: status code 404"]
+    assert fetcher.stats["retries"] == 0
+
+
+def test_api_error_in_a_200_response_fails_the_tile(server, tmp_path):
+    stand_in, base_url = server()
+    tile = ("a", "b", "c", "d")
+    fetcher = CellFetcher(None, 404, 45, base_url=base_url, retries=1, backoff=0.01)
+    failed = asyncio.run(fetcher.fetch_all([tile], lambda *args: None))
+    assert [error for _, error in failed] == [f"Tile {tile}: API error: Invalid BBOX after 2 attempts"]
+    assert stand_in.requests == 2
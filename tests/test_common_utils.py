@@ -0,0 +1,30 @@
+"""
+Coordinate handling of util-scripts/common_utils.py and its users.
+"""
+
+import numpy as np
+
+from common_utils import as_coordinates
+from geojson_smooth import smooth_coordinates
+
+
+def test_as_coordinates_drops_altitude():
+    coords = as_coordinates([[13.42, 52.5, 30.0], [13.43, 52.52, 31.0]])
+    np.testing.assert_array_equal(coords, [[13.42, 52.5], [13.43, 52.52]])
+
+
+def test_as_coordinates_mixed_dimensions():
+    coords = as_coordinates([[13.42, 52.5], [13.43, 52.52, 5.0]])
+    np.testing.assert_array_equal(coords, [[13.42, 52.5], [13.43, 52.52]])
+
+
+def test_as_coordinates_empty():
+    assert as_coordinates([]).shape == (0, 2)
+
+
+def test_smooth_mixed_dimensions_keeps_original_points():
+    line = [[13.42, 52.5], [13.43, 52.52, 5.0]]
+    smoothed = smooth_coordinates(line, interval=100)
+    assert smoothed[0] == line[0] and smoothed[-1] == line[1]
+    assert len(smoothed) > 2
+    assert all(len(point) == 2 for point in smoothed[1:-1])
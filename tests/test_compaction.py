@@ -0,0 +1,66 @@
+"""
+Compaction of trajectory history (api/compaction.py) and the reads rebuilt from it.
+"""
+
+import asyncio
+import sqlite3
+
+import numpy as np
+
+from api.compaction import TrajectoryCompactor
+from api.database import (
+    AsyncSessionLocal,
+    TRAJECTORY_COLUMNS,
+    engine,
+    get_user_trajectory_ranges,
+    initialize_database,
+)
+
+DAY = 86400
+INSERT_SQL = (
+    f"INSERT INTO user_trajectory (user_id, {', '.join(TRAJECTORY_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * (len(TRAJECTORY_COLUMNS) + 1))})"
+)
+
+
+def insert(db_path, user_id, times, cell):
+    with sqlite3.connect(db_path) as connection:
+        connection.executemany(
+            INSERT_SQL,
+            [(user_id, int(t), int(cell(t)), 5, 2, 1, 3, 1, 4, 1, 5, 1) for t in times],
+        )
+
+
+def test_late_rows_merge_into_compacted_segments():
+    user_id = "late-rows"
+    hour = 3600
+
+    async def run():
+        await initialize_database(load_data=False)
+        db_path = engine.url.database
+        compactor = TrajectoryCompactor(db_path, compact_after=DAY, retention=2 * DAY, segment_retention=10 * DAY)
+        insert(db_path, user_id, np.arange(0, 3 * DAY, 10), lambda t: 1000 + t // 600)
+        await compactor.compact_once()
+
+        # Resent rows of compacted times, and new rows between them
+        insert(db_path, user_id, np.arange(hour, hour + 600, 10), lambda t: 1000 + t // 600)
+        insert(db_path, user_id, np.arange(hour + 5, hour + 600, 10), lambda t: 777)
+        totals = await compactor.compact_once()
+
+        async with AsyncSessionLocal() as db:
+            data = await get_user_trajectory_ranges(user_id, [(hour, 2 * hour - 1)], db)
+        with sqlite3.connect(db_path) as connection:
+            rollups = dict(connection.execute(
+                "SELECT resolution, SUM(samples) FROM trajectory_rollup WHERE user_id = ? AND bucket = ?"
+                " GROUP BY resolution", (user_id, hour),
+            ).fetchall())
+        await engine.dispose()
+        return totals, data, rollups
+
+    totals, data, rollups = asyncio.run(run())
+    times = data[:, 0]
+    assert totals["late_rows_compacted"] == 60
+    assert len(np.unique(times)) == len(times) == 360 + 60
+    assert np.all(np.diff(times) > 0)
+    np.testing.assert_array_equal(data[np.isin(times, np.arange(hour + 5, hour + 600, 10)), 1], 777)
+    assert rollups == {3600: 360 + 60}
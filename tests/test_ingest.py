@@ -0,0 +1,98 @@
+"""
+Validation of ingested rows and failure handling of the TrajectoryWriteBuffer.
+"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from api.ingest import IngestBufferFull, TrajectoryWriteBuffer, parse_json_rows, parse_ndjson_rows
+
+
+class FailingBuffer(TrajectoryWriteBuffer):
+    """Write buffer whose writes fail with `errors` in turn, then succeed."""
+
+    def __init__(self, errors, **kwargs):
+        super().__init__(session_factory=None, **kwargs)
+        self.errors = list(errors)
+        self.written = []
+
+    async def _write(self, rows):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.written.extend(rows)
+
+
+def row(user_id="u", time_=1, cell=10):
+    return (user_id, time_, cell, 100) + (None,) * 8
+
+
+@pytest.mark.parametrize("value", [2 ** 63, -(2 ** 63) - 1, float("inf"), float("nan")])
+def test_out_of_range_values_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_json_rows({"user_id": "u", "rows": [{"time": 1, "cell1": value, "distance1": 3}]})
+
+
+def test_overflowing_json_number_is_rejected():
+    with pytest.raises(ValueError):
+        parse_ndjson_rows([b'{"user_id": "u", "time": 1, "cell1": 1e400, "distance1": 3}'])
+
+
+def test_int64_bounds_are_accepted():
+    rows = parse_json_rows({"user_id": "u", "rows": [{"time": 1, "cell1": 2 ** 63 - 1, "distance1": -(2 ** 63)}]})
+    assert rows[0][2:4] == (2 ** 63 - 1, -(2 ** 63))
+
+
+def test_failed_batch_does_not_block_later_rows():
+    async def run():
+        buffer = FailingBuffer([sqlite3.IntegrityError("bad row")])
+        await buffer.start()
+        await buffer.add([row(time_=1)])
+        await buffer.flush()
+        await buffer.add([row(time_=2)])
+        await buffer.flush()
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert buffer.written == [row(time_=2)]
+    stats = buffer.stats()
+    assert (stats["rows_dropped"], stats["batches_dropped"], stats["rows_written"]) == (1, 1, 1)
+    assert stats["buffered_rows"] == 0
+
+
+def test_locked_database_keeps_rows_buffered():
+    async def run():
+        buffer = FailingBuffer([sqlite3.OperationalError("database is locked")])
+        await buffer.start()
+        await buffer.add([row(time_=1)])
+        with pytest.raises(sqlite3.OperationalError):
+            await buffer.flush()
+        assert buffer.stats()["buffered_rows"] == 1
+        await buffer.flush()
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert buffer.written == [row(time_=1)]
+    assert buffer.stats()["rows_dropped"] == 0
+
+
+def test_backpressure_timeout_fires_while_flushes_keep_failing():
+    async def run():
+        errors = [sqlite3.OperationalError("database is locked")] * 1000
+        buffer = FailingBuffer(errors, max_rows=2, flush_rows=10, flush_interval=0.01)
+        await buffer.start()
+        await buffer.add([row(time_=1), row(time_=2)])
+        started = time.monotonic()
+        try:
+            with pytest.raises(IngestBufferFull):
+                await asyncio.wait_for(buffer.add([row(time_=3)], timeout=0.3), 5)
+        finally:
+            buffer.errors.clear()
+            await buffer.stop()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 2
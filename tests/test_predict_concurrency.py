@@ -0,0 +1,46 @@
+"""
+Concurrent cold predictions must not need more pooled database connections than
+the requests in flight: more of them than the pool holds used to time out.
+"""
+
+import asyncio
+
+from api.database import AsyncSessionLocal, engine, initialize_database
+from api.fake_llm import FakeChatModel
+from api.services import NetworkAgentManager
+from api.user_model import UserModelStore
+
+
+def pool_capacity():
+    pool = engine.sync_engine.pool
+    return pool.size() + max(0, getattr(pool, "_max_overflow", 0))
+
+
+async def predict_concurrently(requests):
+    await initialize_database(load_data=False)
+    manager = NetworkAgentManager(
+        api_key=None,
+        llm=FakeChatModel(latency_ms=50, seed=0),
+        user_models=UserModelStore(AsyncSessionLocal),
+    )
+
+    async def predict(user_id):
+        # As /predict does: the request session stays open until the answer
+        async with AsyncSessionLocal() as db:
+            agent = manager.get_agent(user_id)
+            return await agent.predict_best_cell_towers(user_id, {"1001": 0.2, "1002": 0.7}, 500, 1001, db)
+
+    try:
+        return await asyncio.wait_for(
+            asyncio.gather(*(predict(f"cold-{i}") for i in range(requests))), timeout=20
+        )
+    finally:
+        # Pooled connections belong to this event loop
+        await engine.dispose()
+
+
+def test_cold_predictions_above_pool_size():
+    requests = pool_capacity() + 5
+    results = asyncio.run(predict_concurrently(requests))
+    assert len(results) == requests
+    assert all(result["optimal_handover_tower"] for result in results)
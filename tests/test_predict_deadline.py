@@ -0,0 +1,66 @@
+"""
+The prediction deadline starts with the request and bounds every stage, not only
+the LLM call: a slow stage before it is answered by the local fallback in time.
+"""
+
+import asyncio
+import time
+
+import api.services
+from api.database import AsyncSessionLocal, engine, initialize_database
+from api.fake_llm import FakeChatModel
+from api.services import NetworkAgentManager
+from api.user_model import UserModelStore
+
+DEADLINE = 0.3
+
+
+class SlowUserModelStore(UserModelStore):
+    async def get(self, user_id, db):
+        await asyncio.sleep(10)
+        return await super().get(user_id, db)
+
+
+async def slow_trajectory_window(*args, **kwargs):
+    await asyncio.sleep(10)
+
+
+async def predict(user_models=None):
+    await initialize_database(load_data=False)
+    manager = NetworkAgentManager(
+        api_key=None,
+        llm=FakeChatModel(latency_ms=0, seed=0),
+        predict_deadline=DEADLINE,
+        user_models=user_models,
+    )
+    started = time.monotonic()
+    try:
+        async with AsyncSessionLocal() as db:
+            agent = manager.get_agent("slow")
+            result = await asyncio.wait_for(
+                agent.predict_best_cell_towers("slow", {"1001": 0.9, "1002": 0.2}, 500, 1001, db), timeout=5
+            )
+    finally:
+        await engine.dispose()
+    return result, time.monotonic() - started
+
+
+def check_fallback(result, elapsed):
+    assert result["source"] == "fallback"
+    assert result["optimal_handover_tower"] == "1002"
+    assert result["reason"].endswith("(timeout)")
+    assert elapsed < DEADLINE + 1
+
+
+def test_slow_trajectory_fetch_falls_back_by_the_deadline(monkeypatch):
+    monkeypatch.setattr(api.services, "get_user_trajectory_window", slow_trajectory_window)
+    check_fallback(*asyncio.run(predict()))
+
+
+def test_slow_model_load_falls_back_by_the_deadline():
+    check_fallback(*asyncio.run(predict(SlowUserModelStore(AsyncSessionLocal))))
+
+
+def test_fast_prediction_is_not_cut_short():
+    result, _ = asyncio.run(predict(UserModelStore(AsyncSessionLocal)))
+    assert result["source"] != "fallback"
@@ -0,0 +1,300 @@
+"""
+Concurrent, cached and resumable fetching of OpenCellID cells tile by tile.
+
+A CellFetcher requests the cells of many bounding boxes ("tiles") from the
+OpenCellID getInArea API over one pooled aiohttp session, with a bounded number of
+requests in flight, an optional rate limit and retries with exponential backoff.
+Every successful response is kept in a TileCache on disk, keyed by bbox, MCC, MNC
+and radio, so a rerun or a resumed run only requests the tiles it has not finished.
+
+CellsWriter writes the cells of each tile to the output file as soon as the tile is
+done, skipping cells already written by a neighbouring tile.
+
+Example:
+    from cell_fetcher import CellFetcher, CellsWriter, TileCache
+
+    fetcher = CellFetcher(api_key, mcc=404, mnc=45, concurrency=8, rate=5, cache=TileCache(".opencellid_cache"))
+    with CellsWriter("cells_data.json") as writer:
+        def on_tile(tile, response, cached):
+            writer.add(response)
+
+        failed = asyncio.run(fetcher.fetch_all(tiles, on_tile))
+"""
+
+import asyncio
+import json
+import os
+import random
+
+import aiohttp
+
+DEFAULT_BASE_URL = "https://opencellid.org/cell/getInArea"
+
+# Statuses worth retrying: rate limiting and server-side errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """A tile that could not be fetched, after any retries."""
+
+
+class TileCache:
+    """
+    On-disk cache of getInArea responses, one JSON file per (bbox, mcc, mnc, radio).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, bbox, mcc, mnc, radio):
+        min_lat, min_lon, max_lat, max_lon = bbox
+        name = f"{mcc}_{mnc}_{radio}_{min_lat:.7f}_{min_lon:.7f}_{max_lat:.7f}_{max_lon:.7f}.json"
+        return os.path.join(self.directory, name)
+
+    def get(self, bbox, mcc, mnc, radio):
+        """The cached response of a tile, or None."""
+        try:
+            with open(self.path(bbox, mcc, mnc, radio), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, bbox, mcc, mnc, radio, response):
+        # Write then rename, so an interrupted run never leaves a truncated entry
+        path = self.path(bbox, mcc, mnc, radio)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(response, f)
+        os.replace(temporary, path)
+
+
+class RateLimiter:
+    """
+    Spaces the starts of requests at least 1 / `rate` seconds apart; no limit when
+    `rate` is falsy.
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CellFetcher:
+    """
+    Fetches the cells of tiles (min_lat, min_lon, max_lat, max_lon) from OpenCellID.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        mcc,
+        mnc,
+        radio="LTE",
+        base_url=DEFAULT_BASE_URL,
+        concurrency=4,
+        rate=None,
+        retries=5,
+        backoff=1.0,
+        timeout=30.0,
+        cache=None,
+        limit=None,
+    ):
+        """
+        Args:
+            api_key: OpenCellID API key.
+            mcc: Mobile Country Code.
+            mnc: Mobile Network Code.
+            radio: Radio technology of the cells.
+            base_url: URL of the getInArea endpoint, e.g. of a local stand-in server.
+            concurrency: Requests in flight at most.
+            rate: Requests started per second at most, None for no limit.
+            retries: Retries of a failed request before giving up on its tile.
+            backoff: Delay in seconds before the first retry, doubled on each retry.
+            timeout: Timeout in seconds of one request.
+            cache: Optional TileCache of the responses.
+            limit: Cells requested per tile at most, the API default when None.
+        """
+        self.api_key = api_key
+        self.mcc = mcc
+        self.mnc = mnc
+        self.radio = radio
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.limit = limit
+        self.stats = {"tiles": 0, "cached": 0, "requests": 0, "retries": 0, "failed": 0}
+
+    def params(self, bbox):
+        # The API expects BBOX in the order: min_lat, min_lon, max_lat, max_lon.
+        params = {
+            "key": self.api_key or "",
+            "BBOX": ",".join(str(value) for value in bbox),
+            "mcc": self.mcc,
+            "mnc": self.mnc,
+            "radio": self.radio,
+            "format": "json",
+        }
+        if self.limit:
+            params["limit"] = self.limit
+        return params
+
+    async def fetch_tile(self, session, bbox):
+        """
+        The getInArea response of one tile, from the cache when there.
+
+        Returns:
+            (dict, bool): The response, and whether it came from the cache.
+
+        Raises:
+            FetchError: The request still failed after the retries.
+        """
+        if self.cache is not None:
+            response = self.cache.get(bbox, self.mcc, self.mnc, self.radio)
+            if response is not None:
+                self.stats["cached"] += 1
+                return response, True
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            await self.rate_limiter.wait()
+            self.stats["requests"] += 1
+            try:
+                async with session.get(self.base_url, params=self.params(bbox)) as http_response:
+                    if http_response.status == 200:
+                        response = await http_response.json(content_type=None)
+                        # The API reports some errors with a 200 and an "error" member
+                        if "error" not in response:
+                            if self.cache is not None:
+                                self.cache.put(bbox, self.mcc, self.mnc, self.radio, response)
+                            return response, False
+                        error = f"API error: {response.get('error')}"
+                    elif http_response.status in RETRY_STATUSES:
+                        error = f"status code {http_response.status}"
+                        retry_after = _retry_after(http_response.headers.get("Retry-After"))
+                    else:
+                        raise FetchError(f"Tile {bbox}: status code {http_response.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < self.retries:
+                self.stats["retries"] += 1
+                # Exponential backoff with jitter, unless the server said how long to wait
+                delay = retry_after if retry_after is not None else self.backoff * 2 ** attempt
+                await asyncio.sleep(delay * random.uniform(1.0, 1.5))
+        raise FetchError(f"Tile {bbox}: {error} after {self.retries + 1} attempts")
+
+    async def fetch_all(self, tiles, on_tile):
+        """
+        Fetch every tile with up to `concurrency` requests in flight, calling
+        on_tile(tile, response, cached) as each one completes. on_tile may return
+        more tiles to fetch, e.g. the quadrants of a tile whose response was truncated.
+
+        Returns:
+            list: The (tile, error message) of the tiles that could not be fetched.
+        """
+        queue = asyncio.Queue()
+        for tile in tiles:
+            queue.put_nowait(tile)
+        failed = []
+
+        async def work(session):
+            while True:
+                tile = await queue.get()
+                if tile is None:
+                    return
+                try:
+                    self.stats["tiles"] += 1
+                    try:
+                        response, cached = await self.fetch_tile(session, tile)
+                    except FetchError as e:
+                        self.stats["failed"] += 1
+                        failed.append((tile, str(e)))
+                        continue
+                    for child in on_tile(tile, response, cached) or ():
+                        queue.put_nowait(child)
+                finally:
+                    queue.task_done()
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            workers = [asyncio.create_task(work(session)) for _ in range(self.concurrency)]
+            # Every tile, including those added by on_tile, is done once the queue drains;
+            # a worker only returns before that if on_tile raised
+            drained = asyncio.create_task(queue.join())
+            try:
+                await asyncio.wait([drained, *workers], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                drained.cancel()
+            for _ in workers:
+                queue.put_nowait(None)
+            await asyncio.gather(*workers)
+        return failed
+
+
+class CellsWriter:
+    """
+    Incremental writer of the {"cells": [...]} output of find_cells.py: each added
+    batch of cells is written and flushed at once, and the file is only a complete
+    JSON document once closed. Cells already written are skipped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._seen = set()
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write('{\n  "cells": [')
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.write('\n  ]\n}' if self.count else ']\n}')
+        self._file.close()
+
+    def add(self, response):
+        """Write the cells of a getInArea response; return how many were new."""
+        added = 0
+        for cell in response.get("cells", []):
+            key = _cell_key(cell)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            cell_json = json.dumps(cell, indent=2).replace("\n", "\n    ")
+            self._file.write(("," if self.count else "") + "\n    " + cell_json)
+            self.count += 1
+            added += 1
+        self._file.flush()
+        return added
+
+
+def _cell_key(cell):
+    """Identity of a cell; cells without a cell id are never considered duplicates."""
+    if cell.get("cellid") is None:
+        return object()
+    return (cell.get("radio"), cell.get("mcc"), cell.get("mnc"), cell.get("lac"), cell.get("cellid"))
+
+
+def _retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -1,7 +1,11 @@
 import math
 import json
+
+import numpy as np
 from sklearn.metrics import pairwise
 
+EARTH_RADIUS_METERS = 6371000.0
+
 def haversine_sklearn(lon1, lat1, lon2, lat2):
     """
     Returns the great-circle distance (in meters) between two points,
@@ -22,7 +26,7 @@ def haversine_sklearn(lon1, lat1, lon2, lat2):
     )[0][0]
 
     # Convert to meters using Earth's average radius in meters
-    distance_meters = 6371000.0 * result_radians
+    distance_meters = EARTH_RADIUS_METERS * result_radians
     return distance_meters
 
 def interpolate(point1, point2, fraction):
@@ -37,6 +41,136 @@ def interpolate(point1, point2, fraction):
     return [lon, lat]
 
 
+def as_coordinates(coords):
+    """
+    View a list of [lon, lat] (optionally [lon, lat, alt]) points as an (N, 2) float array.
+    Points may differ in dimension, e.g. only some with an altitude.
+    """
+    try:
+        coords = np.asarray(coords, dtype=np.float64)
+    except ValueError:
+        # Inhomogeneous points, the altitude is dropped point by point
+        coords = np.array([(point[0], point[1]) for point in coords], dtype=np.float64)
+    if coords.size == 0:
+        return np.empty((0, 2))
+    return coords.reshape(len(coords), -1)[:, :2]
+
+
+def haversine_vectorized(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance in meters between points given in degrees, element-wise
+    with NumPy broadcasting. Same formula as haversine_sklearn.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def consecutive_distances(coords):
+    """
+    Distances in meters between consecutive points of an (N, 2) [lon, lat] array,
+    as an (N - 1,) array.
+    """
+    coords = as_coordinates(coords)
+    return haversine_vectorized(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+
+
+def distances_from(point, coords):
+    """
+    Distances in meters from one [lon, lat] point to every point of an (N, 2) array.
+    """
+    coords = as_coordinates(coords)
+    return haversine_vectorized(point[0], point[1], coords[:, 0], coords[:, 1])
+
+
+def pairwise_distances(coords1, coords2):
+    """
+    (N, M) distances in meters between every point of an (N, 2) and an (M, 2) [lon, lat] array.
+    """
+    coords1, coords2 = as_coordinates(coords1), as_coordinates(coords2)
+    return haversine_vectorized(coords1[:, None, 0], coords1[:, None, 1], coords2[None, :, 0], coords2[None, :, 1])
+
+
+def interpolate_batch(starts, ends, fractions):
+    """
+    Linear interpolation of many points at once, the batched form of interpolate().
+
+    Args:
+        starts: (K, 2) [lon, lat] start points.
+        ends: (K, 2) [lon, lat] end points.
+        fractions: (K,) position of each point between its start (0) and end (1).
+
+    Returns:
+        np.ndarray: (K, 2) interpolated [lon, lat] points.
+    """
+    starts, ends = as_coordinates(starts), as_coordinates(ends)
+    fractions = np.asarray(fractions, dtype=np.float64)[:, None]
+    return starts + fractions * (ends - starts)
+
+
+def interpolate_great_circle_batch(starts, ends, fractions):
+    """
+    Interpolation of many points at once along the great circle through each start
+    and end point (spherical linear interpolation), so that a point at `fraction`
+    lies `fraction` of the haversine distance from its start.
+
+    Args:
+        starts: (K, 2) [lon, lat] start points.
+        ends: (K, 2) [lon, lat] end points.
+        fractions: (K,) position of each point between its start (0) and end (1).
+
+    Returns:
+        np.ndarray: (K, 2) interpolated [lon, lat] points.
+    """
+    starts, ends = to_unit_vectors(starts), to_unit_vectors(ends)
+    return from_unit_vectors(slerp(starts, ends, fractions))
+
+
+def to_unit_vectors(coords):
+    """
+    (N, 3) unit vectors from the Earth's center of an (N, 2) [lon, lat] array in degrees.
+    """
+    coords = np.radians(as_coordinates(coords))
+    lon, lat = coords[:, 0], coords[:, 1]
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def from_unit_vectors(vectors):
+    """
+    (N, 2) [lon, lat] degrees of an (N, 3) array of unit vectors, the inverse of to_unit_vectors().
+    """
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    return np.degrees(np.column_stack([np.arctan2(y, x), np.arctan2(z, np.hypot(x, y))]))
+
+
+def slerp(starts, ends, fractions, angles=None):
+    """
+    Spherical linear interpolation between (K, 3) unit vectors.
+
+    Args:
+        starts: (K, 3) start unit vectors.
+        ends: (K, 3) end unit vectors.
+        fractions: (K,) position of each point between its start (0) and end (1).
+        angles: Optional (K,) central angles in radians between each start and end,
+            e.g. haversine distances over EARTH_RADIUS_METERS; computed when omitted.
+
+    Returns:
+        np.ndarray: (K, 3) interpolated unit vectors.
+    """
+    fractions = np.asarray(fractions, dtype=np.float64)
+    if angles is None:
+        # atan2 of the cross and dot products stays accurate for very short segments
+        angles = np.arctan2(np.linalg.norm(np.cross(starts, ends), axis=1), np.einsum("ij,ij->i", starts, ends))
+    sin_angles = np.sin(angles)
+    # Coincident points: every fraction is the start point
+    degenerate = sin_angles == 0
+    sin_angles = np.where(degenerate, 1.0, sin_angles)
+    start_weights = np.where(degenerate, 1.0, np.sin((1 - fractions) * angles) / sin_angles)
+    end_weights = np.where(degenerate, 0.0, np.sin(fractions * angles) / sin_angles)
+    return start_weights[:, None] * starts + end_weights[:, None] * ends
+
+
 def read_geojson(file_path):
     """
     Reads a GeoJSON file from `file_path` and returns the JSON object.
@@ -44,3 +178,157 @@ def read_geojson(file_path):
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+
+
+def iter_geojson_features(file_path, members=None, chunk_size=1 << 20):
+    """
+    Stream the features of a GeoJSON FeatureCollection from `file_path`, one decoded
+    feature at a time, without loading the whole file: only the feature being decoded
+    and the current read chunk are held in memory.
+
+    Args:
+        file_path: Path to the GeoJSON file.
+        members: Optional dict filled with the other top-level members of the
+            collection ("type", "name", "crs", ...) in file order as they are read:
+            those before "features" are there when the first feature is yielded,
+            the rest once the features are exhausted. "features" itself is recorded
+            as None, to keep its place.
+        chunk_size: Characters read from the file at a time.
+
+    Yields:
+        dict: Each feature of the "features" array.
+    """
+    if members is None:
+        members = {}
+    with open(file_path, "r", encoding="utf-8") as f:
+        reader = _JSONStreamReader(f, chunk_size)
+        reader.expect("{")
+        while not reader.consume("}"):
+            reader.consume(",")
+            key = reader.decode()
+            reader.expect(":")
+            if key != "features":
+                members[key] = reader.decode()
+                continue
+            members[key] = None
+            reader.expect("[")
+            while not reader.consume("]"):
+                reader.consume(",")
+                yield reader.decode()
+
+
+class _JSONStreamReader:
+    """
+    Incremental JSON tokenizer over a text file: decodes one value at a time with
+    json.JSONDecoder.raw_decode, reading more of the file whenever the buffer ends
+    before the value does.
+    """
+
+    _whitespace = " \t\n\r"
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _read(self, size=None):
+        # Drop what has been decoded already, then append the next chunk
+        self.buffer = self.buffer[self.position:]
+        self.position = 0
+        chunk = self.f.read(max(size or 0, self.chunk_size))
+        self.eof = not chunk
+        self.buffer += chunk
+
+    def _skip_whitespace(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in self._whitespace:
+                self.position += 1
+            if self.position < len(self.buffer) or self.eof:
+                return
+            self._read()
+
+    def consume(self, character):
+        """Skip whitespace, then `character` if it comes next; return whether it did."""
+        self._skip_whitespace()
+        if self.buffer.startswith(character, self.position):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, character):
+        if not self.consume(character):
+            found = self.buffer[self.position:self.position + 20] or "end of file"
+            raise ValueError(f"Invalid GeoJSON stream: expected {character!r}, found {found!r}")
+
+    def decode(self):
+        """Decode the next JSON value."""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number may go on past the end of the buffer
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow the buffer geometrically, so a large value is decoded a bounded
+            # number of times
+            self._read(3 * (len(self.buffer) - self.position))
+
+
+def write_feature_collection(out, features, members, indent=None):
+    """
+    Write a FeatureCollection to the text stream `out` as the features come, with the
+    same output as json.dump(collection, out, indent=indent), or with no whitespace at
+    all when `indent` is None.
+
+    Args:
+        out: Writable text stream.
+        features: Iterable of features, e.g. from iter_geojson_features().
+        members: Other top-level members of the collection, in order, with "features"
+            as a placeholder; may be filled while `features` is iterated, as by
+            iter_geojson_features().
+        indent: Indentation of the output, None for compact output.
+    """
+    if indent is None:
+        separators, newline, member_indent, feature_indent = (",", ":"), "", "", ""
+    else:
+        separators, newline = (",", ": "), "\n"
+        member_indent, feature_indent = " " * indent, " " * (2 * indent)
+
+    def dumps(value, prefix):
+        return json.dumps(value, indent=indent, separators=separators).replace("\n", "\n" + prefix)
+
+    written = set()
+
+    def write_members(stop_at_features):
+        for key, value in list(members.items()):
+            if key in written:
+                continue
+            if key == "features" and stop_at_features:
+                return True
+            out.write(("," if written else "{") + newline + member_indent + json.dumps(key) + separators[1])
+            written.add(key)
+            if key == "features":
+                out.write("[]")
+            else:
+                out.write(dumps(value, member_indent))
+        return False
+
+    first = True
+    for feature in features:
+        if first:
+            write_members(stop_at_features=True)
+            out.write(("," if written else "{") + newline + member_indent + json.dumps("features") + separators[1] + "[")
+            written.add("features")
+        out.write(("" if first else ",") + newline + feature_indent + dumps(feature, feature_indent))
+        first = False
+    if not first:
+        out.write(newline + member_indent + "]")
+    write_members(stop_at_features=False)
+    out.write((newline + "}") if written else "{}")
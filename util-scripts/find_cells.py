@@ -3,12 +3,25 @@ Cell Tower Data Fetcher
 
 This script fetches cell tower data from OpenCellID for a given region defined by a GeoJSON file.
 
+The region is split into tiles that are requested concurrently over a pooled HTTP session,
+with an optional rate limit and retries with backoff. Responses are cached on disk per
+tile, so rerunning after a crash or an interruption only requests the unfinished tiles,
+and cells are written to the output as each tile completes.
+
+By default the region is tiled adaptively: it is first covered with the fewest equal
+root tiles the provider accepts (--max-tile-km2), merging the partial tiles a fixed
+grid leaves along the edges, and tiles are split into quadrants only when their
+response is truncated (or close to) the provider's per-request cap. Sparse and empty
+regions cost one request per root tile while dense ones are still fully covered.
+The run reports its request counts, the share of the region completely covered and
+the requests saved against the fixed grid.
+
 Setup Instructions:
 1. Create a .env file in the same directory with your OpenCellID API key:
    OPENCELLID_API_KEY=your_api_key_here
 
 2. Install required packages:
-   pip install requests python-dotenv
+   pip install aiohttp python-dotenv
 
 Sample Usage:
    python find_cells.py --mcc 404 --mnc 45 --input region.geojson --output cells_data.json
@@ -18,15 +31,28 @@ Arguments:
    --mnc: Mobile Network Code (e.g., 45 for Airtel)
    --input: Path to input GeoJSON file containing region bbox
    --output: Path for output JSON file (default: cells_data.json)
+   --concurrency: Requests in flight at most (default: 4)
+   --rate: Requests per second at most, 0 for no limit (default: 0)
+   --retries: Retries of a failed request, with exponential backoff (default: 5)
+   --cache-dir: Directory of the per-tile response cache (default: .opencellid_cache)
+   --base-url: getInArea endpoint, e.g. of a local stand-in server (default: OpenCellID)
+   --tiling: quadtree (adaptive) or grid (fixed tiles of --tile-km) (default: quadtree)
+   --tile-km: Size of the fixed grid tiles (default: 2)
+   --max-tile-km2: Area of the quadtree root tiles at most; the OpenCellID API accepts BBOXes up to 4 km² (default: 4)
+   --cap: Records returned per request at most by the provider (default: 50)
+   --split-ratio: Split tiles returning at least this fraction of --cap records (default: 0.9)
+   --min-tile-km: Size under which tiles are no longer split (default: 0.1)
 """
 
+import asyncio
 import json
 import os
 import argparse
 
-import requests
 from dotenv import load_dotenv
 
+from cell_fetcher import DEFAULT_BASE_URL, CellFetcher, CellsWriter, TileCache
+
 # Load environment variables from .env file
 load_dotenv()
 API_KEY = os.getenv("OPENCELLID_API_KEY")
@@ -34,10 +60,10 @@ API_KEY = os.getenv("OPENCELLID_API_KEY")
 MCC=404
 MNC=45
 
-import json
 import math
 
-import requests
+# Ratio of the longer to the shorter side of root tiles at most
+MAX_ROOT_ASPECT = 2.0
 
 
 def calculate_area(min_lat, min_lon, max_lat, max_lon):
@@ -153,6 +179,160 @@ def get_grid_cells(min_lat, min_lon, max_lat, max_lon, cell_size_km=2):
     return final_cells
 
 
+def get_root_cells(min_lat, min_lon, max_lat, max_lon, max_area_km2=4.0):
+    """
+    Cover the bounding box with the fewest equal cells of at most max_area_km2 whose
+    sides are at most MAX_ROOT_ASPECT times apart (quadrants of long strips stay long
+    strips), the squarest layout among those. Unlike get_grid_cells, no partial cells are left
+    along the edges: every request spends the provider's whole BBOX budget.
+    Returns a list of cells as tuples: (cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon).
+    """
+    # Longitude degrees are the widest on the side closest to the equator
+    if min_lat <= 0.0 <= max_lat:
+        widest_lat = 0.0
+    else:
+        widest_lat = min(abs(min_lat), abs(max_lat))
+    height_km = (max_lat - min_lat) * 111.0
+    width_km = (max_lon - min_lon) * 111.0 * math.cos(math.radians(widest_lat))
+
+    best = None
+    for rows in range(1, max(1, math.ceil(height_km * width_km / max_area_km2)) + 1):
+        cell_height = height_km / rows
+        columns = max(1, math.ceil(width_km * cell_height / max_area_km2))
+        cell_width = width_km / columns
+        aspect = max(cell_height, cell_width) / max(min(cell_height, cell_width), 1e-9)
+        # Too elongated layouts only win when nothing else fits, e.g. a very thin region
+        key = (aspect > MAX_ROOT_ASPECT, rows * columns, aspect)
+        if best is None or key < best[0]:
+            best = (key, rows, columns)
+    _, rows, columns = best
+
+    lat_step = (max_lat - min_lat) / rows
+    lon_step = (max_lon - min_lon) / columns
+    return [
+        (
+            min_lat + row * lat_step,
+            min_lon + column * lon_step,
+            max_lat if row == rows - 1 else min_lat + (row + 1) * lat_step,
+            max_lon if column == columns - 1 else min_lon + (column + 1) * lon_step,
+        )
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+def split_into_quadrants(cell):
+    """
+    Split a cell (min_lat, min_lon, max_lat, max_lon) into its four quadrants.
+    """
+    min_lat, min_lon, max_lat, max_lon = cell
+    mid_lat = (min_lat + max_lat) / 2.0
+    mid_lon = (min_lon + max_lon) / 2.0
+    return [
+        (min_lat, min_lon, mid_lat, mid_lon),
+        (min_lat, mid_lon, mid_lat, max_lon),
+        (mid_lat, min_lon, max_lat, mid_lon),
+        (mid_lat, mid_lon, max_lat, max_lon),
+    ]
+
+
+def cell_size_km(cell):
+    """
+    Length in km of the longer side of a cell (min_lat, min_lon, max_lat, max_lon).
+    """
+    min_lat, min_lon, max_lat, max_lon = cell
+    center_lat = (min_lat + max_lat) / 2.0
+    lat_km = (max_lat - min_lat) * 111.0
+    lon_km = (max_lon - min_lon) * 111.0 * math.cos(math.radians(center_lat))
+    return max(lat_km, lon_km)
+
+
+class QuadtreeTiling:
+    """
+    Adaptive quadtree tiling of a region for cell discovery.
+
+    Starts from coarse root cells (get_root_cells). A cell whose response holds at
+    least `split_ratio` x `cap` records may have been truncated by the provider's
+    per-request cap, so it is split into its four quadrants, which are requested
+    in turn, down to cells of `min_size_km`. Cells with few or no records are
+    never split, so sparse and empty regions cost a single request per root cell.
+
+    Tracks the requests per depth and which area is completely covered: every cell
+    that was not split and whose response was not truncated.
+    """
+
+    def __init__(self, root_cells, cap=50, split_ratio=0.9, min_size_km=0.1):
+        self.root_cells = list(root_cells)
+        self.cap = cap
+        self.split_threshold = max(1, math.ceil(cap * split_ratio))
+        self.min_size_km = min_size_km
+        self.depths = {cell: 0 for cell in self.root_cells}
+        self.tiles_per_depth = {}
+        self.splits = 0
+        self.complete_area = 0.0
+        self.empty_area = 0.0
+        # Cells still truncated at the minimum size
+        self.truncated = []
+
+    def on_response(self, cell, cell_data):
+        """
+        Record the response of a cell; return the quadrants to request when it
+        has to be split, else an empty list.
+        """
+        depth = self.depths.pop(cell, 0)
+        self.tiles_per_depth[depth] = self.tiles_per_depth.get(depth, 0) + 1
+        records = len(cell_data.get("cells", []))
+        area = calculate_area(*cell)
+        if records < self.split_threshold:
+            self.complete_area += area
+            if records == 0:
+                self.empty_area += area
+            return []
+        if cell_size_km(cell) / 2.0 < self.min_size_km:
+            if records >= self.cap:
+                self.truncated.append(cell)
+            else:
+                self.complete_area += area
+            return []
+        self.splits += 1
+        quadrants = split_into_quadrants(cell)
+        for quadrant in quadrants:
+            self.depths[quadrant] = depth + 1
+        return quadrants
+
+    def report(self, failed_cells=(), grid_tiles=None):
+        """
+        Request counts and coverage of the run, given the cells that could not be fetched.
+
+        With the tile count of the fixed grid over the same region, also the requests
+        saved against it, and against the grid as fine as the deepest tiles split
+        here, the fixed grid that would cover the dense tiles as completely.
+        """
+        total_area = sum(calculate_area(*cell) for cell in self.root_cells)
+        tiles = sum(self.tiles_per_depth.values())
+        report = {
+            "root_tiles": len(self.root_cells),
+            "tiles": tiles,
+            "tiles_per_depth": dict(sorted(self.tiles_per_depth.items())),
+            "splits": self.splits,
+            "area_km2": total_area,
+            "complete_area_km2": self.complete_area,
+            "empty_area_km2": self.empty_area,
+            "coverage": self.complete_area / total_area if total_area else 1.0,
+            "truncated_tiles": len(self.truncated),
+            "failed_tiles": len(failed_cells),
+        }
+        if grid_tiles:
+            fine_grid_tiles = grid_tiles * 4 ** max(self.tiles_per_depth, default=0)
+            report.update({
+                "grid_tiles": grid_tiles,
+                "saving_vs_grid": 1.0 - tiles / grid_tiles,
+                "fine_grid_tiles": fine_grid_tiles,
+                "saving_vs_fine_grid": 1.0 - tiles / fine_grid_tiles,
+            })
+        return report
+
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Fetch cell tower data for a given region.')
@@ -164,6 +344,28 @@ def main():
                       help='Input GeoJSON file path containing the region bbox')
     parser.add_argument('--output', type=str, default='cells_data.json',
                       help='Output JSON file path for cell tower data (default: cells_data.json)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                      help='Requests in flight at most (default: 4)')
+    parser.add_argument('--rate', type=float, default=0,
+                      help='Requests per second at most, 0 for no limit (default: 0)')
+    parser.add_argument('--retries', type=int, default=5,
+                      help='Retries of a failed request, with exponential backoff (default: 5)')
+    parser.add_argument('--cache-dir', type=str, default='.opencellid_cache',
+                      help='Directory of the per-tile response cache (default: .opencellid_cache)')
+    parser.add_argument('--base-url', type=str, default=DEFAULT_BASE_URL,
+                      help='getInArea endpoint URL (default: the OpenCellID API)')
+    parser.add_argument('--tiling', choices=['quadtree', 'grid'], default='quadtree',
+                      help='Adaptive quadtree tiling or a fixed grid (default: quadtree)')
+    parser.add_argument('--tile-km', type=float, default=2,
+                      help='Size of the fixed grid tiles in km (default: 2)')
+    parser.add_argument('--max-tile-km2', type=float, default=4,
+                      help='Area of the quadtree root tiles at most, in km² (default: 4)')
+    parser.add_argument('--cap', type=int, default=50,
+                      help='Records returned per request at most by the provider (default: 50)')
+    parser.add_argument('--split-ratio', type=float, default=0.9,
+                      help='Split tiles returning at least this fraction of --cap records (default: 0.9)')
+    parser.add_argument('--min-tile-km', type=float, default=0.1,
+                      help='Size under which tiles are no longer split (default: 0.1)')
 
     args = parser.parse_args()
 
@@ -192,54 +394,63 @@ def main():
     print(f"  Maximum Longitude: {max_lon}")
     print(f"  Maximum Latitude:  {max_lat}")
 
-    # Break the region into 2 km x 2 km grid cells (approx. 4 km² each)
-    grid_cells = get_grid_cells(min_lat, min_lon, max_lat, max_lon, cell_size_km=2)
-
-    # Your API key for OpenCellID (replace with your actual key)
-    base_url = "https://opencellid.org/cell/getInArea"
-
-    # Initialize a list to store all cell data
-    all_cells_data = []
-
-    # Loop over each grid cell and create the API URL
-    for idx, cell in enumerate(grid_cells):
-        cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon = cell
-        # The API expects BBOX in the order: min_lat, min_lon, max_lat, max_lon.
-        bbox_str = f"{cell_min_lat},{cell_min_lon},{cell_max_lat},{cell_max_lon}"
-        url = f"{base_url}?key={API_KEY}&BBOX={bbox_str}&mcc={MCC}&mnc={MNC}&radio=LTE&format=json"
-        print(f"Cell {idx+1} API URL: {url}")
-        cell_area = calculate_area(
-            cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon
-        )
-        print("Cell Area: ", cell_area)
-
-        # Optionally, uncomment the following lines to perform the API call:
-        print(f"Processing cell {idx+1}/{len(grid_cells)}") 
-
-        response = requests.get(url)
-        if response.status_code == 200:
-            try:
-                cell_data = response.json()
-                print("Records received", cell_data.get('count', None))
-                if 'cells' in cell_data:
-                    all_cells_data.extend(cell_data['cells'])
-            except json.JSONDecodeError:
-                print(f"Error: Could not parse JSON response for cell {idx+1}")
-        else:
-            print(f"Error for cell {idx+1}: Status code {response.status_code}")
-
-    # Create the final merged output
-    output_data = {
-        "cells": all_cells_data
-    }
-
-    # Save the merged data to a file
+    # Break the region into grid cells of --tile-km (2 km x 2 km, approx. 4 km² each, by default)
+    grid_cells = get_grid_cells(min_lat, min_lon, max_lat, max_lon, cell_size_km=args.tile_km)
+    grid_tiles = len(grid_cells)
+    tiling = None
+    if args.tiling == 'quadtree':
+        grid_cells = get_root_cells(min_lat, min_lon, max_lat, max_lon, max_area_km2=args.max_tile_km2)
+        tiling = QuadtreeTiling(grid_cells, cap=args.cap, split_ratio=args.split_ratio, min_size_km=args.min_tile_km)
+
+    fetcher = CellFetcher(
+        API_KEY,
+        MCC,
+        MNC,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+        cache=TileCache(args.cache_dir),
+        limit=args.cap,
+    )
+
+    # Save the cells of each grid cell as soon as it is fetched
     output_file = args.output
-    with open(output_file, "w") as f:
-        json.dump(output_data, f, indent=2)
-
-    print(f"\nProcessing complete. Found {len(all_cells_data)} cells.")
+    processed = 0
+    with CellsWriter(output_file) as writer:
+        def on_tile(cell, cell_data, cached):
+            nonlocal processed
+            processed += 1
+            added = writer.add(cell_data)
+            source = "cache" if cached else "API"
+            print(f"Processed cell {processed} from {source}: "
+                  f"{cell_data.get('count', None)} records received, {added} new")
+            if tiling is not None:
+                return tiling.on_response(cell, cell_data)
+
+        failed = asyncio.run(fetcher.fetch_all(grid_cells, on_tile))
+
+    for cell, error in failed:
+        print(f"Error: {error}")
+
+    stats = fetcher.stats
+    print(f"\nProcessing complete. Found {writer.count} cells.")
+    print(f"Tiles: {stats['tiles']}, from cache: {stats['cached']}, requests: {stats['requests']}, "
+          f"retries: {stats['retries']}, failed: {stats['failed']}")
+    if tiling is not None:
+        report = tiling.report(failed, grid_tiles=grid_tiles)
+        print(f"Quadtree: {report['root_tiles']} root tiles, {report['splits']} splits, "
+              f"tiles per depth: {report['tiles_per_depth']}")
+        print(f"Requests saved: {report['saving_vs_grid']:.1%} against the {report['grid_tiles']} tiles "
+              f"of the --tile-km grid, {report['saving_vs_fine_grid']:.1%} against the "
+              f"{report['fine_grid_tiles']} tiles of that grid as fine as the deepest split")
+        print(f"Coverage: {report['coverage']:.1%} of {report['area_km2']:.1f} km² complete "
+              f"({report['empty_area_km2']:.1f} km² empty), "
+              f"{report['truncated_tiles']} tiles still truncated at --min-tile-km")
     print(f"Results saved to: {output_file}")
+    if failed:
+        print("Rerun the same command to retry the failed cells; finished ones are cached.")
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+"""
+This script generates user trajectories in the schema of data/user_trajectory.csv
+(user_id, time, cell1, distance1 ... cell5, distance5) from a route and a set of cells.
+
+A user travels the route (the LineString / MultiLineString coordinates of a GeoJSON file,
+e.g. densified by geojson_smooth.py) at the speed given by a speed profile. Every
+`--time-step` seconds, the position reached is interpolated along the route, and the
+five nearest cells of the cells JSON (e.g. from find_cells.py or select_top_cells.py)
+and their distances in meters are recorded. The whole route is computed at once: one
+vectorized pass for the positions and one k-nearest query on the spatial index of
+spatial_index.py for the cells, so million-point routes take seconds.
+
+With --users N, N users travel the same route, each starting at a different point of
+it (evenly spread, wrapping around), which makes large datasets for capacity tests.
+
+Sample usage:
+    python generate_trajectory.py route.geojson cells_data.json -o data/user_trajectory.csv --speed 12 --users 100
+
+Arguments:
+    route_geojson : Path to the GeoJSON file of the route.
+    cells_json : Path to the cells JSON file ({"cells": [{"cellid", "lat", "lon", ...}]}).
+    -o, --output : Path to the output CSV file (default: stdout).
+    --speed : Constant speed in m/s (default: 10).
+    --speed-profile : CSV of "distance,speed" rows: the speed in m/s from each distance in meters
+                      along the route on (overrides --speed).
+    --time-step : Seconds between trajectory rows (default: 1).
+    --start-time : Time of the first row (default: 0).
+    --users : Users traveling the route (default: 1).
+    --first-user-id : Id of the first user, the next ones counting up from it (default: 1).
+"""
+
+import argparse
+import csv
+import json
+import sys
+
+import numpy as np
+
+from common_utils import as_coordinates, consecutive_distances, interpolate_batch, iter_geojson_features
+from spatial_index import SpatialIndex
+
+# Cells recorded per trajectory row
+NEAREST_CELLS = 5
+
+# Rows formatted and written at a time
+WRITE_CHUNK_ROWS = 100_000
+
+
+def route_coordinates(geojson_path):
+    """
+    The coordinates of every LineString and MultiLineString of a GeoJSON file, in
+    order, as one (N, 2) [lon, lat] array.
+    """
+    lines = []
+    for feature in iter_geojson_features(geojson_path):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString":
+            lines.append(geometry.get("coordinates", []))
+        elif geometry.get("type") == "MultiLineString":
+            lines.extend(geometry.get("coordinates", []))
+    lines = [as_coordinates(line) for line in lines if line]
+    if not lines:
+        raise ValueError(f"No LineString coordinates in {geojson_path}")
+    return np.concatenate(lines)
+
+
+def read_speed_profile(path):
+    """
+    Read a "distance,speed" CSV into sorted (breakpoints, speeds) arrays.
+    """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        rows = [(float(row["distance"]), float(row["speed"])) for row in csv.DictReader(f)]
+    if not rows:
+        raise ValueError(f"Empty speed profile: {path}")
+    rows.sort()
+    return np.array([row[0] for row in rows]), np.array([row[1] for row in rows])
+
+
+def sample_route(coords, breakpoints, speeds, time_step=1.0):
+    """
+    Positions along a route every `time_step` seconds, at a piecewise-constant speed.
+
+    Args:
+        coords: (N, 2) [lon, lat] route coordinates.
+        breakpoints: (P,) distances in meters along the route where the speed changes.
+        speeds: (P,) speed in m/s from each breakpoint on; the first one also
+            applies before the first breakpoint.
+        time_step: Seconds between samples.
+
+    Returns:
+        (np.ndarray, np.ndarray): (M,) seconds since the start, and the (M, 2)
+        [lon, lat] positions at those times.
+    """
+    coords = as_coordinates(coords)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    if np.any(speeds <= 0):
+        raise ValueError("Speeds must be positive")
+    segments = consecutive_distances(coords)
+    along = np.concatenate([[0.0], np.cumsum(segments)])
+
+    # Seconds to reach each breakpoint, the first speed applying from the start
+    breakpoints = np.concatenate([[0.0], np.maximum(np.asarray(breakpoints, dtype=np.float64)[1:], 0.0)])
+    breakpoint_times = np.concatenate([[0.0], np.cumsum(np.diff(breakpoints) / speeds[:-1])])
+    piece = np.searchsorted(breakpoints, along[-1], side="right") - 1
+    duration = breakpoint_times[piece] + (along[-1] - breakpoints[piece]) / speeds[piece]
+
+    times = np.arange(0.0, duration + 1e-9, time_step)
+    piece = np.searchsorted(breakpoint_times, times, side="right") - 1
+    distances = np.minimum(breakpoints[piece] + (times - breakpoint_times[piece]) * speeds[piece], along[-1])
+
+    # Segment of the route each distance falls in, and how far along it
+    if len(coords) == 1:
+        return times, np.repeat(coords, len(times), axis=0)
+    segment = np.clip(np.searchsorted(along, distances, side="right") - 1, 0, len(segments) - 1)
+    lengths = segments[segment]
+    fractions = np.divide(distances - along[segment], lengths, out=np.zeros_like(lengths), where=lengths > 0)
+    return times, interpolate_batch(coords[segment], coords[segment + 1], np.clip(fractions, 0.0, 1.0))
+
+
+def nearest_cells(cells, positions, k=NEAREST_CELLS):
+    """
+    The k nearest cells of every position and their distances.
+
+    Returns:
+        (np.ndarray, np.ndarray): (M, k) cell ids and (M, k) distances in whole meters,
+        with k capped at the number of cells.
+    """
+    index, located = SpatialIndex.from_cells(cells)
+    cell_ids = np.array([int(cell["cellid"]) for cell in located], dtype=np.int64)
+    distances, indices = index.k_nearest(positions, k)
+    return cell_ids[indices], np.rint(distances).astype(np.int64)
+
+
+def write_trajectory_rows(out, user_id, times, cell_ids, distances):
+    """
+    Write the rows of one user to the text stream `out`, cell and distance columns
+    interleaved; columns beyond the available cells are left empty.
+    """
+    k = cell_ids.shape[1]
+    columns = np.empty((len(times), 1 + 2 * k), dtype=np.int64)
+    columns[:, 0] = times
+    columns[:, 1::2] = cell_ids
+    columns[:, 2::2] = distances
+    # One %-format call per chunk is much faster than a csv.writer row at a time
+    line = str(user_id).replace("%", "%%") + ",%d" * (1 + 2 * k) + "," * (2 * (NEAREST_CELLS - k)) + "\n"
+    for start in range(0, len(columns), WRITE_CHUNK_ROWS):
+        chunk = columns[start:start + WRITE_CHUNK_ROWS]
+        out.write((line * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def generate(route_geojson, cells, out, breakpoints, speeds, time_step=1.0, start_time=0, users=1, first_user_id=1):
+    """
+    Write the header and the trajectories of `users` users to `out`.
+
+    Returns:
+        int: Rows written.
+    """
+    times, positions = sample_route(route_coordinates(route_geojson), breakpoints, speeds, time_step)
+    cell_ids, distances = nearest_cells(cells, positions)
+    times = np.rint(times + start_time).astype(np.int64)
+
+    out.write("user_id,time," + ",".join(f"cell{i},distance{i}" for i in range(1, NEAREST_CELLS + 1)) + "\n")
+    for user in range(users):
+        # Each user starts at an evenly spread point of the route
+        shift = user * len(times) // users
+        order = np.roll(np.arange(len(times)), -shift)
+        write_trajectory_rows(out, first_user_id + user, times, cell_ids[order], distances[order])
+    return users * len(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate user trajectories (nearest cells and distances over time) along a route."
+    )
+    parser.add_argument("route_geojson", help="Path to the GeoJSON file of the route")
+    parser.add_argument("cells_json", help="Path to the cells JSON file")
+    parser.add_argument("-o", "--output", default="-", help="Path to the output CSV file (default: stdout)")
+    parser.add_argument("--speed", type=float, default=10, help="Constant speed in m/s (default: 10)")
+    parser.add_argument("--speed-profile", default=None,
+                        help="CSV of distance,speed rows, the speed in m/s from each distance on (overrides --speed)")
+    parser.add_argument("--time-step", type=float, default=1, help="Seconds between trajectory rows (default: 1)")
+    parser.add_argument("--start-time", type=int, default=0, help="Time of the first row (default: 0)")
+    parser.add_argument("--users", type=int, default=1, help="Users traveling the route (default: 1)")
+    parser.add_argument("--first-user-id", type=int, default=1, help="Id of the first user (default: 1)")
+    args = parser.parse_args()
+
+    if args.speed_profile:
+        breakpoints, speeds = read_speed_profile(args.speed_profile)
+    else:
+        breakpoints, speeds = np.array([0.0]), np.array([args.speed])
+
+    with open(args.cells_json, "r") as f:
+        cells = json.load(f).get("cells", [])
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        rows = generate(args.route_geojson, cells, out, breakpoints, speeds, time_step=args.time_step,
+                        start_time=args.start_time, users=args.users, first_user_id=args.first_user_id)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.output != "-":
+        print(f"{rows} trajectory rows saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,171 @@
 """
-This script reads a GeoJSON file and "smooths" (densifies) the coordinates of any LineString geometries
-by inserting intermediate points along each segment. For each pair of consecutive coordinates, if the 
-distance between them (calculated using the Haversine formula via sklearn) is greater than a specified 
-interval (default is 10 meters), the script interpolates additional points every `interval` meters.
+This script reads a GeoJSON file and "smooths" (densifies) the coordinates of any LineString and
+MultiLineString geometries by inserting intermediate points along each segment. For each pair of
+consecutive coordinates, if the distance between them (calculated using the Haversine formula, vectorized
+over the line) is greater than a specified interval (default is 10 meters), the script interpolates
+additional points every `interval` meters, along the great circle between the two coordinates
+(or along the straight line in degrees with --linear).
 
-The modified GeoJSON data is then either printed to the standard output or saved to a specified output file.
+Features of large FeatureCollections can be smoothed in parallel by a pool of worker processes.
+With --stream, features are parsed, smoothed and written one at a time as the file is read, so
+memory stays bounded by the largest feature instead of the file.
+
+The modified GeoJSON data is then either printed to the standard output or saved to a specified output file,
+indented by 4 spaces or, with --compact, without any whitespace.
 
 Sample usage:
-    python smooth_geojson.py input.geojson -o output.geojson -i 10
+    python geojson_smooth.py input.geojson -o output.geojson -i 10 -w 4
 
 Arguments:
     input_geojson : Path to the input GeoJSON file.
     -o, --output : Path to the output GeoJSON file (default: stdout).
     -i, --interval : Interval in meters for densification (default: 10).
+    -w, --workers : Worker processes smoothing features in parallel, 0 for one per CPU (default: 1).
+    --linear : Interpolate linearly in degrees instead of along the great circle.
+    --stream : Parse, smooth and write features one at a time instead of loading the whole file.
+    --compact : Write the output without indentation or whitespace.
 """
 
 import argparse
 import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import numpy as np
-from common_utils import haversine_sklearn, interpolate, read_geojson
+from common_utils import (
+    EARTH_RADIUS_METERS,
+    as_coordinates,
+    consecutive_distances,
+    from_unit_vectors,
+    interpolate_batch,
+    iter_geojson_features,
+    read_geojson,
+    slerp,
+    to_unit_vectors,
+    write_feature_collection,
+)
+
+# Geometry types whose coordinates are densified
+SMOOTHED_TYPES = ("LineString", "MultiLineString")
 
-def smooth_coordinates(coords, interval=10):
+
+def smooth_coordinates(coords, interval=10, great_circle=True):
     """
     “Smooth” (densify) a list of coordinates. For each pair of consecutive
     coordinates, if the distance is greater than the given interval,
-    inserts intermediate coordinates every `interval` meters.
+    inserts intermediate coordinates every `interval` meters, along the great
+    circle between them (or linearly in degrees if `great_circle` is False).
+
+    All segments are processed at once: one vectorized distance computation over the
+    whole line, then one batched interpolation of every inserted point.
     """
     if not coords:
         return []
 
-    smoothed = [coords[0]]
-    for i in range(1, len(coords)):
-        start = smoothed[-1]  # always use the last (possibly interpolated) point as the start
-        end = coords[i]
-        d = haversine_sklearn(start[0], start[1], end[0], end[1])
-        if d > interval:
-            # Determine how many full `interval` segments fit in the total distance.
-            num_points = int(d // interval)
-            # Insert intermediate points at every `interval` meters along the segment.
-            for j in range(1, num_points + 1):
-                fraction = (j * interval) / d
-                # Avoid duplicating the endpoint when fraction == 1
-                if fraction < 1:
-                    smoothed.append(interpolate(start, end, fraction))
-            smoothed.append(end)
-        else:
-            smoothed.append(end)
+    points = as_coordinates(coords)
+    distances = consecutive_distances(points)
+    # Points inserted in each segment, at every `interval` meters strictly before its end
+    num_points = np.where(distances > interval, np.floor(distances / interval), 0).astype(np.int64)
+    num_points -= (num_points > 0) & (num_points * interval >= distances)
+
+    segments = np.repeat(np.arange(len(distances)), num_points)
+    # 1..n within each segment
+    steps = np.arange(len(segments)) - np.repeat(np.cumsum(num_points) - num_points, num_points) + 1
+    fractions = steps * interval / distances[segments]
+    if great_circle:
+        vectors = to_unit_vectors(points)
+        angles = distances[segments] / EARTH_RADIUS_METERS
+        inserted = from_unit_vectors(slerp(vectors[segments], vectors[segments + 1], fractions, angles))
+    else:
+        inserted = interpolate_batch(points[segments], points[segments + 1], fractions)
+
+    # Original points keep their place, followed by the points inserted after them
+    positions = np.arange(len(points)) + np.concatenate([[0], np.cumsum(num_points)])
+    smoothed = np.empty((len(points) + len(inserted), 2))
+    is_original = np.zeros(len(smoothed), dtype=bool)
+    is_original[positions] = True
+    smoothed[is_original] = points
+    smoothed[~is_original] = inserted
 
-    return smoothed
+    # Keep the original coordinates (and any altitude) untouched
+    result = smoothed.tolist()
+    for position, coord in zip(positions.tolist(), coords):
+        result[position] = coord
+    return result
+
+def smooth_geometry(geometry, interval=10, great_circle=True):
+    """
+    Smooth a LineString or MultiLineString geometry in place; other geometries are
+    returned unchanged.
+    """
+    if not geometry:
+        return geometry
+    if geometry.get("type") == "LineString":
+        geometry["coordinates"] = smooth_coordinates(geometry.get("coordinates", []), interval, great_circle)
+    elif geometry.get("type") == "MultiLineString":
+        geometry["coordinates"] = [
+            smooth_coordinates(line, interval, great_circle) for line in geometry.get("coordinates", [])
+        ]
+    return geometry
+
+def smooth_features(features, interval=10, great_circle=True, workers=1):
+    """
+    Smooth the geometries of a list of features in place. With more than one worker,
+    the geometries to smooth are sent to a pool of `workers` processes.
+    """
+    smoothed = [feature for feature in features if (feature.get("geometry") or {}).get("type") in SMOOTHED_TYPES]
+    smooth = partial(smooth_geometry, interval=interval, great_circle=great_circle)
+    if workers <= 1 or len(smoothed) <= 1:
+        for feature in smoothed:
+            smooth(feature["geometry"])
+        return features
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # A few chunks per worker balance uneven line lengths without a round trip per feature
+        chunksize = max(1, len(smoothed) // (workers * 4))
+        geometries = executor.map(smooth, [feature["geometry"] for feature in smoothed], chunksize=chunksize)
+        for feature, geometry in zip(smoothed, geometries):
+            feature["geometry"] = geometry
+    return features
+
+def smooth_feature_stream(features, interval=10, great_circle=True, workers=1):
+    """
+    Smooth an iterable of features lazily, yielding each feature once smoothed and in
+    order. With more than one worker, at most two features per worker are in flight
+    in the process pool, so memory stays bounded however many features there are.
+    """
+    smooth = partial(smooth_geometry, interval=interval, great_circle=great_circle)
+    if workers <= 1:
+        for feature in features:
+            smooth(feature.get("geometry"))
+            yield feature
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for feature in features:
+            if (feature.get("geometry") or {}).get("type") in SMOOTHED_TYPES:
+                # Released while in flight, the key stays so the feature keeps its key order
+                geometry, feature["geometry"] = feature["geometry"], None
+                pending.append((feature, executor.submit(smooth, geometry)))
+            else:
+                pending.append((feature, None))
+            while len(pending) > 2 * workers or (pending and pending[0][1] is None):
+                yield _finish(*pending.popleft())
+        while pending:
+            yield _finish(*pending.popleft())
+
+def _finish(feature, future):
+    if future is not None:
+        feature["geometry"] = future.result()
+    return feature
 
 def main():
     parser = argparse.ArgumentParser(
-        description='Smooth (densify) LineString coordinates in a GeoJSON file using sklearn haversine_distances.'
+        description='Smooth (densify) LineString and MultiLineString coordinates in a GeoJSON file using haversine distances.'
     )
     parser.add_argument(
         'input_geojson',
@@ -68,36 +182,76 @@ def main():
         default=10,
         help='Interval in meters for densification (default: 10)'
     )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='Worker processes smoothing features in parallel, 0 for one per CPU (default: 1)'
+    )
+    parser.add_argument(
+        '--linear',
+        action='store_true',
+        help='Interpolate linearly in degrees instead of along the great circle'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Parse, smooth and write features one at a time instead of loading the whole file'
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='Write the output without indentation or whitespace'
+    )
 
     args = parser.parse_args()
 
+    workers = args.workers or os.cpu_count() or 1
+    indent = None if args.compact else 4
+
+    if args.stream:
+        # Read, smooth and write the features one at a time
+        members = {}
+        features = smooth_feature_stream(
+            iter_geojson_features(args.input_geojson, members),
+            interval=args.interval,
+            great_circle=not args.linear,
+            workers=workers
+        )
+        if args.output == '-':
+            write_feature_collection(sys.stdout, features, members, indent=indent)
+            print()
+        else:
+            with open(args.output, 'w') as out_file:
+                write_feature_collection(out_file, features, members, indent=indent)
+        return
+
     # ---------------------------
     # 1) Read the input GeoJSON
     # ---------------------------
     geojson_data = read_geojson(args.input_geojson)
 
-    # -----------------------------
-    # 2) Smooth the LineString(s)
-    # -----------------------------
-    for feature in geojson_data.get("features", []):
-        geometry = feature.get("geometry", {})
-        if geometry.get("type") == "LineString":
-            original_coords = geometry.get("coordinates", [])
-            geometry["coordinates"] = smooth_coordinates(
-                original_coords,
-                interval=args.interval
-            )
+    # ------------------------------------------------
+    # 2) Smooth the LineString(s) and MultiLineString(s)
+    # ------------------------------------------------
+    smooth_features(
+        geojson_data.get("features", []),
+        interval=args.interval,
+        great_circle=not args.linear,
+        workers=workers
+    )
 
     # ---------------------------
     # 3) Write out the results
     # ---------------------------
+    separators = (',', ':') if args.compact else None
     if args.output == '-':
         # Print to standard output
-        print(json.dumps(geojson_data, indent=4))
+        print(json.dumps(geojson_data, indent=indent, separators=separators))
     else:
         # Write to file
         with open(args.output, 'w') as out_file:
-            json.dump(geojson_data, out_file, indent=4)
+            json.dump(geojson_data, out_file, indent=indent, separators=separators)
 
 if __name__ == '__main__':
     main()
@@ -1,26 +1,31 @@
 """
 This script converts a GeoJSON file containing LineString geometries into CSV format.
 For each LineString feature in the GeoJSON, it extracts the coordinates, computes the
-distance between consecutive points using the haversine formula (via the haversine_sklearn function),
+distance between consecutive points using the haversine formula (vectorized over the whole LineString),
 and writes out a CSV file with the following columns:
     - lat: Latitude of the point.
     - long: Longitude of the point.
     - dist: Distance in meters from the previous point (the first point in each LineString has a distance of 0).
 
 Usage:
-    python geojson_to_csv.py input_geojson_file.geojson -o output_csv_file.csv
+    python geojson_to_csv.py input_geojson_file.geojson -o output_csv_file.csv [--stream]
 
 Example:
     python geojson_to_csv.py sample.geojson -o output.csv
 
 If the output file is set to '-' (the default), the CSV data is written to stdout.
+
+With --stream, features are parsed one at a time as the file is read and their rows are
+written as they come, so memory stays bounded by the largest feature instead of the file.
 """
 
 import argparse
 import csv
 import sys
 
-from common_utils import haversine_sklearn, read_geojson
+import numpy as np
+
+from common_utils import consecutive_distances, iter_geojson_features, read_geojson
 
 
 def geojson_to_csv_rows(geojson_data):
@@ -30,9 +35,16 @@ def geojson_to_csv_rows(geojson_data):
     If there are multiple LineString features, each is handled
     independently. The first point in each LineString has dist=0.
     """
-    features = geojson_data.get("features", [])
+    return features_to_csv_rows(geojson_data.get("features", []))
+
+
+def features_to_csv_rows(features):
+    """
+    Yield rows of (lat, long, dist) of an iterable of GeoJSON features, as
+    geojson_to_csv_rows() does for a whole FeatureCollection.
+    """
     for feature in features:
-        geometry = feature.get("geometry", {})
+        geometry = feature.get("geometry") or {}
         if geometry.get("type") == "LineString":
             coordinates = geometry.get("coordinates", [])
             if not coordinates:
@@ -40,18 +52,11 @@ def geojson_to_csv_rows(geojson_data):
 
             # Coordinates are [longitude, latitude].
             # We'll produce rows in the format: lat, long, dist
-            prev_lat = None
-            prev_lon = None
-
-            for i, (lon, lat) in enumerate(coordinates):
-                if i == 0:
-                    dist = 0
-                else:
-                    dist = haversine_sklearn(prev_lon, prev_lat, lon, lat)
+            # All distances of the line are computed in one vectorized call
+            distances = [0] + np.rint(consecutive_distances(coordinates)).astype(np.int64).tolist()
 
-                yield (lat, lon, round(dist))
-                prev_lat = lat
-                prev_lon = lon
+            for (lon, lat, *_), dist in zip(coordinates, distances):
+                yield (lat, lon, dist)
 
 
 def main():
@@ -65,10 +70,18 @@ def main():
         default="-",
         help="Path to the output CSV file (default: stdout)",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Parse and convert features one at a time instead of loading the whole file",
+    )
     args = parser.parse_args()
 
-    # Use the common_utils function to read the GeoJSON
-    geojson_data = read_geojson(args.input_geojson)
+    # Use the common_utils functions to read the GeoJSON, whole or feature by feature
+    if args.stream:
+        rows = features_to_csv_rows(iter_geojson_features(args.input_geojson))
+    else:
+        rows = geojson_to_csv_rows(read_geojson(args.input_geojson))
 
     # Decide where to write CSV data
     if args.output_csv == "-":
@@ -82,7 +95,7 @@ def main():
     writer.writerow(["lat", "long", "dist"])
 
     # Write rows
-    for lat, lon, dist in geojson_to_csv_rows(geojson_data):
+    for lat, lon, dist in rows:
         writer.writerow([lat, lon, dist])
 
     if args.output_csv != "-":
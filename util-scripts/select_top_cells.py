@@ -4,18 +4,22 @@ to a set of geographical coordinates extracted from a GeoJSON file. It calculate
 using the Haversine formula (which computes the great-circle distance between two points on the Earth)
 and then selects the top N (default: 20) closest cells. The resulting cells are saved to an output JSON file.
 
+The distances are answered by a spatial index over the cell locations (see spatial_index.py):
+one batched k-nearest query for all route points instead of one distance call per (cell, point) pair.
+
 Usage:
-    python find_nearest_cells.py <cells_data_path> <geolocation_path> [--output OUTPUT]
+    python select_top_cells.py <cells_data_path> <geolocation_path> [--output OUTPUT] [--top-n N]
 
 Example:
-    python find_nearest_cells.py data/cells_data.json data/geolocation.json --output results.json
+    python select_top_cells.py data/cells_data.json data/geolocation.json --output results.json
 """
 
 import json
 from pathlib import Path
 
 import numpy as np
-from sklearn.metrics.pairwise import haversine_distances
+
+from spatial_index import SpatialIndex
 
 
 def load_json(file_path):
@@ -24,38 +28,34 @@ def load_json(file_path):
 
 
 def find_nearest_cells(cells_data, geolocation_data, top_n=20):
-    results = []
-    for cell in cells_data.get("cells", []):
-        distances = []
-        print("cell", cell)
-        lat = cell.get("lat", None)
-        lon = cell.get("lon", None)
-        if (lat or lon) is None:
+    """
+    Select the top_n cells closest to a route.
+
+    Args:
+        cells_data: Object with a "cells" list, each cell having "lat" and "lon".
+        geolocation_data: Route coordinates, a list of [lon, lat].
+        top_n: Number of cells to return.
+
+    Returns:
+        list: The selected cells, closest to the route first.
+    """
+    cells = cells_data.get("cells", [])
+    for cell in cells:
+        if cell.get("lat") is None or cell.get("lon") is None:
             print("Invalid Cell Data", json.dumps(cell, indent=4))
-            continue
-        cell_coords = np.radians([[lat, lon]])
-
-        for geo_point in geolocation_data:
-            geo_point = list(reversed(geo_point))
-            geo_coords = np.radians([geo_point])
-            distance = (
-                haversine_distances(cell_coords, geo_coords)[0][0] * 6371
-            )  # Convert to km
-
-            distances.append(
-                {"cell": cell, "geo_point": geo_point, "distance": distance}
-            )
-
-        # Sort by distance and pick top N closest points
-        cell_with_distance = sorted(distances, key=lambda x: x["distance"])[0]
-        results.append(cell_with_distance)
-    nearest_cells = sorted(results, key=lambda x: x["distance"])[:top_n]
-    nearest_cells = [data.get("cell") for data in nearest_cells]
-    print(json.dumps(nearest_cells))
+    if not geolocation_data or not any(cell.get("lat") is not None and cell.get("lon") is not None for cell in cells):
+        return []
+
+    # Distance of every cell to its closest route point, in one batched query
+    index, located_cells = SpatialIndex.from_cells(cells)
+    distances = index.min_distances(geolocation_data, k=top_n)
+    order = np.argsort(distances, kind="stable")[:top_n]
+    nearest_cells = [located_cells[i] for i in order if np.isfinite(distances[i])]
+    print(f"Selected {len(nearest_cells)} of {len(located_cells)} cells")
     return nearest_cells
 
 
-def main(cells_data_path, geolocation_path, output_path):
+def main(cells_data_path, geolocation_path, output_path, top_n=20):
     cells_data = load_json(cells_data_path)
     geolocation_data = load_json(geolocation_path)
     coordinates = (
@@ -63,7 +63,7 @@ def main(cells_data_path, geolocation_path, output_path):
         .get("geometry", {})
         .get("coordinates", [])
     )
-    nearest_cells = find_nearest_cells(cells_data, coordinates)
+    nearest_cells = find_nearest_cells(cells_data, coordinates, top_n=top_n)
 
     # Output the results
     output_path = Path(output_path)
@@ -87,6 +87,12 @@ if __name__ == "__main__":
         default="nearest_cells_output.json",
         help="Path to output JSON file (default: nearest_cells_output.json)"
     )
+    parser.add_argument(
+        "--top-n",
+        type=int,
+        default=20,
+        help="Number of cells to select (default: 20)"
+    )
 
     args = parser.parse_args()
-    main(args.cells_data_path, args.geolocation_path, args.output)
+    main(args.cells_data_path, args.geolocation_path, args.output, top_n=args.top_n)